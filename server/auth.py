@@ -2,7 +2,7 @@
 Authentication and authorization for Civitas
 """
 import os
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Iterable
 from fastapi import HTTPException, status, Depends, Header
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
@@ -115,26 +115,44 @@ def get_user_id_hash(current_user: Dict[str, Any] = Depends(get_current_user)) -
     """Get current user's national ID hash"""
     return current_user["national_id_hash"]
 
-def can_reveal_pii(user_id: int, current_user: Dict[str, Any] = Depends(get_current_user)) -> bool:
-    """Check if current user can reveal PII for given user_id"""
+def can_reveal_pii(
+    user_id: int,
+    current_user: Dict[str, Any] = Depends(get_current_user),
+    db: Optional[Any] = None,
+    allocated: Optional[bool] = None
+) -> bool:
+    """
+    Check if current user can reveal PII for given user_id.
+
+    Pass allocated when the caller already knows whether the civilian has an
+    active allocation; otherwise the cached allocation state is used.
+    """
+    if allocated is not None and current_user.get("role") == "authority":
+        return allocated
+    return reveal_map([user_id], current_user, db=db)[user_id]
+
+def reveal_map(
+    user_ids: Iterable[int],
+    current_user: Dict[str, Any],
+    db: Optional[Any] = None
+) -> Dict[int, bool]:
+    """
+    Whether the current user can reveal PII, for each of user_ids.
+
+    Allocation state comes from the in-memory allocation set, so a whole page
+    is decided with no queries (db is only used for the first load).
+    """
+    user_ids = list(user_ids)
+
     # Authorities can reveal PII only after allocation
     if current_user.get("role") == "authority":
-        # Check if user is allocated (has an active allocation)
-        from db import get_db_session
-        from models import Allocation
-        
-        with get_db_session() as db:
-            allocation = db.query(Allocation).filter(
-                Allocation.user_id == user_id,
-                Allocation.status == "active"
-            ).first()
-            return allocation is not None
-    
+        from services.allocation_state import allocation_state
+        allocated = allocation_state.allocated_among(user_ids, db=db)
+        return {user_id: user_id in allocated for user_id in user_ids}
+
     # Users can see their own PII
-    if current_user.get("national_id_hash") == f"hash_civilian{user_id}":
-        return True
-    
-    return False
+    own_hash = current_user.get("national_id_hash")
+    return {user_id: own_hash == f"hash_civilian{user_id}" for user_id in user_ids}
 
 def log_audit_action(
     actor: str,
@@ -0,0 +1,78 @@
+"""
+Benchmark audit hash-chain verification throughput.
+
+Run from the server directory:
+    python -m benchmarks.bench_audit_verify [events]
+"""
+import os
+import sys
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from db import AuditBase
+from services.audit_chain import AuditChain
+
+ACTIONS = [("read", "user_pii"), ("advanced_search", "search"), ("allocate", "allocation"), ("create_request", "request")]
+
+def synthetic_events(count: int, start: datetime, seed: int = 5):
+    rng = random.Random(seed)
+    for index in range(count):
+        action, entity = rng.choice(ACTIONS)
+        yield {
+            "actor": f"hash_authority{rng.randrange(200)}",
+            "action": action,
+            "entity": entity,
+            "entity_id": rng.randrange(100000),
+            "ts": start + timedelta(seconds=index * 3),
+            "details_json": {"pii_revealed": rng.random() < 0.1, "result_count": rng.randrange(100)}
+        }
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    start = datetime(2024, 1, 1)
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'audit.db')}")
+        AuditBase.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+        chain = AuditChain()
+
+        began = time.perf_counter()
+        batch = []
+        for event in synthetic_events(count, start):
+            batch.append(event)
+            if len(batch) == 1000:
+                chain.append(db, batch)
+                db.commit()
+                batch = []
+        if batch:
+            chain.append(db, batch)
+            db.commit()
+        append_seconds = time.perf_counter() - began
+        print(f"append  {count:>9} events: {append_seconds:7.2f} s ({count / append_seconds:,.0f} events/s)")
+
+        result = chain.verify(db)
+        assert result["ok"], result
+        rate = result["records_per_second"]
+        print(f"verify  {result['records']:>9} events: {result['seconds']:7.2f} s ({rate:,} events/s, "
+              f"{result['checkpoints']} checkpoints)")
+        for target in (10_000_000, 50_000_000):
+            print(f"        projected for {target:>11,} events: {target / rate / 60:6.1f} min")
+
+        day = start + timedelta(seconds=count * 3 // 2)
+        result = chain.verify_time_range(db, since=day, until=day + timedelta(days=1))
+        assert result["ok"], result
+        print(f"verify one day ({result['records']} events, whole blocks): {result['seconds'] * 1000:7.1f} ms")
+
+        last_id = count // 2
+        began = time.perf_counter()
+        proof = chain.inclusion_proof(db, last_id)
+        print(f"inclusion proof for one event: {len(proof['proof'])} hashes, {(time.perf_counter() - began) * 1000:.1f} ms")
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Benchmark query-relevant scoring of a search candidate set.
+
+Run from the server directory:
+    python -m benchmarks.bench_scoring
+"""
+import random
+import time
+
+from services.tagger import tagger
+from benchmarks.legacy_scoring import legacy_query_relevant_score
+
+SKILLS = ["Drone Piloting", "First Aid", "Welding", "Electrical Work", "Cybersecurity",
+          "Truck Driving", "Radio Operation", "Nursing", "Carpentry", "Logistics"]
+WORDS = ("experienced certified paramedic drone pilot electrician mechanic generator "
+         "radio operator military veteran logistics coordinator nurse software security "
+         "welding construction kuljettaja sähkö lääkäri").split()
+
+def synthetic_profiles(count: int, seed: int = 3):
+    rng = random.Random(seed)
+    categories = list(tagger.rules["categories"])
+    return [
+        {
+            "education_level": rng.choice(list(tagger.rules["education_scores"])),
+            "skills": rng.sample(SKILLS, 3),
+            "free_text": " ".join(rng.choices(WORDS, k=40)),
+            "availability": rng.choice(["available", "immediate", "24h"]),
+            "industry": rng.choice(list(tagger.rules["industries"])),
+            "tags": rng.sample(categories, 3),
+        }
+        for _ in range(count)
+    ]
+
+def main():
+    query = {"search_query": "drone medical", "skills_query": ["drone", "first aid"], "include_tags": ["medical"]}
+    for count in (1000, 10000, 50000):
+        profiles = synthetic_profiles(count)
+
+        start = time.perf_counter()
+        batch = tagger.score_batch(profiles, **query)
+        batch_ms = (time.perf_counter() - start) * 1000
+
+        sample = profiles[:1000]
+        start = time.perf_counter()
+        single = [legacy_query_relevant_score(tagger.rules, profile, **query) for profile in sample]
+        per_row_ms = (time.perf_counter() - start) * 1000 * count / len(sample)
+
+        assert list(batch[:len(sample)]) == single
+        print(f"{count:>6} candidates: score_batch {batch_ms:8.1f} ms, per-row (pre-batch) scorer ~{per_row_ms:8.1f} ms")
+
+if __name__ == "__main__":
+    main()
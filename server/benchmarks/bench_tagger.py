@@ -0,0 +1,70 @@
+"""
+Benchmark per-profile tagging cost as the rules keyword list grows.
+
+Run from the server directory:
+    python -m benchmarks.bench_tagger
+"""
+import random
+import string
+import time
+
+from services.tagger import TaggerService
+
+PROFILE_TEXT = (
+    "Experienced paramedic and former military communications officer. "
+    "Certified drone pilot with FPV and long range UAV experience, maintains "
+    "diesel generators and does electrical work on solar battery systems."
+)
+
+def synthetic_rules(base_rules, keyword_count: int, seed: int = 1):
+    """Copy the real rules and pad every category with random keywords"""
+    rng = random.Random(seed)
+    rules = {**base_rules, "categories": {}}
+    categories = base_rules["categories"]
+    per_language = max(1, keyword_count // (2 * len(categories)))
+    for category, config in categories.items():
+        keywords = {}
+        for language in ("en", "fi"):
+            padding = [
+                "".join(rng.choices(string.ascii_lowercase, k=rng.randint(5, 12)))
+                for _ in range(per_language)
+            ]
+            keywords[language] = list(config["keywords"].get(language, [])) + padding
+        rules["categories"][category] = {**config, "keywords": keywords}
+    return rules
+
+def naive_category_scan(rules, text: str):
+    """The previous implementation: one substring test per keyword"""
+    matches = {}
+    for category, config in rules["categories"].items():
+        for language in ("en", "fi"):
+            for keyword in config["keywords"].get(language, []):
+                if keyword.lower() in text:
+                    matches[category] = matches.get(category, 0) + config["weight"] * 10
+    return matches
+
+def time_per_call(fn, repeat: int = 200) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+def main():
+    tagger = TaggerService()
+    tagger.llm_tagger = None
+    base_rules = tagger.rules
+    text = PROFILE_TEXT.lower()
+
+    print(f"{'keywords':>9} {'naive us':>10} {'matcher us':>11} {'tagging us':>11}")
+    for keyword_count in (250, 1000, 4000, 16000):
+        tagger.rules = synthetic_rules(base_rules, keyword_count)
+        tagger._compile_rules()
+        naive = time_per_call(lambda: naive_category_scan(tagger.rules, text))
+        matcher = time_per_call(lambda: tagger._keyword_matcher.find(text))
+        tagging = time_per_call(lambda: tagger.generate_tags_and_score(
+            "masters", ["Drone Piloting", "Electrical Work"], PROFILE_TEXT, "available"
+        ))
+        print(f"{len(tagger._keyword_matcher):>9} {naive:>10.1f} {matcher:>11.1f} {tagging:>11.1f}")
+
+if __name__ == "__main__":
+    main()
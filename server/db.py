@@ -2,11 +2,14 @@
 Database configuration and session management
 """
 import os
-from sqlalchemy import create_engine, text
+import logging
+from sqlalchemy import create_engine, inspect, insert, select, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 from contextlib import contextmanager
 
+logger = logging.getLogger(__name__)
+
 # Database URL from environment
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./kokonaisturva.db")
 
@@ -23,6 +26,30 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 # Create base class for models
 Base = declarative_base()
 
+def _default_audit_database_url(database_url: str) -> str:
+    """Audit log file next to the main SQLite file (kokonaisturva.db -> kokonaisturva_audit.db)"""
+    prefix = "sqlite:///"
+    if not database_url.startswith(prefix) or database_url in (prefix, prefix + ":memory:"):
+        return database_url
+    path = database_url[len(prefix):]
+    stem, extension = os.path.splitext(path)
+    return f"{prefix}{stem}_audit{extension or '.db'}"
+
+# Audit log database: append-only and the fastest-growing data, so it is kept
+# out of the main file where it would bloat the pages of the hot tables
+AUDIT_DATABASE_URL = os.getenv("AUDIT_DATABASE_URL", _default_audit_database_url(DATABASE_URL))
+
+audit_engine = create_engine(
+    AUDIT_DATABASE_URL,
+    connect_args={"check_same_thread": False} if "sqlite" in AUDIT_DATABASE_URL else {},
+    echo=False
+) if AUDIT_DATABASE_URL != DATABASE_URL else engine
+
+AuditSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=audit_engine)
+
+# Base class for models stored in the audit database
+AuditBase = declarative_base()
+
 def create_tables():
     """Create all database tables"""
     # Enable WAL mode for SQLite
@@ -35,10 +62,18 @@ def create_tables():
             conn.execute(text("PRAGMA temp_store=MEMORY"))
     
     # Import all models to ensure they're registered
-    from models import User, Profile, Resource, Request, Allocation, AuditLog
+    from models import User, Profile, Resource, Request, Allocation, StatsAggregate
     
     # Create tables
     Base.metadata.create_all(bind=engine)
+    create_audit_tables()
+    
+    # Add columns introduced after a database was first created
+    add_missing_columns("profiles", {"features_json": "JSON"})
+    
+    # Full-text index over profile text (SQLite FTS5)
+    if "sqlite" in DATABASE_URL:
+        create_fulltext_index()
     
     # Create indexes
     with engine.connect() as conn:
@@ -67,6 +102,207 @@ def create_tables():
             CREATE INDEX IF NOT EXISTS idx_allocation_status 
             ON allocations(status)
         """))
+        
+        # Active-allocation lookups per civilian
+        conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS idx_allocation_user_status
+            ON allocations(user_id, status)
+        """))
+
+# Triggers keeping profiles_fts in sync with profiles
+FULLTEXT_TRIGGERS = {
+    "profiles_fts_insert": """
+        CREATE TRIGGER profiles_fts_insert AFTER INSERT ON profiles BEGIN
+            INSERT INTO profiles_fts(rowid, free_text, skills, education_level)
+            VALUES (new.id, new.free_text, new.skills, new.education_level);
+        END
+    """,
+    "profiles_fts_delete": """
+        CREATE TRIGGER profiles_fts_delete AFTER DELETE ON profiles BEGIN
+            INSERT INTO profiles_fts(profiles_fts, rowid, free_text, skills, education_level)
+            VALUES ('delete', old.id, old.free_text, old.skills, old.education_level);
+        END
+    """,
+    "profiles_fts_update": """
+        CREATE TRIGGER profiles_fts_update AFTER UPDATE OF free_text, skills, education_level ON profiles BEGIN
+            INSERT INTO profiles_fts(profiles_fts, rowid, free_text, skills, education_level)
+            VALUES ('delete', old.id, old.free_text, old.skills, old.education_level);
+            INSERT INTO profiles_fts(rowid, free_text, skills, education_level)
+            VALUES (new.id, new.free_text, new.skills, new.education_level);
+        END
+    """
+}
+
+def create_fulltext_index(bind=None):
+    """
+    Create the FTS5 index over profile text and the triggers keeping it in sync.
+
+    Missing pieces are recreated individually: recreating the profiles table
+    drops its triggers but leaves profiles_fts behind. Whenever the table or a
+    trigger had to be created the index is rebuilt from profiles, since writes
+    made while a trigger was missing never reached it.
+    """
+    with (bind or engine).begin() as conn:
+        existing = {
+            name for name, in conn.execute(text(
+                "SELECT name FROM sqlite_master "
+                "WHERE (type = 'table' AND name = 'profiles_fts') OR (type = 'trigger' AND tbl_name = 'profiles')"
+            ))
+        }
+        created = False
+        
+        if "profiles_fts" not in existing:
+            # unicode61 without diacritic folding keeps Finnish ä/ö/å distinct from a/o;
+            # prefix indexes make "term*" queries cheap
+            conn.execute(text("""
+                CREATE VIRTUAL TABLE profiles_fts USING fts5(
+                    free_text, skills, education_level,
+                    content='profiles', content_rowid='id',
+                    tokenize="unicode61 remove_diacritics 0 tokenchars '-'",
+                    prefix='2 3 4'
+                )
+            """))
+            created = True
+        for name, statement in FULLTEXT_TRIGGERS.items():
+            if name not in existing:
+                conn.execute(text(statement))
+                created = True
+        
+        if created:
+            conn.execute(text("INSERT INTO profiles_fts(profiles_fts) VALUES ('rebuild')"))
+
+def create_audit_tables():
+    """
+    Create the audit database, make its tables append-only, move any audit rows
+    left in the main database and hash-chain rows that predate the chain.
+    """
+    if "sqlite" in AUDIT_DATABASE_URL:
+        with audit_engine.connect() as conn:
+            conn.execute(text("PRAGMA journal_mode=WAL"))
+            conn.execute(text("PRAGMA synchronous=NORMAL"))
+    
+    from models import AuditLog, AuditCheckpoint
+    
+    AuditBase.metadata.create_all(bind=audit_engine)
+    add_missing_columns("audit_logs", {"prev_hash": "VARCHAR(64)", "hash": "VARCHAR(64)"}, bind=audit_engine)
+    
+    if "sqlite" in AUDIT_DATABASE_URL:
+        create_audit_triggers()
+    
+    if audit_engine is not engine:
+        migrate_audit_logs()
+    
+    from services.audit_chain import audit_chain
+    with get_audit_session() as audit_db:
+        audit_chain.backfill(audit_db)
+
+def create_audit_triggers(bind=None):
+    """Make the audit tables append-only (SQLite triggers)"""
+    with (bind or audit_engine).begin() as conn:
+        # Rows not yet hash-chained may only have their hashes set; nothing else may change
+        conn.execute(text("DROP TRIGGER IF EXISTS audit_logs_no_update"))
+        conn.execute(text("""
+            CREATE TRIGGER audit_logs_no_update
+            BEFORE UPDATE ON audit_logs WHEN old.hash IS NOT NULL
+                OR new.id IS NOT old.id
+                OR new.actor IS NOT old.actor
+                OR new.action IS NOT old.action
+                OR new.entity IS NOT old.entity
+                OR new.entity_id IS NOT old.entity_id
+                OR new.ts IS NOT old.ts
+                OR new.details_json IS NOT old.details_json
+            BEGIN
+                SELECT RAISE(ABORT, 'audit_logs is append-only');
+            END
+        """))
+        for table in ("audit_logs", "audit_checkpoints"):
+            conn.execute(text(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_no_delete
+                BEFORE DELETE ON {table} BEGIN
+                    SELECT RAISE(ABORT, '{table} is append-only');
+                END
+            """))
+        conn.execute(text("""
+            CREATE TRIGGER IF NOT EXISTS audit_checkpoints_no_update
+            BEFORE UPDATE ON audit_checkpoints BEGIN
+                SELECT RAISE(ABORT, 'audit_checkpoints is append-only');
+            END
+        """))
+
+def migrate_audit_logs(batch_size: int = 5000, source_bind=None, target_bind=None):
+    """
+    Move audit_logs rows from the main database into the audit database.
+
+    Rows keep their ids. A row whose id is already taken by the same event (a
+    copy from an interrupted earlier run, equal in every column) is skipped,
+    and one taken by another event is appended with a new id, so every event
+    ends up there exactly once. The old table is dropped only after the copy
+    has been committed.
+    """
+    from models import AuditLog
+    
+    source_bind = source_bind or engine
+    target_bind = target_bind or audit_engine
+    with source_bind.connect() as source:
+        if not inspect(source).has_table("audit_logs"):
+            return
+        source_columns = {column["name"] for column in inspect(source).get_columns("audit_logs")}
+    
+    table = AuditLog.__table__
+    # The old table predates columns added to the audit database since
+    columns = [column.name for column in table.columns if column.name in source_columns]
+    # Hashes are assigned in the audit database, so they are not part of an event's identity
+    event_columns = [name for name in columns if name not in ("id", "prev_hash", "hash")]
+    copied = 0
+    with source_bind.connect() as source, target_bind.begin() as target:
+        last_id = 0
+        while True:
+            rows = source.execute(
+                select(*(table.c[name] for name in columns))
+                .where(table.c.id > last_id).order_by(table.c.id).limit(batch_size)
+            ).mappings().all()
+            if not rows:
+                break
+            last_id = rows[-1]["id"]
+            existing = {
+                row["id"]: tuple(row[name] for name in event_columns)
+                for row in target.execute(
+                    select(table.c.id, *(table.c[name] for name in event_columns))
+                    .where(table.c.id.in_([row["id"] for row in rows]))
+                ).mappings()
+            }
+            keep_id = [dict(row) for row in rows if row["id"] not in existing]
+            new_id = [
+                {name: row[name] for name in columns if name != "id"}
+                for row in rows
+                if row["id"] in existing and existing[row["id"]] != tuple(row[name] for name in event_columns)
+            ]
+            if keep_id:
+                target.execute(insert(table), keep_id)
+            if new_id:
+                target.execute(insert(table), new_id)
+            copied += len(keep_id) + len(new_id)
+    
+    with source_bind.begin() as conn:
+        conn.execute(text("DROP TABLE audit_logs"))
+    logger.info(f"Moved {copied} audit log rows to {AUDIT_DATABASE_URL}")
+
+def add_missing_columns(table: str, columns: dict, bind=None):
+    """Add nullable columns missing from an existing table (create_all never alters tables)"""
+    bind = bind if bind is not None else engine
+    with bind.begin() as conn:
+        if bind.dialect.name == "sqlite":
+            existing = {row[1] for row in conn.execute(text(f"PRAGMA table_info({table})"))}
+        else:
+            existing = {
+                row[0] for row in conn.execute(
+                    text("SELECT column_name FROM information_schema.columns WHERE table_name = :table"),
+                    {"table": table}
+                )
+            }
+        for name, column_type in columns.items():
+            if name not in existing:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}"))
 
 def get_db() -> Session:
     """Get database session"""
@@ -88,3 +324,16 @@ def get_db_session():
         raise
     finally:
         db.close()
+
+@contextmanager
+def get_audit_session():
+    """Context manager for audit database sessions"""
+    db = AuditSessionLocal()
+    try:
+        yield db
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
@@ -35,6 +35,8 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     logger.info("Shutting down Civitas")
+    from services.audit import audit
+    audit.flush()
 
 # Create FastAPI app
 app = FastAPI(
@@ -1,11 +1,11 @@
 """
 Database models for Civitas
 """
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text, JSON, ForeignKey, Boolean, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Float, DateTime, Text, JSON, ForeignKey, Boolean, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from sqlalchemy import func as sql_func
-from db import Base
+from db import Base, AuditBase
 
 class User(Base):
     """User model - stores PII that's only revealed after allocation"""
@@ -40,6 +40,7 @@ class Profile(Base):
     capability_score = Column(Float, default=0.0)
     tags_json = Column(JSON, nullable=True)  # Derived tags from rules
     skill_levels = Column(JSON, nullable=True)  # Skill level matrix data
+    features_json = Column(JSON, nullable=True)  # Derived text/keyword features, tied to rules version
     last_updated = Column(DateTime, default=func.now(), onupdate=func.now())
     status = Column(String(50), default="available")  # available/requested/allocated/unavailable
     
@@ -95,8 +96,8 @@ class Allocation(Base):
     user = relationship("User", back_populates="allocations")
     resource = relationship("Resource", back_populates="allocations")
 
-class AuditLog(Base):
-    """Audit log - tracks all actions touching PII or state changes"""
+class AuditLog(AuditBase):
+    """Audit log - tracks all actions touching PII or state changes (append-only, in the audit database)"""
     __tablename__ = "audit_logs"
     
     id = Column(Integer, primary_key=True, index=True)
@@ -106,12 +107,31 @@ class AuditLog(Base):
     entity_id = Column(Integer, nullable=False)
     ts = Column(DateTime, default=func.now())
     details_json = Column(JSON, nullable=True)  # Additional context
+    prev_hash = Column(String(64), nullable=True)  # Hash of the previous record (hash chain)
+    hash = Column(String(64), nullable=True)  # SHA-256 over prev_hash and this record
     
-    # Index for time-based queries
+    # Indexes for time-ranged investigations by time, actor and entity
     __table_args__ = (
+        Index("idx_audit_ts", "ts"),
+        Index("idx_audit_actor_ts", "actor", "ts"),
+        Index("idx_audit_entity_ts", "entity", "entity_id", "ts"),
         {"sqlite_autoincrement": True},
     )
 
+class AuditCheckpoint(AuditBase):
+    """Merkle checkpoint over a block of consecutive audit records, chained to the previous checkpoint"""
+    __tablename__ = "audit_checkpoints"
+    
+    id = Column(Integer, primary_key=True)
+    first_id = Column(Integer, nullable=False)  # First audit_logs id in the block
+    last_id = Column(Integer, nullable=False, unique=True)  # Last audit_logs id in the block
+    event_count = Column(Integer, nullable=False)
+    merkle_root = Column(String(64), nullable=False)  # Root over the block's record hashes
+    chain_hash = Column(String(64), nullable=False)  # Record hash at last_id
+    prev_checkpoint_hash = Column(String(64), nullable=False)
+    checkpoint_hash = Column(String(64), nullable=False)  # SHA-256 over the fields above
+    created_at = Column(DateTime, default=func.now())
+
 class Skill(Base):
     """Skill model - canonical skills with aliases"""
     __tablename__ = "skills"
@@ -126,3 +146,18 @@ class Skill(Base):
     __table_args__ = (
         {"sqlite_autoincrement": True},
     )
+
+class StatsAggregate(Base):
+    """Materialised dashboard aggregates, kept current by applying deltas on every write"""
+    __tablename__ = "stats_aggregates"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    dimension = Column(String(50), nullable=False)  # total/status/availability/education/tag/cell/meta
+    key = Column(String(255), nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+    score_sum = Column(Float, nullable=False, default=0.0)  # Sum of capability scores
+    weight_sum = Column(Float, nullable=False, default=0.0)  # Sum of heatmap weights
+    
+    __table_args__ = (
+        UniqueConstraint("dimension", "key", name="uq_stats_aggregate"),
+    )
@@ -1,15 +1,33 @@
 """
 Admin router - handles data export and seeding
 """
-from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, status, Response
-from sqlalchemy.orm import Session
+import time
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import text
 
-from db import get_db
+from db import get_db, get_audit_session
 from models import User, Profile, Resource, Request, Allocation, AuditLog
-from schemas import ExportResponse, UserResponse, ProfileResponse, RequestResponse, AllocationResponse
+from schemas import ExportResponse, UserResponse, ProfileResponse, RequestResponse, AllocationResponse, AuditQueryResponse, PiiAccessResponse
 from auth import require_authority
+from services.spatial_index import spatial_index
+from services.posting_index import posting_index
+from services.allocation_state import allocation_state
+from services.cache import bump_data_version
+from services.tagger import tagger
+from services.aggregates import aggregates, profile_snapshot
+from services.audit import audit
+from services.audit_chain import audit_chain
+from services.export import (
+    stream_profiles_csv, stream_ndjson, NDJSON_TABLES,
+    PYARROW_AVAILABLE, build_parquet_snapshot, stream_file
+)
 
 router = APIRouter()
 
@@ -20,12 +38,14 @@ async def export_json(
 ):
     """Export all data as JSON"""
     
-    # Get all data
+    # Get all data, including audit events still buffered in the sink
+    await run_in_threadpool(audit.flush)
     users = db.query(User).all()
     profiles = db.query(Profile).all()
     requests = db.query(Request).all()
     allocations = db.query(Allocation).all()
-    audit_logs = db.query(AuditLog).all()
+    with get_audit_session() as audit_db:
+        audit_logs = audit_db.query(AuditLog).all()
     
     # Convert to response format
     user_responses = [UserResponse.model_validate(user) for user in users]
@@ -55,55 +75,300 @@ async def export_json(
         exported_at=datetime.utcnow()
     )
 
+@router.get("/export.ndjson")
+async def export_ndjson(
+    resume_table: Optional[str] = Query(None, description="Table to resume from: " + ", ".join(NDJSON_TABLES)),
+    after_id: int = Query(0, ge=0, description="Resume after this id within resume_table"),
+    since: Optional[datetime] = Query(None, description="Only rows created or changed at or after this time"),
+    gzip: bool = Query(False, description="Compress the stream with gzip"),
+    current_user: dict = Depends(require_authority),
+    db: Session = Depends(get_db)
+):
+    """Export all tables as newline-delimited JSON, streamed in batches"""
+    
+    if resume_table is not None and resume_table not in NDJSON_TABLES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown table '{resume_table}'. Expected one of: {', '.join(NDJSON_TABLES)}"
+        )
+    if after_id and resume_table is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="after_id requires resume_table"
+        )
+    
+    filename = "kokonaisturvallisuus_export.ndjson" + (".gz" if gzip else "")
+    await run_in_threadpool(audit.flush)
+    return StreamingResponse(
+        stream_ndjson(db, resume_table=resume_table, after_id=after_id, since=since, gzip=gzip),
+        media_type="application/gzip" if gzip else "application/x-ndjson",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+@router.get("/audit", response_model=AuditQueryResponse)
+async def query_audit_log(
+    actor: Optional[str] = Query(None),
+    action: Optional[str] = Query(None),
+    entity: Optional[str] = Query(None, description="e.g. user_pii, allocation, request, search"),
+    entity_id: Optional[int] = Query(None),
+    since: Optional[datetime] = Query(None),
+    until: Optional[datetime] = Query(None),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    limit: int = Query(100, ge=1, le=1000),
+    current_user: dict = Depends(require_authority)
+):
+    """Search the audit log, newest events first"""
+    
+    before = None
+    if cursor:
+        try:
+            before_ts, before_id = cursor.rsplit("_", 1)
+            before = (datetime.fromisoformat(before_ts), int(before_id))
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+    
+    events = await run_in_threadpool(
+        audit.query,
+        actor=actor, action=action, entity=entity, entity_id=entity_id,
+        since=since, until=until, before=before, limit=limit
+    )
+    next_cursor = None
+    if len(events) == limit:
+        next_cursor = f"{events[-1]['ts'].isoformat()}_{events[-1]['id']}"
+    return AuditQueryResponse(events=events, next_cursor=next_cursor)
+
+@router.get("/audit/pii/{user_id}", response_model=PiiAccessResponse)
+async def pii_access_report(
+    user_id: int,
+    since: Optional[datetime] = Query(None, description="Defaults to seven days ago"),
+    until: Optional[datetime] = Query(None),
+    current_user: dict = Depends(require_authority)
+):
+    """Who accessed a civilian's PII in a period, per actor"""
+    
+    since = since or datetime.utcnow() - timedelta(days=7)
+    actors = await run_in_threadpool(audit.pii_access_summary, user_id, since=since, until=until)
+    return PiiAccessResponse(user_id=user_id, since=since, until=until, actors=actors)
+
+@router.get("/audit/verify")
+async def verify_audit_log(
+    since: Optional[datetime] = Query(None, description="Verify records logged at or after this time"),
+    until: Optional[datetime] = Query(None, description="Verify records logged before this time"),
+    current_user: dict = Depends(require_authority)
+):
+    """Recompute the audit hash chain and Merkle checkpoints (the whole log unless a time range is given)"""
+    
+    def verify():
+        audit.flush()
+        with get_audit_session() as audit_db:
+            if since is None and until is None:
+                return audit_chain.verify(audit_db)
+            return audit_chain.verify_time_range(audit_db, since=since, until=until)
+    
+    return await run_in_threadpool(verify)
+
+@router.get("/audit/proof/{event_id}")
+async def audit_inclusion_proof(
+    event_id: int,
+    current_user: dict = Depends(require_authority)
+):
+    """Merkle path proving an audit record is covered by its checkpoint"""
+    
+    with get_audit_session() as audit_db:
+        proof = audit_chain.inclusion_proof(audit_db, event_id)
+    if proof is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Audit record not found or not checkpointed yet"
+        )
+    return proof
+
 @router.get("/export.csv")
 async def export_csv(
+    gzip: bool = Query(False, description="Compress the CSV with gzip while streaming"),
+    current_user: dict = Depends(require_authority),
+    db: Session = Depends(get_db)
+):
+    """Export data as CSV, streamed from a database cursor"""
+    
+    filename = "kokonaisturvallisuus_export.csv" + (".gz" if gzip else "")
+    return StreamingResponse(
+        stream_profiles_csv(db, gzip=gzip),
+        media_type="application/gzip" if gzip else "text/csv",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+@router.get("/export.parquet")
+async def export_parquet(
+    current_user: dict = Depends(require_authority),
+    db: Session = Depends(get_db)
+):
+    """Export users, profiles, resources and allocations as a zip of Parquet files (no PII)"""
+    
+    if not PYARROW_AVAILABLE:
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail="Parquet export requires pyarrow (pip install pyarrow)"
+        )
+    
+    # Written to disk in batches so memory stays flat, then streamed back
+    directory = tempfile.mkdtemp(prefix="parquet-export-")
+    try:
+        zip_path = await run_in_threadpool(build_parquet_snapshot, db, directory)
+    except Exception:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+    
+    return StreamingResponse(
+        stream_file(zip_path, directory),
+        media_type="application/zip",
+        headers={"Content-Disposition": "attachment; filename=kokonaisturvallisuus_snapshot.zip"}
+    )
+
+# Profiles read, tagged and committed per step of a retag
+RETAG_BATCH_SIZE = 500
+
+def _load_retag_batch(db: Session, after_user_id: int, limit: int):
+    """Next profiles by user_id (with their users, for aggregate snapshots) and their resources as tagger input"""
+    profiles = db.query(Profile).options(joinedload(Profile.user)).filter(
+        Profile.user_id > after_user_id
+    ).order_by(Profile.user_id).limit(limit).all()
+    resources_by_user = {}
+    if profiles:
+        for resource in db.query(Resource).filter(Resource.user_id.in_([profile.user_id for profile in profiles])):
+            resources_by_user.setdefault(resource.user_id, []).append({
+                "category": resource.category,
+                "subtype": resource.subtype,
+                "quantity": resource.quantity,
+                "specs": resource.specs_json or {}
+            })
+    return profiles, resources_by_user
+
+def _apply_retag_batch(db: Session, profiles, resources_by_user, llm_results) -> int:
+    """
+    Re-tag and re-score one batch and commit it, with the aggregate deltas in the
+    same transaction and the posting index updated after; returns the number of
+    profiles that changed
+    """
+    updated = 0
+    changes = []
+    for profile, llm_tags in zip(profiles, llm_results):
+        features = tagger.build_features(
+            education_level=profile.education_level,
+            skills=profile.skills or [],
+            free_text=profile.free_text or "",
+            resources=resources_by_user.get(profile.user_id, [])
+        )
+        tags, score = tagger.generate_tags_and_score(
+            education_level=profile.education_level,
+            skills=profile.skills or [],
+            free_text=profile.free_text or "",
+            availability=profile.availability,
+            resources=resources_by_user.get(profile.user_id, []),
+            industry=profile.industry,
+            features=features,
+            use_llm=False,
+            llm_tags=llm_tags
+        )
+        if tags != profile.tags_json or score != profile.capability_score:
+            updated += 1
+            before = profile_snapshot(profile.user, profile)
+            profile.tags_json = tags
+            profile.capability_score = score
+            changes.append((before, profile_snapshot(profile.user, profile)))
+        profile.features_json = features
+    aggregates.apply_many(db, changes)
+    db.commit()
+    for profile in profiles:
+        posting_index.update(profile.user_id, profile.tags_json, profile.skills, profile.free_text)
+    db.expunge_all()
+    return updated
+
+@router.post("/retag")
+async def retag_profiles(
+    use_llm: bool = Query(True, description="Extract LLM tags (falls back to regex if the model host is down)"),
+    concurrency: int = Query(4, ge=1, le=32, description="Maximum LLM requests in flight"),
+    batch_size: int = Query(4, ge=1, le=16, description="Profiles packed into one LLM prompt"),
     current_user: dict = Depends(require_authority),
     db: Session = Depends(get_db)
 ):
-    """Export data as CSV"""
-    
-    # Get all profiles with user data
-    results = db.query(User, Profile).join(Profile, User.id == Profile.user_id).all()
-    
-    # Create CSV content
-    csv_content = "user_id,full_name,education_level,availability,capability_score,tags,lat,lon,status\n"
-    
-    for user, profile in results:
-        # Escape CSV values
-        def escape_csv(value):
-            if value is None:
-                return ""
-            value = str(value)
-            if "," in value or '"' in value or "\n" in value:
-                return f'"{value.replace(chr(34), chr(34)+chr(34))}"'
-            return value
+    """
+    Reload rules.yml and re-tag and re-score every profile.
+
+    Profiles are processed RETAG_BATCH_SIZE at a time, each batch committed on
+    its own; database and tagging work runs in the threadpool and LLM calls
+    are awaited, so the event loop keeps serving other requests.
+    """
+    started = time.monotonic()
+    rules_changed = await run_in_threadpool(tagger.reload_rules)
+    use_llm = use_llm and tagger.llm_tagger is not None
+    
+    total = 0
+    updated = 0
+    llm_seconds = 0.0
+    after_user_id = 0
+    while True:
+        profiles, resources_by_user = await run_in_threadpool(_load_retag_batch, db, after_user_id, RETAG_BATCH_SIZE)
+        if not profiles:
+            break
+        after_user_id = profiles[-1].user_id
         
-        tags_str = ",".join(profile.tags_json or [])
+        # LLM tags for the batch in pooled, batched requests
+        llm_results = [None] * len(profiles)
+        if use_llm:
+            llm_started = time.monotonic()
+            items = [
+                (
+                    profile.free_text or "",
+                    {
+                        "education_level": profile.education_level,
+                        "skills": profile.skills or [],
+                        "availability": profile.availability,
+                        "industry": profile.industry
+                    }
+                )
+                for profile in profiles
+            ]
+            llm_results = await tagger.llm_tagger.extract_tags_batch(items, concurrency=concurrency, batch_size=batch_size)
+            llm_seconds += time.monotonic() - llm_started
         
-        csv_content += f"{user.id},{escape_csv(user.full_name)},{escape_csv(profile.education_level)},{escape_csv(profile.availability)},{profile.capability_score},{escape_csv(tags_str)},{user.lat},{user.lon},{escape_csv(profile.status)}\n"
+        updated += await run_in_threadpool(_apply_retag_batch, db, profiles, resources_by_user, llm_results)
+        total += len(profiles)
+        bump_data_version()
     
-    return Response(
-        content=csv_content,
-        media_type="text/csv",
-        headers={"Content-Disposition": "attachment; filename=kokonaisturvallisuus_export.csv"}
-    )
+    return {
+        "profiles": total,
+        "updated": updated,
+        "rules_changed": rules_changed,
+        "rules_version": tagger.rules_version,
+        "llm": tagger.llm_tagger.health_status() if use_llm else None,
+        "llm_seconds": round(llm_seconds, 2),
+        "total_seconds": round(time.monotonic() - started, 2)
+    }
 
 @router.post("/clear")
 async def clear_data(
     current_user: dict = Depends(require_authority),
     db: Session = Depends(get_db)
 ):
-    """Clear all data from the database"""
+    """Clear all data from the database (the append-only audit log is kept)"""
     
     # Clear all tables in correct order (respecting foreign keys)
-    db.query(AuditLog).delete()
     db.query(Allocation).delete()
     db.query(Request).delete()
     db.query(Resource).delete()
     db.query(Profile).delete()
     db.query(User).delete()
+    aggregates.invalidate(db)
     
     db.commit()
+    spatial_index.invalidate()
+    posting_index.invalidate()
+    allocation_state.invalidate()
+    bump_data_version()
     
     return {"detail": "Database cleared successfully"}
 
@@ -143,8 +408,13 @@ async def seed_data(
         for statement in statements:
             if statement.strip():
                 db.execute(text(statement))
+        aggregates.invalidate(db)
         
         db.commit()
+        spatial_index.invalidate()
+        posting_index.invalidate()
+        allocation_state.invalidate()
+        bump_data_version()
         
         return {"message": "Seed data loaded successfully"}
     
@@ -165,15 +435,19 @@ async def clear_data(
     current_user: dict = Depends(require_authority),
     db: Session = Depends(get_db)
 ):
-    """Clear all data (demo purposes only)"""
+    """Clear all data (demo purposes only; the append-only audit log is kept)"""
     
     # Delete in reverse order due to foreign keys
-    db.query(AuditLog).delete()
     db.query(Allocation).delete()
     db.query(Request).delete()
     db.query(Profile).delete()
     db.query(User).delete()
+    aggregates.invalidate(db)
     
     db.commit()
+    spatial_index.invalidate()
+    posting_index.invalidate()
+    allocation_state.invalidate()
+    bump_data_version()
     
     return {"message": "All data cleared successfully"}
@@ -2,13 +2,22 @@
 Allocation router - handles civilian allocation and requests
 """
 from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
 
 from db import get_db
-from models import User, Profile, Request, Allocation
-from schemas import RequestCreateRequest, RequestResponse, AllocateRequest, AllocationResponse
+from models import User, Profile, Resource, Request, Allocation
+from schemas import (
+    RequestCreateRequest, RequestResponse, AllocateRequest, AllocationResponse,
+    BulkAllocateRequest, BulkAllocateResponse, BulkAllocateResult
+)
 from auth import require_authority, get_user_id_hash
 from services.audit import audit
+from services.spatial_index import spatial_index
+from services.cache import bump_data_version
+from services.aggregates import aggregates, profile_snapshot
+from services.allocation_state import allocation_state
 
 router = APIRouter()
 
@@ -41,7 +50,7 @@ async def create_request(
     db.refresh(new_request)
     
     # Log the action
-    audit.log_request(
+    await audit.log_request(
         actor=current_user["national_id_hash"],
         request_id=new_request.id,
         request_type=request.type,
@@ -94,7 +103,6 @@ async def allocate_civilian(
     
     # Verify resource exists if provided
     if allocation.resource_id:
-        from models import Resource
         resource = db.query(Resource).filter(Resource.id == allocation.resource_id).first()
         if not resource:
             raise HTTPException(
@@ -112,14 +120,19 @@ async def allocate_civilian(
     db.add(new_allocation)
     
     # Update profile status and availability
+    before = profile_snapshot(user, profile)
     profile.status = "allocated"
     profile.availability = "allocated"
+    aggregates.apply(db, before, profile_snapshot(user, profile))
     
     db.commit()
     db.refresh(new_allocation)
+    spatial_index.set_status(allocation.user_id, profile.status)
+    allocation_state.mark_allocated([allocation.user_id])
+    bump_data_version()
     
     # Log the allocation
-    audit.log_allocation(
+    await audit.log_allocation(
         actor=current_user["national_id_hash"],
         user_id=allocation.user_id,
         mission_code=allocation.mission_code,
@@ -136,6 +149,108 @@ async def allocate_civilian(
         created_at=new_allocation.created_at if new_allocation.created_at else None
     )
 
+@router.post("/bulk", response_model=BulkAllocateResponse)
+async def allocate_civilians_bulk(
+    allocation: BulkAllocateRequest,
+    current_user: dict = Depends(require_authority),
+    db: Session = Depends(get_db)
+):
+    """
+    Allocate many civilians to one mission.
+
+    Items are validated together with one query per table; the valid ones are
+    applied in a single transaction and the rest reported as failed.
+    """
+    user_ids = {item.user_id for item in allocation.items}
+    resource_ids = {item.resource_id for item in allocation.items if item.resource_id}
+    
+    profiles = {
+        user.id: (user, profile)
+        for user, profile in db.query(User, Profile).outerjoin(
+            Profile, User.id == Profile.user_id
+        ).filter(User.id.in_(user_ids)).all()
+    }
+    existing_resources = {
+        resource_id for resource_id, in db.query(Resource.id).filter(Resource.id.in_(resource_ids)).all()
+    } if resource_ids else set()
+    
+    results = []
+    accepted = []
+    seen = set()
+    for item in allocation.items:
+        user, profile = profiles.get(item.user_id, (None, None))
+        if item.user_id in seen:
+            detail = "Civilian listed more than once"
+        elif not user:
+            detail = "Civilian not found"
+        elif not profile:
+            detail = "Profile not found"
+        elif profile.status == "allocated":
+            detail = "Civilian is already allocated"
+        elif item.resource_id and item.resource_id not in existing_resources:
+            detail = "Resource not found"
+        else:
+            detail = None
+        seen.add(item.user_id)
+        
+        result = BulkAllocateResult(
+            user_id=item.user_id,
+            resource_id=item.resource_id,
+            status="failed" if detail else "allocated",
+            detail=detail
+        )
+        results.append(result)
+        if not detail:
+            accepted.append((result, user, profile))
+    
+    if accepted:
+        changes = []
+        for _, user, profile in accepted:
+            before = profile_snapshot(user, profile)
+            profile.status = "allocated"
+            profile.availability = "allocated"
+            changes.append((before, profile_snapshot(user, profile)))
+        aggregates.apply_many(db, changes)
+        
+        # One multi-row insert for all allocations (through the table: ORM bulk
+        # inserts fall back to a statement per row when ids are returned)
+        allocations_table = Allocation.__table__
+        allocation_ids = dict(db.execute(
+            insert(allocations_table).returning(allocations_table.c.user_id, allocations_table.c.id),
+            [
+                {
+                    "user_id": result.user_id,
+                    "resource_id": result.resource_id,
+                    "mission_code": allocation.mission_code,
+                    "status": "active"
+                }
+                for result, _, _ in accepted
+            ]
+        ).all())
+        for result, _, _ in accepted:
+            result.allocation_id = allocation_ids[result.user_id]
+        db.commit()
+        
+        allocated_ids = [result.user_id for result, _, _ in accepted]
+        for user_id in allocated_ids:
+            spatial_index.set_status(user_id, "allocated")
+        allocation_state.mark_allocated(allocated_ids)
+        bump_data_version()
+        
+        await audit.log_allocations(
+            actor=current_user["national_id_hash"],
+            mission_code=allocation.mission_code,
+            allocations=[(result.allocation_id, result.user_id) for result, _, _ in accepted],
+            db=db
+        )
+    
+    return BulkAllocateResponse(
+        mission_code=allocation.mission_code,
+        allocated=len(accepted),
+        failed=len(results) - len(accepted),
+        results=results
+    )
+
 @router.get("/requests", response_model=list[RequestResponse])
 async def list_requests(
     current_user: dict = Depends(require_authority),
@@ -183,3 +298,70 @@ async def list_allocations(
             created_at=alloc.created_at if alloc.created_at else None
         ) for alloc in allocations
     ]
+
+@router.post("/allocations/{allocation_id}/complete", response_model=AllocationResponse)
+async def complete_allocation(
+    allocation_id: int,
+    current_user: dict = Depends(require_authority),
+    db: Session = Depends(get_db)
+):
+    """Complete an active allocation, releasing the civilian once no other allocation is active"""
+    
+    allocation = db.query(Allocation).filter(Allocation.id == allocation_id).first()
+    if not allocation:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Allocation not found"
+        )
+    
+    if allocation.status != "active":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Allocation is already {allocation.status}"
+        )
+    
+    allocation.status = "completed"
+    allocation.completed_at = func.now()
+    
+    still_allocated = db.query(Allocation.id).filter(
+        Allocation.user_id == allocation.user_id,
+        Allocation.status == "active",
+        Allocation.id != allocation.id
+    ).first() is not None
+    
+    # Return the civilian to the pool, undoing what allocation set (status and
+    # availability both "allocated"); "available" is what a submission stores
+    profile = None
+    if not still_allocated:
+        profile = db.query(Profile).filter(Profile.user_id == allocation.user_id).first()
+        if profile and profile.status == "allocated":
+            before = profile_snapshot(allocation.user, profile)
+            profile.status = "available"
+            profile.availability = "available"
+            aggregates.apply(db, before, profile_snapshot(allocation.user, profile))
+    
+    db.commit()
+    db.refresh(allocation)
+    if not still_allocated:
+        allocation_state.mark_released([allocation.user_id])
+        if profile:
+            spatial_index.set_status(allocation.user_id, profile.status)
+        bump_data_version()
+    
+    await audit.log_allocation_completed(
+        actor=current_user["national_id_hash"],
+        user_id=allocation.user_id,
+        mission_code=allocation.mission_code,
+        allocation_id=allocation.id,
+        db=db
+    )
+    
+    return AllocationResponse(
+        id=allocation.id,
+        user_id=allocation.user_id,
+        resource_id=allocation.resource_id,
+        mission_code=allocation.mission_code,
+        status=allocation.status,
+        created_at=allocation.created_at,
+        completed_at=allocation.completed_at
+    )
@@ -12,6 +12,11 @@ from schemas import CivilianSubmitRequest, CivilianMeResponse, UserResponse, Pro
 from auth import require_civilian, get_user_id_hash
 from services.tagger import tagger
 from services.audit import audit
+from services.spatial_index import spatial_index
+from services.posting_index import posting_index
+from services.cache import bump_data_version
+from services.enrichment import enrichment_queue
+from services.aggregates import aggregates, profile_snapshot
 from sqlalchemy import func
 
 def normalize_skill_name(name: str) -> str:
@@ -156,6 +161,8 @@ async def submit_profile(
     existing_profile = db.query(Profile).filter(Profile.user_id == user.id).first()
     
     if existing_profile:
+        before = profile_snapshot(user, existing_profile)
+        
         # Update existing profile
         existing_profile.education_level = request.education_level
         existing_profile.industry = request.industry
@@ -167,16 +174,25 @@ async def submit_profile(
         
         # Regenerate tags and score
         resources_data = [r.dict() for r in request.resources] if request.resources else []
+        features = tagger.build_features(
+            education_level=request.education_level,
+            skills=resolved_skills,
+            free_text=request.free_text or "",
+            resources=resources_data
+        )
         tags, score = tagger.generate_tags_and_score(
             education_level=request.education_level,
             skills=resolved_skills,
             free_text=request.free_text or "",
             availability="available",
             resources=resources_data,
-            industry=request.industry
+            industry=request.industry,
+            features=features,
+            use_llm=False
         )
         existing_profile.tags_json = tags
         existing_profile.capability_score = score
+        existing_profile.features_json = features
         
         # Handle resources - replace existing ones
         if request.resources:
@@ -196,17 +212,26 @@ async def submit_profile(
                 db.add(resource)
         
         profile = existing_profile
+        aggregates.apply(db, before, profile_snapshot(user, profile))
         db.commit()
     else:
         # Create new profile
         resources_data = [r.dict() for r in request.resources] if request.resources else []
+        features = tagger.build_features(
+            education_level=request.education_level,
+            skills=resolved_skills,
+            free_text=request.free_text or "",
+            resources=resources_data
+        )
         tags, score = tagger.generate_tags_and_score(
             education_level=request.education_level,
             skills=resolved_skills,
             free_text=request.free_text or "",
             availability="available",
             resources=resources_data,
-            industry=request.industry
+            industry=request.industry,
+            features=features,
+            use_llm=False
         )
         
         profile = Profile(
@@ -219,9 +244,11 @@ async def submit_profile(
             availability="available",
             capability_score=score,
             tags_json=tags,
+            features_json=features,
             status="available"
         )
         db.add(profile)
+        aggregates.apply(db, None, profile_snapshot(user, profile))
         db.commit()
         db.refresh(profile)
         
@@ -239,8 +266,16 @@ async def submit_profile(
                 db.add(resource)
             db.commit()
     
+    # Keep the search index in sync with the stored location and status
+    spatial_index.upsert(user.id, user.lat, user.lon, profile.status)
+    posting_index.update(user.id, profile.tags_json, profile.skills, profile.free_text)
+    bump_data_version()
+    
+    # LLM tags are added in the background so submission never waits on the model host
+    enrichment_queued = bool(request.free_text) and enrichment_queue.enqueue(user.id)
+    
     # Log the action
-    audit.log_action(
+    await audit.log_action(
         actor=user_id_hash,
         action="submit_profile",
         entity="profile",
@@ -258,7 +293,8 @@ async def submit_profile(
         "submission_id": request.submission_id,
         "profile_id": profile.id,
         "capability_score": score,
-        "tags": tags
+        "tags": tags,
+        "enrichment_pending": enrichment_queued
     }
 
 @router.get("/tags")
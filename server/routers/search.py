@@ -1,19 +1,46 @@
 """
 Search router - handles civilian search and filtering for authorities
 """
+import json
 from typing import List, Optional
+import numpy as np
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import and_, or_, func
+from sqlalchemy import and_, or_, func, bindparam, exists
 
 from db import get_db
-from models import User, Profile, Resource
-from schemas import SearchRequest, SearchResponse, SearchResult, DetailResponse, UserResponse, ProfileResponse, AdvancedSearchRequest, AdvancedSearchResponse
-from auth import require_authority, can_reveal_pii
+from models import User, Profile, Resource, Allocation
+from schemas import SearchRequest, SearchResponse, SearchResult, DetailResponse, ResourceResponse, UserResponse, ProfileResponse, AdvancedSearchRequest, AdvancedSearchResponse
+from auth import require_authority, can_reveal_pii, reveal_map
 from services.audit import audit
+from services.spatial_index import spatial_index, circle_polygon
+from services.posting_index import posting_index, intersect_sorted, union_sorted
+from services.fulltext import fulltext_available, search_profiles
+from services.ranking import haversine_km_array, rank_keys, top_k, encode_cursor, decode_cursor
+from services.cache import TTLCache, data_version
+from services.compact import build_compact_results
+from services.jitter import location_jitter
 
 router = APIRouter()
 
+# Ranked candidate sets keyed by search filters, so cursor pages skip re-scoring
+_ranking_cache = TTLCache(maxsize=64, ttl=120)
+
+def _in_ids(column, ids):
+    """IN filter for index-produced ID sets, rendered inline to avoid SQLite's bound parameter limit"""
+    return column.in_(bindparam(None, sorted(ids), expanding=True, literal_execute=True))
+
+def _approximate_locations(users):
+    """Privacy-offset (lat, lon) pairs for (user_id, lat, lon) rows of one page"""
+    user_ids, lats, lons = zip(*users) if users else ((), (), ())
+    return list(zip(*location_jitter.approximate(user_ids, lats, lons)))
+
+# Columns needed for the compact (map marker) result format
+_COMPACT_COLUMNS = (
+    User.id, User.lat, User.lon, Profile.capability_score, Profile.status,
+    Profile.availability, Profile.education_level
+)
+
 @router.get("/", response_model=SearchResponse)
 async def search_civilians(
     bbox: Optional[str] = Query(None, description="Comma-separated: min_lat,min_lon,max_lat,max_lon"),
@@ -22,6 +49,7 @@ async def search_civilians(
     availability: Optional[str] = Query(None, pattern="^(available|allocated)$"),
     page: int = Query(1, ge=1),
     limit: int = Query(50, ge=1, le=100),
+    response_format: str = Query("full", alias="format", pattern="^(full|compact)$", description="compact: column arrays for map markers"),
     current_user: dict = Depends(require_authority),
     db: Session = Depends(get_db)
 ):
@@ -53,9 +81,9 @@ async def search_civilians(
     # Parse tags if provided
     if tags:
         tag_list = [tag.strip() for tag in tags.split(",")]
-        # Filter by tags in JSON array
-        for tag in tag_list:
-            query = query.filter(Profile.tags_json.contains([tag]))
+        # All tags must be present, resolved through the tag posting lists
+        posting_index.ensure_loaded(db)
+        query = query.filter(_in_ids(User.id, posting_index.all_of("tag", tag_list)))
     
     # Filter by minimum score
     if min_score is not None:
@@ -73,19 +101,24 @@ async def search_civilians(
     
     # Apply pagination
     offset = (page - 1) * limit
+    
+    if response_format == "compact":
+        # Only the marker columns; full detail is served by /search/detail
+        rows = query.with_entities(*_COMPACT_COLUMNS).offset(offset).limit(limit).all()
+        locations = _approximate_locations([row[:3] for row in rows])
+        compact = build_compact_results(
+            (user_id, *location, *rest)
+            for (user_id, _, _, *rest), location in zip(rows, locations)
+        )
+        return SearchResponse(results=[], total=total, page=page, limit=limit, compact=compact)
+    
     results = query.offset(offset).limit(limit).all()
+    locations = _approximate_locations([(user.id, user.lat, user.lon) for user, _ in results])
+    revealed = reveal_map([user.id for user, _ in results], current_user, db=db)
     
     # Convert to response format (anonymized)
     search_results = []
-    for user, profile in results:
-        # Add small deterministic offset to location for privacy
-        # Using user ID to ensure consistent positioning while maintaining privacy
-        import hashlib
-        user_hash = hashlib.md5(str(user.id).encode()).hexdigest()
-        # Convert first 4 chars to deterministic offset (-0.01 to 0.01 range)
-        lat_offset = (int(user_hash[:4], 16) / 65535.0 - 0.5) * 0.02  # ~1km
-        lon_offset = (int(user_hash[4:8], 16) / 65535.0 - 0.5) * 0.02
-        
+    for (user, profile), (lat, lon) in zip(results, locations):
         search_results.append(SearchResult(
             user_id=user.id,
             education_level=profile.education_level,
@@ -93,10 +126,11 @@ async def search_civilians(
             availability=profile.availability,
             capability_score=profile.capability_score,
             tags=profile.tags_json or [],
-            lat=user.lat + lat_offset,
-            lon=user.lon + lon_offset,
+            lat=lat,
+            lon=lon,
             status=profile.status,
-            skill_levels=profile.skill_levels
+            skill_levels=profile.skill_levels,
+            pii_revealed=revealed[user.id]
         ))
     
     return SearchResponse(
@@ -106,6 +140,66 @@ async def search_civilians(
         limit=limit
     )
 
+def _rank_candidates(query, request: AdvancedSearchRequest, search_center, sort_method: str, has_query_context: bool, text_ranks=None):
+    """Score and key every candidate of a filtered search in one pass"""
+    if has_query_context:
+        # Read the precomputed profile text instead of the raw skills/free_text
+        rows = query.with_entities(
+            User.id, User.lat, User.lon, Profile.capability_score,
+            Profile.education_level, Profile.availability, Profile.industry, Profile.tags_json,
+            func.json_extract(Profile.features_json, "$.rules_version"),
+            func.json_extract(Profile.features_json, "$.text")
+        ).all()
+    else:
+        rows = query.with_entities(User.id, User.lat, User.lon, Profile.capability_score).all()
+    
+    # Equipment joins can yield one row per matching resource
+    unique_rows = list({row[0]: row for row in rows}.values())
+    ids = np.fromiter((row[0] for row in unique_rows), dtype=np.int64, count=len(unique_rows))
+    lats = np.fromiter((row[1] for row in unique_rows), dtype=np.float64, count=len(unique_rows))
+    lons = np.fromiter((row[2] for row in unique_rows), dtype=np.float64, count=len(unique_rows))
+    
+    if has_query_context:
+        # Only use query-relevant scoring if there's actual search context
+        from services.tagger import tagger
+        
+        profiles = [
+            {
+                "education_level": row[4],
+                "availability": row[5],
+                "industry": row[6],
+                "tags": row[7] or [],
+                "features": {"rules_version": row[8], "text": row[9]}
+            }
+            for row in unique_rows
+        ]
+        
+        # Profiles featurised under older rules fall back to their raw text
+        stale = {row[0]: profile for row, profile in zip(unique_rows, profiles) if not tagger.features_current(profile["features"])}
+        if stale:
+            raw_rows = query.session.query(Profile.user_id, Profile.skills, Profile.free_text).filter(
+                _in_ids(Profile.user_id, stale.keys())
+            ).all()
+            for user_id, skills, free_text in raw_rows:
+                stale[user_id].update(skills=skills, free_text=free_text or "", features=None)
+        
+        search_query = " ".join((request.skills or []) + (request.include_tags or []))
+        scores = tagger.score_batch(
+            profiles,
+            search_query=search_query,
+            skills_query=request.skills or [],
+            include_tags=request.include_tags or [],
+            text_ranks=[text_ranks.get(row[0], 0.0) for row in unique_rows] if text_ranks is not None else None
+        )
+    else:
+        scores = np.fromiter((row[3] or 0.0 for row in unique_rows), dtype=np.float64, count=len(unique_rows))
+    
+    distances = None
+    if search_center:
+        distances = haversine_km_array(search_center["lat"], search_center["lon"], lats, lons)
+    
+    return ids, rank_keys(sort_method, scores, distances), scores
+
 @router.get("/detail/{user_id}", response_model=DetailResponse)
 async def get_civilian_detail(
     user_id: int,
@@ -118,15 +212,25 @@ async def get_civilian_detail(
 ):
     """Get detailed civilian information (PII revealed only after allocation)"""
     
-    # Get user and profile
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
+    # User, profile, resources and the active-allocation flag in one query; the
+    # objects land in the request session's identity map, so later lookups of
+    # the same rows do not go back to the database
+    has_active_allocation = exists().where(
+        Allocation.user_id == User.id,
+        Allocation.status == "active"
+    ).label("has_active_allocation")
+    row = db.query(User, has_active_allocation).options(
+        joinedload(User.profile),
+        joinedload(User.resources)
+    ).filter(User.id == user_id).first()
+    if not row:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Civilian not found"
         )
+    user, allocated = row
     
-    profile = db.query(Profile).filter(Profile.user_id == user_id).first()
+    profile = user.profile
     if not profile:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -134,10 +238,10 @@ async def get_civilian_detail(
         )
     
     # Check if PII can be revealed
-    pii_revealed = can_reveal_pii(user_id, current_user)
+    pii_revealed = can_reveal_pii(user_id, current_user, allocated=bool(allocated))
     
     # Log PII access attempt
-    audit.log_pii_access(
+    await audit.log_pii_access(
         actor=current_user["national_id_hash"],
         user_id=user_id,
         access_type="read",
@@ -169,7 +273,8 @@ async def get_civilian_detail(
             "free_text": profile.free_text or "",
             "availability": profile.availability,
             "industry": profile.industry,
-            "tags": profile.tags_json or []
+            "tags": profile.tags_json or [],
+            "features": profile.features_json
         }
         
         # Build search query from parameters
@@ -202,15 +307,29 @@ async def get_civilian_detail(
         status=profile.status
     )
     
+    resources = [
+        ResourceResponse(
+            id=resource.id,
+            category=resource.category,
+            subtype=resource.subtype,
+            quantity=resource.quantity,
+            specs=resource.specs_json,
+            available=bool(resource.available)
+        )
+        for resource in sorted(user.resources, key=lambda resource: resource.id)
+    ]
+    
     return DetailResponse(
         user=user_response,
         profile=profile_response,
-        pii_revealed=pii_revealed
+        pii_revealed=pii_revealed,
+        resources=resources
     )
 
 @router.post("/advanced", response_model=AdvancedSearchResponse)
 async def search_advanced(
     request: AdvancedSearchRequest,
+    response_format: str = Query("full", alias="format", pattern="^(full|compact)$", description="compact: column arrays for map markers"),
     current_user: dict = Depends(require_authority),
     db: Session = Depends(get_db)
 ):
@@ -219,55 +338,35 @@ async def search_advanced(
     # Build base query
     query = db.query(User, Profile).join(Profile, User.id == Profile.user_id)
     
+    # ID sets from the in-memory indexes, intersected into one filter below
+    id_constraints = []
+    
     # Location filtering
     search_geometry = None
     search_center = None
     search_radius_km = None
     
     if request.center_lat and request.center_lon and request.radius_km:
-        # Radius-based search
-        import math
-        
-        # Convert radius from km to degrees (approximate)
-        lat_degree = request.radius_km / 111.0  # 1 degree latitude ≈ 111 km
-        lon_degree = request.radius_km / (111.0 * math.cos(math.radians(request.center_lat)))
-        
-        # Create bounding box for radius search
-        min_lat = request.center_lat - lat_degree
-        max_lat = request.center_lat + lat_degree
-        min_lon = request.center_lon - lon_degree
-        max_lon = request.center_lon + lon_degree
-        
-        query = query.filter(
-            and_(
-                User.lat.between(min_lat, max_lat),
-                User.lon.between(min_lon, max_lon)
-            )
+        # Radius-based search using the in-memory grid index with true haversine cutoff
+        spatial_index.ensure_loaded(db)
+        distances = spatial_index.query_radius(
+            request.center_lat, request.center_lon, request.radius_km, statuses=request.status
         )
+        id_constraints.append(sorted(distances))
         
-        # Create search geometry (circle approximation as polygon)
-        search_geometry = {
-            "type": "Polygon",
-            "coordinates": [[
-                [request.center_lon - lon_degree, request.center_lat - lat_degree],
-                [request.center_lon + lon_degree, request.center_lat - lat_degree],
-                [request.center_lon + lon_degree, request.center_lat + lat_degree],
-                [request.center_lon - lon_degree, request.center_lat + lat_degree],
-                [request.center_lon - lon_degree, request.center_lat - lat_degree]
-            ]]
-        }
+        # Search geometry is the actual circle, not its bounding box
+        search_geometry = circle_polygon(request.center_lat, request.center_lon, request.radius_km)
         search_center = {"lat": request.center_lat, "lon": request.center_lon}
         search_radius_km = request.radius_km
         
     elif request.bbox and len(request.bbox) == 4:
         # Bounding box search
         min_lat, min_lon, max_lat, max_lon = request.bbox
-        query = query.filter(
-            and_(
-                User.lat.between(min_lat, max_lat),
-                User.lon.between(min_lon, max_lon)
-            )
+        spatial_index.ensure_loaded(db)
+        candidate_ids = spatial_index.query_bbox(
+            min_lat, min_lon, max_lat, max_lon, statuses=request.status
         )
+        id_constraints.append(sorted(candidate_ids))
         
         search_geometry = {
             "type": "Polygon",
@@ -288,20 +387,19 @@ async def search_advanced(
     if request.min_capability_score is not None:
         query = query.filter(Profile.capability_score >= request.min_capability_score)
     
-    # Skills filtering (keyword-based)
+    # Skills filtering (keyword-based): skills or free text mention any requested skill
+    text_ranks = None
     if request.skills:
-        skill_conditions = []
-        for skill in request.skills:
-            # Search in skills field (JSON array) using LIKE for partial matching
-            # and also search in free_text
-            skill_conditions.append(
-                or_(
-                    Profile.skills.like(f'%{skill}%'),
-                    Profile.free_text.ilike(f'%{skill}%')
-                )
-            )
-        if skill_conditions:
-            query = query.filter(or_(*skill_conditions))
+        posting_index.ensure_loaded(db)
+        if fulltext_available(db):
+            # Skill names by substring, free text by ranked FTS5 prefix match
+            text_ranks = search_profiles(db, request.skills)
+            skill_matches = [posting_index.containing("skill", skill) for skill in request.skills]
+            id_constraints.append(union_sorted(skill_matches + [sorted(text_ranks)]))
+        else:
+            id_constraints.append(union_sorted(
+                posting_index.matching_skill_query(skill) for skill in request.skills
+            ))
     
     # Skill level filtering (new format)
     skill_levels = request.min_levels or request.skill_levels
@@ -323,30 +421,14 @@ async def search_advanced(
                 func.json_extract(Profile.skill_levels, f'$.{skill}').isnot(None)
             )
     
-    # Tag filtering (new format)
-    include_tags = request.include_tags or []
+    # Tag filtering: include tags (new format) and legacy tags must all be present
+    required_tags = (request.include_tags or []) + (request.tags or [])
+    if required_tags:
+        posting_index.ensure_loaded(db)
+        id_constraints.append(posting_index.all_of("tag", required_tags))
     
-    # Include tags (must have)
-    if include_tags:
-        tag_conditions = []
-        for tag in include_tags:
-            # Check if tag exists in the JSON array using JSON_CONTAINS or LIKE
-            tag_conditions.append(
-                Profile.tags_json.like(f'%"{tag}"%')
-            )
-        if tag_conditions:
-            query = query.filter(and_(*tag_conditions))  # All tags must be present
-    
-    # Legacy tag filtering
-    if request.tags:
-        tag_conditions = []
-        for tag in request.tags:
-            # Check if tag exists in the JSON array using LIKE
-            tag_conditions.append(
-                Profile.tags_json.like(f'%"{tag}"%')
-            )
-        if tag_conditions:
-            query = query.filter(and_(*tag_conditions))  # All tags must be present
+    if id_constraints:
+        query = query.filter(_in_ids(User.id, intersect_sorted(id_constraints)))
     
     # Equipment filtering
     if request.equipment:
@@ -364,102 +446,103 @@ async def search_advanced(
             query = query.join(Resource, User.id == Resource.user_id)
             query = query.filter(or_(*equipment_conditions))
     
-    # Get total count
-    total = query.count()
-    
-    # Pagination
-    offset = (request.page - 1) * request.limit
-    results = query.offset(offset).limit(request.limit).all()
+    # Rank the whole candidate set before paginating, reusing the scores of
+    # previous pages of the same search while the underlying data is unchanged
+    sort_method = request.sort or request.sort_by or "combined"
+    has_query_context = bool(request.skills) or bool(request.include_tags)
+    cache_key = (
+        json.dumps(request.dict(exclude={"page", "limit", "cursor"}), sort_keys=True, default=str),
+        data_version()
+    )
+    ranked = _ranking_cache.get(cache_key)
+    if ranked is None:
+        ranked = _rank_candidates(query, request, search_center, sort_method, has_query_context, text_ranks)
+        _ranking_cache.set(cache_key, ranked)
+    ids, keys, scores = ranked
+    total = len(ids)
+    
+    # Select the requested page: either after a cursor or by page offset
+    if request.cursor:
+        try:
+            after = decode_cursor(request.cursor)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+        page_idx = top_k(keys, ids, request.limit, after=after)
+        has_more = len(page_idx) == request.limit
+    else:
+        offset = (request.page - 1) * request.limit
+        page_idx = top_k(keys, ids, offset + request.limit)[offset:]
+        has_more = total > offset + request.limit
     
-    # Convert to response format (anonymized) with query-relevant scoring
-    from services.tagger import tagger
+    next_cursor = None
+    if has_more and len(page_idx) > 0:
+        next_cursor = encode_cursor(keys[page_idx[-1]], ids[page_idx[-1]])
     
+    # Load rows for the page only (just the marker columns in compact format)
+    page_ids = [int(ids[i]) for i in page_idx]
+    compact = None
     search_results = []
-    for user, profile in results:
-        # Add small deterministic offset to location for privacy
-        import hashlib
-        user_hash = hashlib.md5(str(user.id).encode()).hexdigest()
-        lat_offset = (int(user_hash[:4], 16) / 65535.0 - 0.5) * 0.02
-        lon_offset = (int(user_hash[4:8], 16) / 65535.0 - 0.5) * 0.02
-        
-        # Use static capability score by default, or query-relevant if search context provided
-        capability_score = profile.capability_score
-        
-        # Only use query-relevant scoring if there's actual search context
-        if (request.skills and len(request.skills) > 0) or (request.include_tags and len(request.include_tags) > 0):
-            civilian_data = {
-                "education_level": profile.education_level,
-                "skills": profile.skills,
-                "free_text": profile.free_text or "",
-                "availability": profile.availability,
-                "industry": profile.industry,
-                "tags": profile.tags_json or []
+    if response_format == "compact":
+        rows = {}
+        if page_ids:
+            rows = {
+                row[0]: row
+                for row in db.query(*_COMPACT_COLUMNS).join(
+                    Profile, User.id == Profile.user_id
+                ).filter(_in_ids(User.id, page_ids)).all()
+            }
+        # Skip users removed since the ranking was cached
+        page_rows = [(i, rows[int(ids[i])]) for i in page_idx if int(ids[i]) in rows]
+        locations = _approximate_locations([row[:3] for _, row in page_rows])
+        compact = build_compact_results(
+            (user_id, *location, float(scores[i]), *rest)
+            for (i, (user_id, _, _, _, *rest)), location in zip(page_rows, locations)
+        )
+        result_count = len(compact.user_ids)
+    else:
+        rows = {}
+        if page_ids:
+            rows = {
+                user.id: (user, profile)
+                for user, profile in db.query(User, Profile).join(
+                    Profile, User.id == Profile.user_id
+                ).filter(_in_ids(User.id, page_ids)).all()
             }
-            
-            # Build search query from request parameters
-            search_query_parts = []
-            if request.skills:
-                search_query_parts.extend(request.skills)
-            if request.include_tags:
-                search_query_parts.extend(request.include_tags)
-            search_query = " ".join(search_query_parts)
-            
-            # Calculate query-relevant score
-            capability_score = tagger.calculate_query_relevant_score(
-                civilian_data=civilian_data,
-                search_query=search_query,
-                skills_query=request.skills or [],
-                include_tags=request.include_tags or []
-            )
         
-        search_results.append(SearchResult(
-            user_id=user.id,
-            education_level=profile.education_level,
-            skills=profile.skills,
-            availability=profile.availability,
-            capability_score=capability_score,  # Use static score by default, query-relevant when context provided
-            tags=profile.tags_json or [],
-            lat=user.lat + lat_offset,
-            lon=user.lon + lon_offset,
-            status=profile.status,
-            skill_levels=profile.skill_levels
-        ))
-    
-        # Sort results if needed
-        sort_method = request.sort or request.sort_by or "combined"
+        # Skip users removed since the ranking was cached
+        page_rows = [(i, *rows[int(ids[i])]) for i in page_idx if int(ids[i]) in rows]
+        locations = _approximate_locations([(user.id, user.lat, user.lon) for _, user, _ in page_rows])
+        revealed = reveal_map([user.id for _, user, _ in page_rows], current_user, db=db)
         
-        if sort_method == "capability" or sort_method == "score":
-            search_results.sort(key=lambda x: x.capability_score, reverse=True)
-        elif sort_method == "distance" and search_center:
-            # Sort by distance from search center
-            import math
-            def distance_from_center(result):
-                lat_diff = result.lat - search_center["lat"]
-                lon_diff = result.lon - search_center["lon"]
-                return math.sqrt(lat_diff**2 + lon_diff**2) * 111.0
-            search_results.sort(key=distance_from_center)
-        elif sort_method == "combined" and search_center:
-            # Sort by combined score (distance + capability)
-            import math
-            def combined_score(result):
-                lat_diff = result.lat - search_center["lat"]
-                lon_diff = result.lon - search_center["lon"]
-                distance_km = math.sqrt(lat_diff**2 + lon_diff**2) * 111.0
-                # Normalize distance (0-100km = 100-0 score) and capability (0-100)
-                distance_score = max(0, 100 - distance_km)
-                combined = (distance_score * 0.3) + (result.capability_score * 0.7)
-                return combined
-            search_results.sort(key=combined_score, reverse=True)
+        # Convert to response format (anonymized)
+        for (i, user, profile), (lat, lon) in zip(page_rows, locations):
+            search_results.append(SearchResult(
+                user_id=user.id,
+                education_level=profile.education_level,
+                skills=profile.skills,
+                availability=profile.availability,
+                capability_score=float(scores[i]),  # Static score by default, query-relevant when context provided
+                tags=profile.tags_json or [],
+                lat=lat,
+                lon=lon,
+                status=profile.status,
+                skill_levels=profile.skill_levels,
+                pii_revealed=revealed[user.id]
+            ))
+        result_count = len(search_results)
     
     # Log search for audit
-    audit.log_action(
+    await audit.log_action(
         actor=current_user["national_id_hash"],
         action="advanced_search",
         entity="search",
         entity_id=0,  # Use 0 for search operations
         details={
             "filters": request.dict(exclude_unset=True),
-            "result_count": len(search_results)
+            "result_count": result_count
         }
     )
     
@@ -470,7 +553,9 @@ async def search_advanced(
         limit=request.limit,
         search_geometry=search_geometry,
         search_center=search_center,
-        search_radius_km=search_radius_km
+        search_radius_km=search_radius_km,
+        next_cursor=next_cursor,
+        compact=compact
     )
 
 @router.get("/tags/suggest")
@@ -2,28 +2,51 @@
 Stats router - provides heatmap and statistics data
 """
 from typing import List, Optional
-from fastapi import APIRouter, Depends, Query
+import numpy as np
+from fastapi import APIRouter, Depends, Query, HTTPException, status
 from sqlalchemy.orm import Session
 from sqlalchemy import and_, func
 
 from db import get_db
 from models import User, Profile
-from schemas import HeatmapResponse, HeatmapPoint
+from schemas import HeatmapResponse, HeatmapPoint, HeatmapTileResponse
 from auth import require_authority
+from services.enrichment import enrichment_queue
+from services.cache import TTLCache, data_version
+from services.tiles import MAX_ZOOM, TILE_GRIDS, tile_bounds, bin_tile
+from services.aggregates import aggregates
 
 router = APIRouter()
 
+# Summary per data version; the short TTL bounds staleness from writes made by
+# other worker processes, which do not bump this process's version
+_summary_cache = TTLCache(maxsize=4, ttl=10)
+
+# Binned heatmap tiles; keys include the data version so local writes take
+# effect at once, and the same short TTL as the summary bounds staleness from
+# writes made by other worker processes
+_tile_cache = TTLCache(maxsize=2048, ttl=10)
+
 @router.get("/heatmap", response_model=HeatmapResponse)
 async def get_heatmap_data(
     bbox: Optional[str] = Query(None, description="Comma-separated: min_lat,min_lon,max_lat,max_lon"),
     tags: Optional[str] = Query(None, description="Comma-separated tag list"),
     min_score: Optional[float] = Query(None, ge=0, le=100),
     availability: Optional[str] = Query(None, regex="^(immediate|24h|48h|unavailable)$"),
+    aggregated: bool = Query(False, description="One point per ~1 km cell from the materialised aggregates"),
     current_user: dict = Depends(require_authority),
     db: Session = Depends(get_db)
 ):
     """Get heatmap data for civilian locations"""
     
+    if aggregated:
+        if tags or min_score is not None or availability:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="The aggregated heatmap only supports the bbox filter"
+            )
+        return _aggregated_heatmap(db, bbox)
+    
     # Build query similar to search
     query = db.query(User.lat, User.lon, Profile.capability_score).join(
         Profile, User.id == Profile.user_id
@@ -96,37 +119,137 @@ async def get_heatmap_data(
         bounds=bounds
     )
 
+def _aggregated_heatmap(db: Session, bbox: Optional[str]) -> HeatmapResponse:
+    """Heatmap from the per-cell aggregates: cell centres weighted by summed civilian weights"""
+    bounds_filter = None
+    if bbox:
+        try:
+            coords = [float(x.strip()) for x in bbox.split(",")]
+            if len(coords) == 4:
+                bounds_filter = tuple(coords)
+        except ValueError:
+            pass  # Ignore invalid bbox
+    
+    cells = aggregates.heatmap_cells(db, bounds_filter)
+    points = [HeatmapPoint(lat=lat, lon=lon, weight=round(weight_sum, 3)) for lat, lon, _, weight_sum in cells]
+    bounds = None
+    if cells:
+        bounds = [
+            min(cell[0] for cell in cells), min(cell[1] for cell in cells),
+            max(cell[0] for cell in cells), max(cell[1] for cell in cells)
+        ]
+    return HeatmapResponse(points=points, bounds=bounds)
+
+@router.get("/heatmap/{z}/{x}/{y}", response_model=HeatmapTileResponse)
+async def get_heatmap_tile(
+    z: int,
+    x: int,
+    y: int,
+    grid: int = Query(64, description="Cells per tile side: " + ", ".join(str(size) for size in TILE_GRIDS)),
+    min_score: Optional[float] = Query(None, ge=0, le=100),
+    availability: Optional[str] = Query(None, pattern="^(immediate|24h|48h|unavailable)$"),
+    current_user: dict = Depends(require_authority),
+    db: Session = Depends(get_db)
+):
+    """Get a slippy-map heatmap tile with available civilians binned into a fixed grid"""
+    
+    if not 0 <= z <= MAX_ZOOM or not 0 <= x < 2 ** z or not 0 <= y < 2 ** z:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid tile {z}/{x}/{y}"
+        )
+    if grid not in TILE_GRIDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"grid must be one of {', '.join(str(size) for size in TILE_GRIDS)}"
+        )
+    
+    cache_key = (data_version(), z, x, y, grid, min_score, availability)
+    cached = _tile_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    min_lat, min_lon, max_lat, max_lon = tile_bounds(z, x, y)
+    query = db.query(User.lat, User.lon, Profile.capability_score).join(
+        Profile, User.id == Profile.user_id
+    ).filter(
+        User.lat >= min_lat,
+        User.lat <= max_lat,
+        User.lon >= min_lon,
+        User.lon <= max_lon,
+        Profile.status == "available"
+    )
+    if min_score is not None:
+        query = query.filter(Profile.capability_score >= min_score)
+    if availability:
+        query = query.filter(Profile.availability == availability)
+    
+    rows = np.array(query.all(), dtype=np.float64).reshape(-1, 3)
+    # Same weighting as /heatmap points: score normalised to 0.1-1.0
+    weights = np.clip(np.nan_to_num(rows[:, 2]) / 100.0, 0.1, 1.0)
+    cells, counts, weight_sums = bin_tile(rows[:, 0], rows[:, 1], weights, z, x, y, grid)
+    
+    tile = HeatmapTileResponse(
+        z=z,
+        x=x,
+        y=y,
+        grid=grid,
+        bounds=[min_lat, min_lon, max_lat, max_lon],
+        cells=cells.tolist(),
+        counts=counts.tolist(),
+        weights=np.round(weight_sums, 3).tolist(),
+        total=int(counts.sum())
+    )
+    _tile_cache.set(cache_key, tile)
+    return tile
+
 @router.get("/summary")
 async def get_summary_stats(
+    live: bool = Query(False, description="Recompute from profiles instead of reading the materialised aggregates"),
     current_user: dict = Depends(require_authority),
     db: Session = Depends(get_db)
 ):
     """Get summary statistics"""
     
-    # Count total civilians
-    total_civilians = db.query(Profile).count()
+    cache_key = (data_version(), live)
+    cached = _summary_cache.get(cache_key)
+    if cached is not None:
+        return cached
     
-    # Count by availability
-    availability_stats = {}
-    for availability in ["immediate", "24h", "48h", "unavailable"]:
-        count = db.query(Profile).filter(Profile.availability == availability).count()
-        availability_stats[availability] = count
+    summary = _live_summary(db) if live else aggregates.summary(db)
+    _summary_cache.set(cache_key, summary)
+    return summary
+
+def _live_summary(db: Session) -> dict:
+    """Summary computed from the profiles table in one grouped pass"""
+    # One grouped pass; every breakdown is folded from the same rows
+    rows = db.query(
+        Profile.education_level,
+        Profile.availability,
+        Profile.status,
+        func.count(Profile.id),
+        func.count(Profile.capability_score),
+        func.sum(Profile.capability_score)
+    ).group_by(Profile.education_level, Profile.availability, Profile.status).all()
     
-    # Count by status
-    status_stats = {}
-    for status in ["available", "requested", "allocated", "unavailable"]:
-        count = db.query(Profile).filter(Profile.status == status).count()
-        status_stats[status] = count
+    total_civilians = 0
+    scored = 0
+    score_sum = 0.0
+    availability_stats = {availability: 0 for availability in ["immediate", "24h", "48h", "unavailable"]}
+    status_stats = {status: 0 for status in ["available", "requested", "allocated", "unavailable"]}
+    education_stats = {}
+    for level, availability, status, count, score_count, group_score_sum in rows:
+        total_civilians += count
+        scored += score_count
+        score_sum += group_score_sum or 0.0
+        if availability in availability_stats:
+            availability_stats[availability] += count
+        if status in status_stats:
+            status_stats[status] += count
+        education_stats[level] = education_stats.get(level, 0) + count
     
     # Average capability score
-    avg_score = db.query(func.avg(Profile.capability_score)).scalar() or 0
-    
-    # Count by education level
-    education_stats = {}
-    education_levels = db.query(Profile.education_level).distinct().all()
-    for (level,) in education_levels:
-        count = db.query(Profile).filter(Profile.education_level == level).count()
-        education_stats[level] = count
+    avg_score = score_sum / scored if scored else 0
     
     return {
         "total_civilians": total_civilians,
@@ -135,3 +258,10 @@ async def get_summary_stats(
         "average_capability_score": round(avg_score, 1),
         "education_breakdown": education_stats
     }
+
+@router.get("/enrichment")
+async def get_enrichment_stats(
+    current_user: dict = Depends(require_authority)
+):
+    """Get background LLM enrichment queue depth, lag and outcome counts"""
+    return enrichment_queue.stats()
@@ -82,6 +82,7 @@ class AdvancedSearchRequest(BaseModel):
     limit: int = Field(50, ge=1, le=100)
     sort: str = Field("combined", description="Sort by: distance, capability, combined")
     sort_by: str = Field("distance", description="Sort by: distance, score, combined (legacy)")
+    cursor: Optional[str] = Field(None, description="Cursor from a previous response; takes precedence over page")
 
 class RequestCreateRequest(BaseModel):
     type: str = Field(..., pattern="^(info|allocate)$")
@@ -93,6 +94,14 @@ class AllocateRequest(BaseModel):
     resource_id: Optional[int] = None
     mission_code: str
 
+class BulkAllocateItem(BaseModel):
+    user_id: int
+    resource_id: Optional[int] = None
+
+class BulkAllocateRequest(BaseModel):
+    mission_code: str
+    items: List[BulkAllocateItem] = Field(..., min_length=1, max_length=1000)
+
 # Response schemas
 class UserResponse(BaseModel):
     id: int
@@ -116,6 +125,14 @@ class ProfileResponse(BaseModel):
     last_updated: Optional[datetime] = None
     status: str
 
+class ResourceResponse(BaseModel):
+    id: int
+    category: str
+    subtype: str
+    quantity: Optional[int] = None
+    specs: Optional[Dict[str, Any]] = None
+    available: bool = True
+
 class CivilianMeResponse(BaseModel):
     user: UserResponse
     profile: Optional[ProfileResponse] = None
@@ -131,6 +148,21 @@ class SearchResult(BaseModel):
     lon: float  # Approximate
     status: str
     skill_levels: Optional[Dict[str, int]] = None
+    pii_revealed: bool = False  # Whether the detail view will reveal PII
+
+class CompactSearchResults(BaseModel):
+    """Search results as parallel arrays: row i is user_ids[i], lats[i], ... Strings are
+    dictionary-encoded as indices into the matching *_values list."""
+    user_ids: List[int]
+    lats: List[float]  # Approximate
+    lons: List[float]  # Approximate
+    scores: List[float]
+    statuses: List[int]
+    availabilities: List[int]
+    education_levels: List[int]
+    status_values: List[str]
+    availability_values: List[str]
+    education_values: List[str]
 
 class SearchResponse(BaseModel):
     results: List[SearchResult]
@@ -138,6 +170,7 @@ class SearchResponse(BaseModel):
     page: int
     limit: int
     search_geometry: Optional[Dict[str, Any]] = Field(None, description="GeoJSON geometry of search area")
+    compact: Optional[CompactSearchResults] = Field(None, description="Results when format=compact (results is then empty)")
 
 class AdvancedSearchResponse(BaseModel):
     results: List[SearchResult]
@@ -147,11 +180,14 @@ class AdvancedSearchResponse(BaseModel):
     search_geometry: Optional[Dict[str, Any]] = Field(None, description="GeoJSON geometry of search area")
     search_center: Optional[Dict[str, float]] = Field(None, description="Search center point")
     search_radius_km: Optional[float] = Field(None, description="Search radius in kilometers")
+    next_cursor: Optional[str] = Field(None, description="Cursor for the next page of the same ranking")
+    compact: Optional[CompactSearchResults] = Field(None, description="Results when format=compact (results is then empty)")
 
 class DetailResponse(BaseModel):
     user: UserResponse
     profile: ProfileResponse
     pii_revealed: bool = Field(False, description="Whether PII is revealed (after allocation)")
+    resources: List[ResourceResponse] = []
 
 class RequestResponse(BaseModel):
     id: int
@@ -172,6 +208,19 @@ class AllocationResponse(BaseModel):
     created_at: Optional[datetime] = None
     completed_at: Optional[datetime] = None
 
+class BulkAllocateResult(BaseModel):
+    user_id: int
+    resource_id: Optional[int] = None
+    status: str  # allocated/failed
+    allocation_id: Optional[int] = None
+    detail: Optional[str] = None  # Why the item failed
+
+class BulkAllocateResponse(BaseModel):
+    mission_code: str
+    allocated: int
+    failed: int
+    results: List[BulkAllocateResult]
+
 class HeatmapPoint(BaseModel):
     lat: float
     lon: float
@@ -181,6 +230,17 @@ class HeatmapResponse(BaseModel):
     points: List[HeatmapPoint]
     bounds: Optional[List[float]] = None  # [min_lat, min_lon, max_lat, max_lon]
 
+class HeatmapTileResponse(BaseModel):
+    z: int
+    x: int
+    y: int
+    grid: int  # Tile is divided into grid x grid cells
+    bounds: List[float]  # [min_lat, min_lon, max_lat, max_lon]
+    cells: List[int]  # Non-empty cells as row-major indices (row 0 is the north edge)
+    counts: List[int]  # Civilians per cell
+    weights: List[float]  # Sum of capability weights per cell
+    total: int
+
 class ExportResponse(BaseModel):
     users: List[UserResponse]
     profiles: List[ProfileResponse]
@@ -189,6 +249,32 @@ class ExportResponse(BaseModel):
     audit_logs: List[Dict[str, Any]]
     exported_at: datetime
 
+class AuditEventResponse(BaseModel):
+    id: int
+    actor: str
+    action: str
+    entity: str
+    entity_id: int
+    ts: datetime
+    details: Optional[Dict[str, Any]] = None
+
+class AuditQueryResponse(BaseModel):
+    events: List[AuditEventResponse]
+    next_cursor: Optional[str] = Field(None, description="Cursor for the next (older) page")
+
+class PiiAccessActor(BaseModel):
+    actor: str
+    accesses: int
+    reveals: int
+    first_access: datetime
+    last_access: datetime
+
+class PiiAccessResponse(BaseModel):
+    user_id: int
+    since: datetime
+    until: Optional[datetime] = None
+    actors: List[PiiAccessActor]
+
 # Skills schemas
 class SkillResponse(BaseModel):
     id: int
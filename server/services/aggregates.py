@@ -0,0 +1,226 @@
+"""
+Materialised aggregates for the dashboard, maintained incrementally
+"""
+import math
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import User, Profile, StatsAggregate
+
+logger = logging.getLogger(__name__)
+
+# Heatmap cell size in degrees (about 1 km north-south)
+CELL_SIZE_DEG = 0.01
+
+AggregateKey = Tuple[str, str]
+# (count, score_sum, weight_sum)
+Contribution = Tuple[int, float, float]
+
+BUILT_MARKER: AggregateKey = ("meta", "built")
+
+
+def heat_weight(score: Optional[float]) -> float:
+    """Heatmap weight of a civilian: score normalised to 0.1-1.0"""
+    return max(0.1, min(1.0, (score or 0) / 100.0))
+
+
+def cell_key(lat: float, lon: float) -> str:
+    return f"{math.floor(lat / CELL_SIZE_DEG)}:{math.floor(lon / CELL_SIZE_DEG)}"
+
+
+def cell_center(key: str) -> Tuple[float, float]:
+    row, column = key.split(":")
+    return (int(row) + 0.5) * CELL_SIZE_DEG, (int(column) + 0.5) * CELL_SIZE_DEG
+
+
+def profile_snapshot(user: User, profile: Profile) -> Dict[str, Any]:
+    """The fields of a civilian that the aggregates depend on"""
+    return {
+        "lat": user.lat,
+        "lon": user.lon,
+        "education_level": profile.education_level,
+        "availability": profile.availability,
+        "status": profile.status,
+        "tags": list(profile.tags_json or []),
+        "score": profile.capability_score
+    }
+
+
+def contributions(snapshot: Optional[Dict[str, Any]]) -> Dict[AggregateKey, Contribution]:
+    """Aggregate rows a single civilian adds to"""
+    if not snapshot:
+        return {}
+    score = snapshot["score"]
+    score_value = score if score is not None else 0.0
+    result = {
+        ("total", "all"): (1, score_value, 0.0),
+        ("status", snapshot["status"]): (1, score_value, 0.0),
+        ("availability", snapshot["availability"]): (1, score_value, 0.0),
+        ("education", snapshot["education_level"]): (1, score_value, 0.0)
+    }
+    if score is not None:
+        result[("total", "scored")] = (1, score, 0.0)
+    for tag in set(snapshot["tags"]):
+        result[("tag", tag)] = (1, score_value, 0.0)
+    # The heatmap shows available civilians only
+    if snapshot["status"] == "available":
+        result[("cell", cell_key(snapshot["lat"], snapshot["lon"]))] = (1, score_value, heat_weight(score))
+    return result
+
+
+class AggregateStore:
+    """
+    Counts and score/weight sums per status, availability, education level, tag
+    and heatmap cell, stored in the stats_aggregates table.
+
+    Writers call apply() with the civilian's state before and after the change,
+    inside the same transaction, so readers see aggregates consistent with the
+    profiles. The table is rebuilt from scratch on first use after it has been
+    invalidated (seed, clear); until then deltas are skipped.
+    """
+
+    def is_built(self, db: Session) -> bool:
+        return db.query(StatsAggregate.id).filter(
+            StatsAggregate.dimension == BUILT_MARKER[0],
+            StatsAggregate.key == BUILT_MARKER[1]
+        ).first() is not None
+
+    def ensure_built(self, db: Session):
+        if not self.is_built(db):
+            try:
+                self.rebuild(db)
+            except IntegrityError:
+                # Another request rebuilt the table concurrently
+                db.rollback()
+
+    def rebuild(self, db: Session):
+        """Recompute every aggregate from users and profiles and commit"""
+        totals: Dict[AggregateKey, List[float]] = {}
+        rows = db.query(
+            User.lat, User.lon, Profile.education_level, Profile.availability,
+            Profile.status, Profile.tags_json, Profile.capability_score
+        ).join(Profile, User.id == Profile.user_id).yield_per(1000)
+        for lat, lon, education_level, availability, status, tags, score in rows:
+            snapshot = {
+                "lat": lat, "lon": lon, "education_level": education_level, "availability": availability,
+                "status": status, "tags": tags or [], "score": score
+            }
+            for key, (count, score_sum, weight_sum) in contributions(snapshot).items():
+                total = totals.setdefault(key, [0, 0.0, 0.0])
+                total[0] += count
+                total[1] += score_sum
+                total[2] += weight_sum
+
+        db.query(StatsAggregate).delete()
+        db.bulk_insert_mappings(StatsAggregate, [
+            {"dimension": dimension, "key": key, "count": count, "score_sum": score_sum, "weight_sum": weight_sum}
+            for (dimension, key), (count, score_sum, weight_sum) in totals.items()
+        ] + [{"dimension": BUILT_MARKER[0], "key": BUILT_MARKER[1], "count": 0, "score_sum": 0.0, "weight_sum": 0.0}])
+        db.commit()
+        logger.info(f"Stats aggregates rebuilt with {len(totals)} rows")
+
+    def invalidate(self, db: Session):
+        """Drop all aggregates (caller commits); the next read rebuilds them"""
+        db.query(StatsAggregate).delete()
+
+    def apply(self, db: Session, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]):
+        """
+        Apply the change of one civilian from before to after (snapshots from
+        profile_snapshot, None for absent) to the aggregates. Does not commit.
+        """
+        self.apply_many(db, [(before, after)])
+
+    def apply_many(self, db: Session, changes: Iterable[Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]]):
+        """apply() for several civilians, with one upsert per aggregate row touched. Does not commit."""
+        if not self.is_built(db):
+            return
+
+        delta: Dict[AggregateKey, List[float]] = {}
+        for before, after in changes:
+            for sign, snapshot in ((-1, before), (1, after)):
+                for key, (count, score_sum, weight_sum) in contributions(snapshot).items():
+                    change = delta.setdefault(key, [0, 0.0, 0.0])
+                    change[0] += sign * count
+                    change[1] += sign * score_sum
+                    change[2] += sign * weight_sum
+
+        for (dimension, key), (count, score_sum, weight_sum) in delta.items():
+            if count == 0 and score_sum == 0 and weight_sum == 0:
+                continue
+            # Single-statement upsert with a relative update, so concurrent writers
+            # neither overwrite each other's deltas nor race to create the same row
+            statement = sqlite_insert(StatsAggregate).values(
+                dimension=dimension, key=key, count=count, score_sum=score_sum, weight_sum=weight_sum
+            )
+            db.execute(statement.on_conflict_do_update(
+                index_elements=[StatsAggregate.dimension, StatsAggregate.key],
+                set_={
+                    "count": StatsAggregate.count + statement.excluded.count,
+                    "score_sum": StatsAggregate.score_sum + statement.excluded.score_sum,
+                    "weight_sum": StatsAggregate.weight_sum + statement.excluded.weight_sum
+                }
+            ))
+            if count < 0:
+                db.query(StatsAggregate).filter(
+                    StatsAggregate.dimension == dimension,
+                    StatsAggregate.key == key,
+                    StatsAggregate.count <= 0
+                ).delete(synchronize_session=False)
+
+    def rows(self, db: Session, dimension: str) -> List[Tuple[str, int, float, float]]:
+        """(key, count, score_sum, weight_sum) for one dimension"""
+        self.ensure_built(db)
+        return db.query(
+            StatsAggregate.key, StatsAggregate.count, StatsAggregate.score_sum, StatsAggregate.weight_sum
+        ).filter(StatsAggregate.dimension == dimension).all()
+
+    def summary(self, db: Session) -> Dict[str, Any]:
+        """/stats/summary computed from the aggregates"""
+        self.ensure_built(db)
+        grouped: Dict[str, Dict[str, Tuple[int, float]]] = {}
+        for dimension, key, count, score_sum in db.query(
+            StatsAggregate.dimension, StatsAggregate.key, StatsAggregate.count, StatsAggregate.score_sum
+        ).filter(StatsAggregate.dimension.in_(["total", "status", "availability", "education"])):
+            grouped.setdefault(dimension, {})[key] = (count, score_sum)
+
+        totals = grouped.get("total", {})
+        scored, score_sum = totals.get("scored", (0, 0.0))
+        availability_stats = {availability: 0 for availability in ["immediate", "24h", "48h", "unavailable"]}
+        for key, (count, _) in grouped.get("availability", {}).items():
+            if key in availability_stats:
+                availability_stats[key] = count
+        status_stats = {status: 0 for status in ["available", "requested", "allocated", "unavailable"]}
+        for key, (count, _) in grouped.get("status", {}).items():
+            if key in status_stats:
+                status_stats[key] = count
+
+        return {
+            "total_civilians": totals.get("all", (0, 0.0))[0],
+            "availability_breakdown": availability_stats,
+            "status_breakdown": status_stats,
+            "average_capability_score": round(score_sum / scored if scored else 0, 1),
+            "education_breakdown": {key: count for key, (count, _) in grouped.get("education", {}).items()}
+        }
+
+    def heatmap_cells(
+        self,
+        db: Session,
+        bbox: Optional[Tuple[float, float, float, float]] = None
+    ) -> List[Tuple[float, float, int, float]]:
+        """(lat, lon, count, weight_sum) per non-empty heatmap cell, optionally within a bbox"""
+        cells = []
+        for key, count, _, weight_sum in self.rows(db, "cell"):
+            lat, lon = cell_center(key)
+            if bbox is not None:
+                min_lat, min_lon, max_lat, max_lon = bbox
+                if not (min_lat <= lat <= max_lat and min_lon <= lon <= max_lon):
+                    continue
+            cells.append((lat, lon, count, weight_sum))
+        return cells
+
+# Global instance
+aggregates = AggregateStore()
@@ -0,0 +1,95 @@
+"""
+In-memory set of civilians with an active allocation, used for PII visibility checks
+"""
+import os
+import time
+import threading
+import logging
+from typing import Iterable, Optional, Set
+
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# Seconds before the set is reloaded, bounding how stale it gets when other workers allocate or complete
+DEFAULT_TTL = float(os.getenv("ALLOCATION_STATE_TTL", "10"))
+
+
+class AllocationState:
+    """
+    Ids of civilians that have at least one active allocation.
+
+    Loaded lazily from the allocations table on first use and kept current by
+    the allocate and complete paths, so PII checks need no query or session
+    of their own. Changes made by other processes are only seen on reload,
+    so the set is reloaded once it is older than ttl seconds. Seed and clear
+    invalidate it; it is reloaded on next use.
+    """
+
+    def __init__(self, ttl: float = DEFAULT_TTL):
+        self.ttl = ttl
+        self._allocated: Set[int] = set()
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._loaded_at = 0.0
+
+    def __len__(self) -> int:
+        return len(self._allocated)
+
+    def _current(self) -> bool:
+        return self._loaded and time.monotonic() - self._loaded_at < self.ttl
+
+    def ensure_loaded(self, db: Optional[Session] = None):
+        """Load the set from the database (on db, or a new session) if it is not loaded or has expired"""
+        if self._current():
+            return
+        # Allocate and complete mark under the lock, so no update is lost to a concurrent reload
+        with self._lock:
+            if self._current():
+                return
+            if db is None:
+                from db import get_db_session
+                with get_db_session() as session:
+                    self._load(session)
+            else:
+                self._load(db)
+
+    def _load(self, db: Session):
+        from models import Allocation
+
+        rows = db.query(Allocation.user_id).filter(Allocation.status == "active").distinct().all()
+        self._allocated = {user_id for user_id, in rows}
+        self._loaded = True
+        self._loaded_at = time.monotonic()
+        logger.debug(f"Allocation state loaded with {len(self._allocated)} allocated civilians")
+
+    def invalidate(self):
+        """Drop the set; it is reloaded on next use"""
+        with self._lock:
+            self._allocated = set()
+            self._loaded = False
+
+    def is_allocated(self, user_id: int, db: Optional[Session] = None) -> bool:
+        self.ensure_loaded(db)
+        return user_id in self._allocated
+
+    def allocated_among(self, user_ids: Iterable[int], db: Optional[Session] = None) -> Set[int]:
+        """The subset of user_ids with an active allocation"""
+        self.ensure_loaded(db)
+        with self._lock:
+            return self._allocated.intersection(user_ids)
+
+    def mark_allocated(self, user_ids: Iterable[int]):
+        """Record new active allocations (call after the commit)"""
+        with self._lock:
+            # Before loading there is nothing to update: the load reads them from the database
+            if self._loaded:
+                self._allocated.update(user_ids)
+
+    def mark_released(self, user_ids: Iterable[int]):
+        """Record civilians left without an active allocation (call after the commit)"""
+        with self._lock:
+            self._allocated.difference_update(user_ids)
+
+# Global instance
+allocation_state = AllocationState()
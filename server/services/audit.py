@@ -1,70 +1,344 @@
 """
 Audit logging service for tracking PII access and state changes
 """
+import os
+import queue
+import asyncio
+import threading
+import time
+import logging
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 from datetime import datetime
-from typing import Optional, Dict, Any
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from sqlalchemy import func, and_, or_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from models import AuditLog
-from db import get_db_session
+from db import get_audit_session
+from services.audit_chain import audit_chain
+
+logger = logging.getLogger(__name__)
+
+# async: every event is write-behind; pii: PII reads wait until their event is
+# committed; sync: every event waits
+DURABILITY_MODES = ("async", "pii", "sync")
+DEFAULT_DURABILITY = os.getenv("AUDIT_DURABILITY", "pii")
+DEFAULT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+DEFAULT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "200"))
+DEFAULT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "0.5"))
+
+# Attempts at appending a batch when another process extended the chain at the same time
+WRITE_ATTEMPTS = 5
+
+
+class AuditWriteError(RuntimeError):
+    """A durable audit event could not be persisted"""
+
+
+class _PendingEvent:
+    __slots__ = ("row", "done")
+
+    def __init__(self, row: Dict[str, Any], durable: bool):
+        self.row = row
+        # Resolved by the writer once the batch holding a durable event is committed
+        self.done: Optional[Future] = Future() if durable else None
+
+
+class AuditSink:
+    """
+    Write-behind buffer for audit events.
+
+    Events go into a bounded in-process queue and a background thread appends
+    them to the audit hash chain with one batched insert and transaction per
+    batch, when batch_size events are waiting or flush_interval has passed. A
+    durable event wakes the writer at once and its caller waits until the batch
+    holding it has been committed; durable events queued while the writer is
+    busy are committed together in its next batch. submit_many blocks the
+    calling thread for that wait, asubmit_many awaits it without blocking the
+    event loop. Enqueueing never waits: when the queue is full the caller
+    writes its events itself rather than dropping them.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable = get_audit_session,
+        maxsize: int = DEFAULT_QUEUE_SIZE,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        durable_timeout: float = 10.0
+    ):
+        self.session_factory = session_factory
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.durable_timeout = durable_timeout
+        self._queue: "queue.Queue[_PendingEvent]" = queue.Queue(maxsize)
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._write_lock = threading.RLock()
+        self._thread: Optional[threading.Thread] = None
+        self._counters = {"enqueued": 0, "written": 0, "batches": 0, "overflow": 0, "failed": 0}
+
+    def submit(self, row: Dict[str, Any], durable: bool = False):
+        """Queue one audit_logs row; with durable, return only once it is committed"""
+        self.submit_many([row], durable=durable)
+
+    def submit_many(self, rows: List[Dict[str, Any]], durable: bool = False):
+        """Queue several rows, waking the writer once; with durable, block until all are committed"""
+        events, overflow = self._enqueue(rows, durable)
+        self._write_overflow(overflow)
+        if durable:
+            deadline = time.monotonic() + self.durable_timeout
+            for event in events:
+                try:
+                    event.done.result(max(0.0, deadline - time.monotonic()))
+                except FutureTimeoutError:
+                    raise AuditWriteError("Timed out waiting for audit event to be persisted")
+
+    async def asubmit_many(self, rows: List[Dict[str, Any]], durable: bool = False):
+        """submit_many for async handlers: overflow writes and durable waits do not block the event loop"""
+        events, overflow = self._enqueue(rows, durable)
+        if overflow:
+            await run_in_threadpool(self._write_overflow, overflow)
+        if durable:
+            pending = [asyncio.wrap_future(event.done) for event in events]
+            # asyncio.wait does not cancel on timeout, so the writer can still resolve the futures
+            done, not_done = await asyncio.wait(pending, timeout=self.durable_timeout)
+            for future in done:
+                future.result()
+            if not_done:
+                raise AuditWriteError("Timed out waiting for audit event to be persisted")
+
+    def _enqueue(self, rows: List[Dict[str, Any]], durable: bool) -> Tuple[List[_PendingEvent], List[_PendingEvent]]:
+        """Queue rows without waiting for space; returns all events and those the full queue did not take"""
+        events = [_PendingEvent(row, durable) for row in rows]
+        overflow = []
+        for event in events:
+            try:
+                self._queue.put_nowait(event)
+            except queue.Full:
+                overflow.append(event)
+            else:
+                with self._lock:
+                    self._counters["enqueued"] += 1
+                    self._start_writer()
+        if durable or self._queue.qsize() >= self.batch_size:
+            self._wakeup.set()
+        if overflow:
+            with self._lock:
+                self._counters["overflow"] += len(overflow)
+        return events, overflow
+
+    def _write_overflow(self, events: List[_PendingEvent]):
+        # Back-pressure: write these events in the caller rather than lose them
+        for start in range(0, len(events), self.batch_size):
+            self._write(events[start:start + self.batch_size])
+
+    def _start_writer(self):
+        # Called with the lock held; the thread is started on first use
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def _drain(self) -> List[_PendingEvent]:
+        events = []
+        while True:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                return events
+
+    def flush(self):
+        """Write every queued event now; returns once they, and any batch in progress, are committed"""
+        with self._write_lock:
+            events = self._drain()
+            for start in range(0, len(events), self.batch_size):
+                self._write(events[start:start + self.batch_size])
+
+    def _write(self, events: List[_PendingEvent]):
+        error = None
+        for attempt in range(WRITE_ATTEMPTS):
+            try:
+                with self._write_lock, self.session_factory() as db:
+                    audit_chain.append(db, [event.row for event in events])
+                error = None
+                break
+            except IntegrityError as e:
+                # Another process appended the same ids first; rebuild the batch on the new head
+                error = e
+            except Exception as e:
+                error = e
+                break
+        if error is not None:
+            logger.error(f"Failed to write {len(events)} audit events: {error}")
+
+        with self._lock:
+            if error is None:
+                self._counters["written"] += len(events)
+                self._counters["batches"] += 1
+            else:
+                self._counters["failed"] += len(events)
+        for event in events:
+            if event.done is None:
+                continue
+            if error is None:
+                event.done.set_result(None)
+            else:
+                event.done.set_exception(AuditWriteError(f"Audit event could not be persisted: {error}"))
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and write counters"""
+        with self._lock:
+            return {"queue_depth": self._queue.qsize(), "batch_size": self.batch_size, **self._counters}
+
 
 class AuditService:
     """Service for audit logging"""
     
-    @staticmethod
-    def log_action(
+    def __init__(self, sink: Optional[AuditSink] = None, durability: str = DEFAULT_DURABILITY):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown audit durability mode: {durability}")
+        self.sink = sink or AuditSink()
+        self.durability = durability
+    
+    async def log_action(
+        self,
         actor: str,
         action: str,
         entity: str,
         entity_id: int,
         details: Optional[Dict[str, Any]] = None,
-        db: Optional[Session] = None
+        db: Optional[Session] = None,
+        durable: bool = False
     ):
-        """Log an audit action"""
-        
-        if db:
-            # Use provided session
-            audit_log = AuditLog(
-                actor=actor,
-                action=action,
-                entity=entity,
-                entity_id=entity_id,
-                details_json=details or {}
-            )
-            db.add(audit_log)
-            db.flush()
-        else:
-            # Create new session
-            with get_db_session() as db:
-                audit_log = AuditLog(
-                    actor=actor,
-                    action=action,
-                    entity=entity,
-                    entity_id=entity_id,
-                    details_json=details or {}
-                )
-                db.add(audit_log)
-                db.commit()
+        """
+        Log an audit action.
+
+        Events are written by the audit sink in their own transaction, whether
+        or not the caller passes its session (db is accepted for compatibility).
+        With durable, or in sync mode, this returns only once the event is
+        committed and raises AuditWriteError otherwise; the wait is awaited, so
+        other requests keep being served meanwhile.
+        """
+        await self.sink.asubmit_many([{
+            "actor": actor,
+            "action": action,
+            "entity": entity,
+            "entity_id": entity_id,
+            "ts": datetime.utcnow(),
+            "details_json": details or {}
+        }], durable=durable or self.durability == "sync")
+    
+    def flush(self):
+        """Write pending events now (before reading or clearing the audit table)"""
+        self.sink.flush()
+    
+    def query(
+        self,
+        actor: Optional[str] = None,
+        action: Optional[str] = None,
+        entity: Optional[str] = None,
+        entity_id: Optional[int] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        before: Optional[Tuple[datetime, int]] = None,
+        limit: int = 100
+    ) -> List[Dict[str, Any]]:
+        """
+        Audit events matching the filters, newest first.
+
+        Every filter combination is served by the ts, (actor, ts) or
+        (entity, entity_id, ts) index. before is the (ts, id) of the last event
+        of the previous page.
+        """
+        self.flush()
+        with get_audit_session() as db:
+            query = db.query(AuditLog)
+            if actor is not None:
+                query = query.filter(AuditLog.actor == actor)
+            if action is not None:
+                query = query.filter(AuditLog.action == action)
+            if entity is not None:
+                query = query.filter(AuditLog.entity == entity)
+            if entity_id is not None:
+                query = query.filter(AuditLog.entity_id == entity_id)
+            if since is not None:
+                query = query.filter(AuditLog.ts >= since)
+            if until is not None:
+                query = query.filter(AuditLog.ts < until)
+            if before is not None:
+                before_ts, before_id = before
+                query = query.filter(or_(
+                    AuditLog.ts < before_ts,
+                    and_(AuditLog.ts == before_ts, AuditLog.id < before_id)
+                ))
+            logs = query.order_by(AuditLog.ts.desc(), AuditLog.id.desc()).limit(limit).all()
+            return [
+                {
+                    "id": log.id,
+                    "actor": log.actor,
+                    "action": log.action,
+                    "entity": log.entity,
+                    "entity_id": log.entity_id,
+                    "ts": log.ts,
+                    "details": log.details_json
+                }
+                for log in logs
+            ]
     
-    @staticmethod
-    def log_pii_access(
+    def pii_access_summary(
+        self,
+        user_id: int,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None
+    ) -> List[Dict[str, Any]]:
+        """Who accessed a civilian's PII in a period: one row per actor, most recent first"""
+        self.flush()
+        with get_audit_session() as db:
+            query = db.query(
+                AuditLog.actor,
+                func.count(AuditLog.id),
+                func.sum(AuditLog.action == "reveal"),
+                func.min(AuditLog.ts),
+                func.max(AuditLog.ts)
+            ).filter(AuditLog.entity == "user_pii", AuditLog.entity_id == user_id)
+            if since is not None:
+                query = query.filter(AuditLog.ts >= since)
+            if until is not None:
+                query = query.filter(AuditLog.ts < until)
+            rows = query.group_by(AuditLog.actor).order_by(func.max(AuditLog.ts).desc()).all()
+            return [
+                {"actor": actor, "accesses": accesses, "reveals": int(reveals or 0), "first_access": first, "last_access": last}
+                for actor, accesses, reveals, first, last in rows
+            ]
+    
+    async def log_pii_access(
+        self,
         actor: str,
         user_id: int,
         access_type: str,  # "read" or "reveal"
         details: Optional[Dict[str, Any]] = None,
         db: Optional[Session] = None
     ):
-        """Log PII access"""
-        AuditService.log_action(
+        """Log PII access (persisted before returning unless durability is async)"""
+        await self.log_action(
             actor=actor,
             action=access_type,
             entity="user_pii",
             entity_id=user_id,
             details=details,
-            db=db
+            db=db,
+            durable=self.durability == "pii"
         )
     
-    @staticmethod
-    def log_allocation(
+    async def log_allocation(
+        self,
         actor: str,
         user_id: int,
         mission_code: str,
@@ -72,7 +346,7 @@ class AuditService:
         db: Optional[Session] = None
     ):
         """Log civilian allocation"""
-        AuditService.log_action(
+        await self.log_action(
             actor=actor,
             action="allocate",
             entity="allocation",
@@ -85,8 +359,56 @@ class AuditService:
             db=db
         )
     
-    @staticmethod
-    def log_request(
+    async def log_allocations(
+        self,
+        actor: str,
+        mission_code: str,
+        allocations: List[Tuple[int, int]],
+        db: Optional[Session] = None
+    ):
+        """Log a bulk allocation: one event per (allocation_id, user_id), submitted as one batch"""
+        timestamp = datetime.utcnow()
+        await self.sink.asubmit_many([
+            {
+                "actor": actor,
+                "action": "allocate",
+                "entity": "allocation",
+                "entity_id": allocation_id,
+                "ts": timestamp,
+                "details_json": {
+                    "user_id": user_id,
+                    "mission_code": mission_code,
+                    "bulk": True,
+                    "timestamp": timestamp.isoformat()
+                }
+            }
+            for allocation_id, user_id in allocations
+        ], durable=self.durability == "sync")
+    
+    async def log_allocation_completed(
+        self,
+        actor: str,
+        user_id: int,
+        mission_code: str,
+        allocation_id: int,
+        db: Optional[Session] = None
+    ):
+        """Log completion of a civilian allocation"""
+        await self.log_action(
+            actor=actor,
+            action="complete",
+            entity="allocation",
+            entity_id=allocation_id,
+            details={
+                "user_id": user_id,
+                "mission_code": mission_code,
+                "timestamp": datetime.utcnow().isoformat()
+            },
+            db=db
+        )
+    
+    async def log_request(
+        self,
         actor: str,
         request_id: int,
         request_type: str,
@@ -95,7 +417,7 @@ class AuditService:
         db: Optional[Session] = None
     ):
         """Log request creation"""
-        AuditService.log_action(
+        await self.log_action(
             actor=actor,
             action="create_request",
             entity="request",
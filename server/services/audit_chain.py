@@ -0,0 +1,378 @@
+"""
+Hash chain and Merkle checkpoints that make the audit log tamper-evident
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import select, insert, update, func
+from sqlalchemy.orm import Session
+
+from models import AuditLog, AuditCheckpoint
+
+logger = logging.getLogger(__name__)
+
+GENESIS_HASH = "0" * 64
+
+# Audit records per Merkle checkpoint
+DEFAULT_CHECKPOINT_SIZE = int(os.getenv("AUDIT_CHECKPOINT_SIZE", "1024"))
+
+# Rows fetched per round trip while verifying
+VERIFY_BATCH_SIZE = 10000
+
+# Compact, key-sorted JSON so equal records always serialise to the same bytes
+_canonical_json = json.JSONEncoder(sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode
+
+_audit_table = AuditLog.__table__
+_checkpoint_table = AuditCheckpoint.__table__
+
+
+def record_hash(
+    prev_hash: str,
+    record_id: int,
+    actor: str,
+    action: str,
+    entity: str,
+    entity_id: int,
+    ts: Optional[datetime],
+    details: Any
+) -> str:
+    """SHA-256 chaining a record to the hash of the record before it"""
+    payload = _canonical_json([record_id, actor, action, entity, entity_id, ts.isoformat() if ts else None, details])
+    return hashlib.sha256((prev_hash + payload).encode("utf-8")).hexdigest()
+
+
+def checkpoint_hash(
+    prev_checkpoint_hash: str,
+    first_id: int,
+    last_id: int,
+    event_count: int,
+    merkle_root: str,
+    chain_hash: str
+) -> str:
+    payload = f"{prev_checkpoint_hash}:{first_id}:{last_id}:{event_count}:{merkle_root}:{chain_hash}"
+    return hashlib.sha256(payload.encode("ascii")).hexdigest()
+
+
+def _merkle_leaf(record_hash_hex: str) -> bytes:
+    # Domain-separated from inner nodes so a node cannot pass for a leaf
+    return hashlib.sha256(b"\x00" + bytes.fromhex(record_hash_hex)).digest()
+
+
+def _merkle_parent(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(b"\x01" + left + right).digest()
+
+
+def _merkle_levels(record_hashes: List[str]) -> List[List[bytes]]:
+    """Every level of the tree, leaves first; an odd last node is promoted unchanged"""
+    level = [_merkle_leaf(value) for value in record_hashes]
+    levels = [level]
+    while len(level) > 1:
+        level = [
+            _merkle_parent(level[i], level[i + 1]) if i + 1 < len(level) else level[i]
+            for i in range(0, len(level), 2)
+        ]
+        levels.append(level)
+    return levels
+
+
+def merkle_root(record_hashes: List[str]) -> str:
+    """Merkle root over record hashes"""
+    return _merkle_levels(record_hashes)[-1][0].hex()
+
+
+def merkle_proof(record_hashes: List[str], index: int) -> List[Tuple[str, str]]:
+    """(side, sibling hash) pairs from the leaf at index up to the root"""
+    proof = []
+    for level in _merkle_levels(record_hashes)[:-1]:
+        sibling = index ^ 1
+        if sibling < len(level):
+            proof.append(("left" if sibling < index else "right", level[sibling].hex()))
+        index //= 2
+    return proof
+
+
+def verify_merkle_proof(record_hash_hex: str, proof: List[Tuple[str, str]], root: str) -> bool:
+    """Check a record hash against a checkpoint root in O(log n) hashes"""
+    node = _merkle_leaf(record_hash_hex)
+    for side, sibling in proof:
+        sibling_bytes = bytes.fromhex(sibling)
+        node = _merkle_parent(sibling_bytes, node) if side == "left" else _merkle_parent(node, sibling_bytes)
+    return node.hex() == root
+
+
+class AuditChain:
+    """
+    Hash chain over audit_logs with periodic Merkle checkpoints.
+
+    Every record stores the hash of the record before it and a hash over that
+    and its own content, so editing, removing or reordering a record breaks
+    every later link. Each block of checkpoint_size records gets a checkpoint
+    holding the Merkle root of its record hashes, itself chained to the
+    previous checkpoint; publishing the latest checkpoint hash anchors the
+    whole history. Verifying a range rehashes only the records in the blocks
+    it touches, and a single record is proven against its checkpoint with a
+    logarithmic Merkle path.
+    """
+
+    def __init__(self, checkpoint_size: int = DEFAULT_CHECKPOINT_SIZE):
+        self.checkpoint_size = checkpoint_size
+
+    def _head(self, db: Session) -> Tuple[int, str]:
+        row = db.execute(
+            select(_audit_table.c.id, _audit_table.c.hash).order_by(_audit_table.c.id.desc()).limit(1)
+        ).first()
+        if row is None:
+            return 0, GENESIS_HASH
+        return row.id, row.hash or GENESIS_HASH
+
+    def _last_checkpoint(self, db: Session) -> Tuple[int, str]:
+        row = db.execute(
+            select(_checkpoint_table.c.last_id, _checkpoint_table.c.checkpoint_hash)
+            .order_by(_checkpoint_table.c.last_id.desc()).limit(1)
+        ).first()
+        return (row.last_id, row.checkpoint_hash) if row else (0, GENESIS_HASH)
+
+    def append(self, db: Session, rows: List[Dict[str, Any]]):
+        """
+        Insert audit rows at the head of the chain (caller commits).
+
+        Ids are assigned here so they can be hashed; a concurrent writer in
+        another process that took the same ids makes the insert fail with an
+        IntegrityError and the caller retries.
+        """
+        head_id, head_hash = self._head(db)
+        chained = []
+        for row in rows:
+            head_id += 1
+            # Store exactly what a JSON round trip returns, so verification rehashes the same value
+            details = json.loads(json.dumps(row.get("details_json") or {}))
+            chained_hash = record_hash(
+                head_hash, head_id, row["actor"], row["action"], row["entity"], row["entity_id"], row["ts"], details
+            )
+            chained.append({**row, "id": head_id, "details_json": details, "prev_hash": head_hash, "hash": chained_hash})
+            head_hash = chained_hash
+
+        # executemany of one cached statement; compiling a fresh multi-row VALUES per batch costs far more
+        db.execute(insert(_audit_table), chained)
+        self.checkpoint(db, head_id)
+
+    def checkpoint(self, db: Session, head_id: Optional[int] = None):
+        """Add checkpoints for every complete block of records that has none yet (caller commits)"""
+        last_id, last_hash = self._last_checkpoint(db)
+        if head_id is None:
+            head_id = self._head(db)[0]
+        while head_id - last_id >= self.checkpoint_size:
+            block = db.execute(
+                select(_audit_table.c.id, _audit_table.c.hash)
+                .where(_audit_table.c.id > last_id).order_by(_audit_table.c.id).limit(self.checkpoint_size)
+            ).all()
+            if len(block) < self.checkpoint_size:
+                break  # Ids have gaps (rows from before the chain); wait for more records
+            fields = {
+                "first_id": block[0].id,
+                "last_id": block[-1].id,
+                "event_count": len(block),
+                "merkle_root": merkle_root([row.hash for row in block]),
+                "chain_hash": block[-1].hash,
+                "prev_checkpoint_hash": last_hash
+            }
+            fields["checkpoint_hash"] = checkpoint_hash(
+                last_hash, fields["first_id"], fields["last_id"], fields["event_count"],
+                fields["merkle_root"], fields["chain_hash"]
+            )
+            db.execute(insert(_checkpoint_table).values(**fields))
+            last_id, last_hash = fields["last_id"], fields["checkpoint_hash"]
+
+    def backfill(self, db: Session) -> int:
+        """Chain records written before hashing existed, in id order, and checkpoint them; returns the count"""
+        first_unhashed = db.execute(select(func.min(_audit_table.c.id)).where(_audit_table.c.hash.is_(None))).scalar()
+        if first_unhashed is None:
+            return 0
+        previous = db.execute(
+            select(_audit_table.c.hash).where(_audit_table.c.id < first_unhashed)
+            .order_by(_audit_table.c.id.desc()).limit(1)
+        ).scalar()
+        head_hash = previous or GENESIS_HASH
+
+        count = 0
+        rows = db.execute(
+            select(_audit_table).where(_audit_table.c.id >= first_unhashed).order_by(_audit_table.c.id)
+        ).all()
+        for row in rows:
+            if row.hash is None:
+                chained_hash = record_hash(
+                    head_hash, row.id, row.actor, row.action, row.entity, row.entity_id, row.ts, row.details_json
+                )
+                db.execute(
+                    update(_audit_table).where(_audit_table.c.id == row.id)
+                    .values(prev_hash=head_hash, hash=chained_hash)
+                )
+                head_hash = chained_hash
+                count += 1
+            else:
+                head_hash = row.hash
+        self.checkpoint(db)
+        logger.info(f"Hash-chained {count} audit records written before the chain existed")
+        return count
+
+    def _block_bounds(self, db: Session, record_id: int) -> Optional[Tuple[int, int]]:
+        row = db.execute(
+            select(_checkpoint_table.c.first_id, _checkpoint_table.c.last_id)
+            .where(_checkpoint_table.c.last_id >= record_id).order_by(_checkpoint_table.c.last_id).limit(1)
+        ).first()
+        return (row.first_id, row.last_id) if row and row.first_id <= record_id else None
+
+    def verify(self, db: Session, first_id: Optional[int] = None, last_id: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Recompute the chain and checkpoints over an id range (default: everything).
+
+        The range is widened to whole checkpoint blocks so their Merkle roots
+        can be recomputed; records outside it are not read, except the hash of
+        the record just before it, which anchors the first link.
+        """
+        started = time.perf_counter()
+        if first_id is not None:
+            bounds = self._block_bounds(db, first_id)
+            first_id = bounds[0] if bounds else first_id
+        if last_id is not None:
+            bounds = self._block_bounds(db, last_id)
+            last_id = bounds[1] if bounds else last_id
+
+        conditions = []
+        if first_id is not None:
+            conditions.append(_audit_table.c.id >= first_id)
+        if last_id is not None:
+            conditions.append(_audit_table.c.id <= last_id)
+
+        expected_prev = GENESIS_HASH
+        if first_id is not None:
+            expected_prev = db.execute(
+                select(_audit_table.c.hash).where(_audit_table.c.id < first_id)
+                .order_by(_audit_table.c.id.desc()).limit(1)
+            ).scalar() or GENESIS_HASH
+
+        checkpoint_conditions = []
+        if first_id is not None:
+            checkpoint_conditions.append(_checkpoint_table.c.first_id >= first_id)
+        if last_id is not None:
+            checkpoint_conditions.append(_checkpoint_table.c.last_id <= last_id)
+        checkpoints = db.execute(
+            select(_checkpoint_table).where(*checkpoint_conditions).order_by(_checkpoint_table.c.last_id)
+        ).all()
+        expected_checkpoint_prev = GENESIS_HASH
+        if checkpoints:
+            expected_checkpoint_prev = db.execute(
+                select(_checkpoint_table.c.checkpoint_hash)
+                .where(_checkpoint_table.c.last_id < checkpoints[0].first_id)
+                .order_by(_checkpoint_table.c.last_id.desc()).limit(1)
+            ).scalar() or GENESIS_HASH
+
+        result: Dict[str, Any] = {"ok": True, "first_id": None, "last_id": None, "records": 0, "checkpoints": 0, "error": None}
+
+        def fail(record_id: int, message: str):
+            result.update(ok=False, failed_id=record_id, error=message)
+
+        checkpoint_index = 0
+        # Rows from the first id of the next checkpoint on are collected as Merkle leaves
+        next_block_first = checkpoints[0].first_id if checkpoints else None
+        block_hashes: List[str] = []
+        records = 0
+        record_id = None
+        query = select(
+            _audit_table.c.id, _audit_table.c.actor, _audit_table.c.action, _audit_table.c.entity,
+            _audit_table.c.entity_id, _audit_table.c.ts, _audit_table.c.details_json,
+            _audit_table.c.prev_hash, _audit_table.c.hash
+        ).where(*conditions).order_by(_audit_table.c.id)
+        rows = db.execute(query.execution_options(yield_per=VERIFY_BATCH_SIZE)).tuples()
+        for record_id, actor, action, entity, entity_id, ts, details, prev_hash, stored_hash in rows:
+            if records == 0:
+                result["first_id"] = record_id
+            records += 1
+            if prev_hash != expected_prev:
+                fail(record_id, "record is not linked to the record before it")
+                break
+            if record_hash(prev_hash, record_id, actor, action, entity, entity_id, ts, details) != stored_hash:
+                fail(record_id, "record content does not match its hash")
+                break
+            expected_prev = stored_hash
+
+            if next_block_first is not None and record_id >= next_block_first:
+                block_hashes.append(stored_hash)
+                checkpoint = checkpoints[checkpoint_index]
+                if record_id == checkpoint.last_id:
+                    recomputed = checkpoint_hash(
+                        checkpoint.prev_checkpoint_hash, checkpoint.first_id, checkpoint.last_id,
+                        checkpoint.event_count, checkpoint.merkle_root, checkpoint.chain_hash
+                    )
+                    if (
+                        checkpoint.prev_checkpoint_hash != expected_checkpoint_prev
+                        or recomputed != checkpoint.checkpoint_hash
+                        or checkpoint.chain_hash != stored_hash
+                        or len(block_hashes) != checkpoint.event_count
+                        or merkle_root(block_hashes) != checkpoint.merkle_root
+                    ):
+                        fail(record_id, f"checkpoint {checkpoint.id} does not match its records")
+                        break
+                    expected_checkpoint_prev = checkpoint.checkpoint_hash
+                    result["checkpoints"] += 1
+                    checkpoint_index += 1
+                    next_block_first = checkpoints[checkpoint_index].first_id if checkpoint_index < len(checkpoints) else None
+                    block_hashes = []
+        result["records"] = records
+        result["last_id"] = record_id
+
+        if result["ok"] and checkpoint_index < len(checkpoints):
+            fail(checkpoints[checkpoint_index].last_id, f"records of checkpoint {checkpoints[checkpoint_index].id} are missing")
+
+        seconds = time.perf_counter() - started
+        result["head_checkpoint_hash"] = self._last_checkpoint(db)[1]
+        result["seconds"] = round(seconds, 3)
+        result["records_per_second"] = round(result["records"] / seconds) if seconds > 0 else None
+        return result
+
+    def verify_time_range(self, db: Session, since: Optional[datetime] = None, until: Optional[datetime] = None) -> Dict[str, Any]:
+        """Verify the records logged in [since, until)"""
+        conditions = []
+        if since is not None:
+            conditions.append(_audit_table.c.ts >= since)
+        if until is not None:
+            conditions.append(_audit_table.c.ts < until)
+        first_id, last_id = db.execute(
+            select(func.min(_audit_table.c.id), func.max(_audit_table.c.id)).where(*conditions)
+        ).one()
+        if first_id is None:
+            return {"ok": True, "first_id": None, "last_id": None, "records": 0, "checkpoints": 0, "error": None,
+                    "head_checkpoint_hash": self._last_checkpoint(db)[1], "seconds": 0.0, "records_per_second": None}
+        return self.verify(db, first_id, last_id)
+
+    def inclusion_proof(self, db: Session, record_id: int) -> Optional[Dict[str, Any]]:
+        """Merkle path proving a record belongs to its checkpoint, or None if it is not checkpointed yet"""
+        bounds = self._block_bounds(db, record_id)
+        if bounds is None:
+            return None
+        checkpoint = db.execute(select(_checkpoint_table).where(_checkpoint_table.c.last_id == bounds[1])).one()
+        block = db.execute(
+            select(_audit_table.c.id, _audit_table.c.hash)
+            .where(_audit_table.c.id >= bounds[0], _audit_table.c.id <= bounds[1]).order_by(_audit_table.c.id)
+        ).all()
+        ids = [row.id for row in block]
+        if record_id not in ids:
+            return None
+        index = ids.index(record_id)
+        hashes = [row.hash for row in block]
+        return {
+            "record_id": record_id,
+            "record_hash": hashes[index],
+            "checkpoint_id": checkpoint.id,
+            "merkle_root": checkpoint.merkle_root,
+            "checkpoint_hash": checkpoint.checkpoint_hash,
+            "proof": merkle_proof(hashes, index)
+        }
+
+# Global instance
+audit_chain = AuditChain()
@@ -0,0 +1,59 @@
+"""
+Small in-process caches shared by the read-heavy endpoints
+"""
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+_data_version = 0
+_version_lock = threading.Lock()
+
+def data_version() -> int:
+    """Current version of civilian data; changes whenever profiles or allocations change"""
+    return _data_version
+
+def bump_data_version() -> int:
+    """Mark cached derived data as stale (called on submit, allocate, seed and clear)"""
+    global _data_version
+    with _version_lock:
+        _data_version += 1
+        return _data_version
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after a fixed time-to-live"""
+
+    def __init__(self, maxsize: int = 128, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return cached value or None if missing/expired"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        """Store value, evicting the least recently used entry when full"""
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        """Drop all entries"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -0,0 +1,59 @@
+"""
+Column-oriented, dictionary-encoded search results for map clients
+"""
+from typing import Dict, Iterable, List, Tuple
+
+from schemas import CompactSearchResults
+
+# (user_id, lat, lon, score, status, availability, education_level); tags and skills are left to /search/detail
+CompactRow = Tuple[int, float, float, float, str, str, str]
+
+# Approximate locations are jittered by ~1 km, so metre precision is noise
+COORDINATE_DECIMALS = 5
+
+
+class DictionaryEncoder:
+    """Maps repeated strings to small integer codes, in order of first appearance"""
+
+    def __init__(self):
+        self.values: List[str] = []
+        self._codes: Dict[str, int] = {}
+
+    def encode(self, value: str) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self._codes[value] = code
+            self.values.append(value)
+        return code
+
+
+def build_compact_results(rows: Iterable[CompactRow]) -> CompactSearchResults:
+    """Pack result rows into parallel arrays with dictionary-encoded strings"""
+    user_ids, lats, lons, scores = [], [], [], []
+    statuses, availabilities, education_levels = [], [], []
+    status_codes = DictionaryEncoder()
+    availability_codes = DictionaryEncoder()
+    education_codes = DictionaryEncoder()
+
+    for user_id, lat, lon, score, status, availability, education_level in rows:
+        user_ids.append(user_id)
+        lats.append(round(lat, COORDINATE_DECIMALS))
+        lons.append(round(lon, COORDINATE_DECIMALS))
+        scores.append(round(float(score or 0.0), 1))
+        statuses.append(status_codes.encode(status))
+        availabilities.append(availability_codes.encode(availability))
+        education_levels.append(education_codes.encode(education_level))
+
+    return CompactSearchResults(
+        user_ids=user_ids,
+        lats=lats,
+        lons=lons,
+        scores=scores,
+        statuses=statuses,
+        availabilities=availabilities,
+        education_levels=education_levels,
+        status_values=status_codes.values,
+        availability_values=availability_codes.values,
+        education_values=education_codes.values
+    )
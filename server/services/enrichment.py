@@ -0,0 +1,186 @@
+"""
+Background LLM enrichment of submitted profiles
+"""
+import os
+import queue
+import threading
+import time
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+from db import get_db_session
+from models import Profile, Resource
+from services.tagger import tagger
+from services.posting_index import posting_index
+from services.cache import bump_data_version
+from services.aggregates import aggregates, profile_snapshot
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = int(os.getenv("LLM_ENRICHMENT_WORKERS", "2"))
+DEFAULT_QUEUE_SIZE = int(os.getenv("LLM_ENRICHMENT_QUEUE_SIZE", "1000"))
+
+
+class EnrichmentQueue:
+    """
+    Queue of profiles waiting for LLM tag extraction.
+
+    Submission stores the rule-based tags immediately and enqueues the profile;
+    a small pool of worker threads (the bounded concurrency against the model
+    host) runs the extraction and patches tags_json and capability_score.
+    Repeated submissions of a profile that is still waiting are coalesced, and
+    workers always enrich the latest stored free_text.
+    """
+
+    def __init__(
+        self,
+        workers: int = DEFAULT_WORKERS,
+        maxsize: int = DEFAULT_QUEUE_SIZE,
+        session_factory: Callable = get_db_session
+    ):
+        self.workers = max(1, workers)
+        self.session_factory = session_factory
+        self._queue: "queue.Queue[int]" = queue.Queue(maxsize)
+        self._pending: Dict[int, float] = {}  # user_id -> enqueue time
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._in_flight = 0
+        self._counters = {"enqueued": 0, "coalesced": 0, "dropped": 0, "processed": 0, "updated": 0, "failed": 0}
+        self._last_lag = 0.0
+        self._total_lag = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return tagger.llm_tagger is not None
+
+    def enqueue(self, user_id: int) -> bool:
+        """Schedule a profile for enrichment; returns False if it was not queued"""
+        if not self.enabled:
+            return False
+        with self._lock:
+            if user_id in self._pending:
+                self._counters["coalesced"] += 1
+                return True
+            try:
+                self._queue.put_nowait(user_id)
+            except queue.Full:
+                self._counters["dropped"] += 1
+                logger.warning(f"Enrichment queue full, profile of user {user_id} keeps rule-based tags")
+                return False
+            self._pending[user_id] = time.monotonic()
+            self._counters["enqueued"] += 1
+            self._start_workers()
+        return True
+
+    def _start_workers(self):
+        # Called with the lock held; threads are started on first use
+        self._threads = [thread for thread in self._threads if thread.is_alive()]
+        for index in range(len(self._threads), self.workers):
+            thread = threading.Thread(target=self._run, name=f"llm-enrichment-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _run(self):
+        while True:
+            user_id = self._queue.get()
+            with self._lock:
+                enqueued_at = self._pending.pop(user_id, time.monotonic())
+                self._in_flight += 1
+            try:
+                updated = self._enrich(user_id)
+                outcome = "updated" if updated else None
+            except Exception as e:
+                logger.warning(f"LLM enrichment of user {user_id} failed: {e}")
+                outcome = "failed"
+            finally:
+                lag = time.monotonic() - enqueued_at
+                with self._lock:
+                    self._in_flight -= 1
+                    self._counters["processed"] += 1
+                    if outcome:
+                        self._counters[outcome] += 1
+                    self._last_lag = lag
+                    self._total_lag += lag
+                self._queue.task_done()
+
+    def _enrich(self, user_id: int) -> bool:
+        """Extract LLM tags for a profile and store them; returns True if the profile changed"""
+        with self.session_factory() as db:
+            profile = db.query(Profile).filter(Profile.user_id == user_id).first()
+            if not profile or not profile.free_text:
+                return False
+            free_text = profile.free_text
+            context = {
+                "education_level": profile.education_level,
+                "skills": profile.skills or [],
+                "availability": profile.availability,
+                "industry": profile.industry
+            }
+
+        # The slow call runs without holding a database session
+        llm_tags = tagger.llm_tagger.extract_tags(free_text, context)
+
+        with self.session_factory() as db:
+            profile = db.query(Profile).filter(Profile.user_id == user_id).first()
+            if not profile or profile.free_text != free_text:
+                # Resubmitted meanwhile; the newer submission has its own job
+                return False
+            features = profile.features_json
+            if not tagger.features_current(features):
+                # Stale or legacy features are rebuilt with the civilian's resources, as a retag does
+                resources = [
+                    {
+                        "category": resource.category,
+                        "subtype": resource.subtype,
+                        "quantity": resource.quantity,
+                        "specs": resource.specs_json or {}
+                    }
+                    for resource in db.query(Resource).filter(Resource.user_id == user_id)
+                ]
+                features = tagger.build_features(profile.education_level, profile.skills or [], free_text, resources)
+                profile.features_json = features
+            tags, score = tagger.generate_tags_and_score(
+                education_level=profile.education_level,
+                skills=profile.skills or [],
+                free_text=free_text,
+                availability=profile.availability,
+                industry=profile.industry,
+                features=features,
+                llm_tags=llm_tags
+            )
+            if tags == profile.tags_json and score == profile.capability_score:
+                return False
+            before = profile_snapshot(profile.user, profile)
+            profile.tags_json = tags
+            profile.capability_score = score
+            aggregates.apply(db, before, profile_snapshot(profile.user, profile))
+            skills = profile.skills
+
+        posting_index.update(user_id, tags, skills, free_text)
+        bump_data_version()
+        return True
+
+    def join(self):
+        """Block until every queued profile has been processed"""
+        self._queue.join()
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, lag and outcome counters"""
+        now = time.monotonic()
+        with self._lock:
+            oldest: Optional[float] = min(self._pending.values()) if self._pending else None
+            processed = self._counters["processed"]
+            return {
+                "enabled": self.enabled,
+                "workers": self.workers,
+                "queue_depth": self._queue.qsize(),
+                "in_flight": self._in_flight,
+                "oldest_pending_seconds": round(now - oldest, 3) if oldest is not None else 0.0,
+                "last_lag_seconds": round(self._last_lag, 3),
+                "avg_lag_seconds": round(self._total_lag / processed, 3) if processed else 0.0,
+                **self._counters,
+                "llm": tagger.llm_tagger.health_status() if self.enabled else None
+            }
+
+# Global instance
+enrichment_queue = EnrichmentQueue()
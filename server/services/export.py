@@ -0,0 +1,293 @@
+"""
+Streaming data exports that never hold the whole dataset in memory
+"""
+import io
+import os
+import csv
+import json
+import zlib
+import shutil
+import zipfile
+from datetime import date, datetime
+from contextlib import nullcontext
+from typing import Any, Dict, Generator, Iterator, Optional
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from db import get_audit_session
+from models import User, Profile, Resource, Request, Allocation, AuditLog
+
+# pyarrow is in requirements.txt; the import stays guarded so an install
+# without it still serves the CSV and NDJSON exports (Parquet returns 501)
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# Rows fetched from the database cursor per round trip
+EXPORT_BATCH_SIZE = 1000
+
+# NDJSON export order and the columns that say when a row last changed
+NDJSON_TABLES = {
+    "users": (User, ("created_at",)),
+    "profiles": (Profile, ("last_updated",)),
+    "resources": (Resource, ("last_updated",)),
+    "requests": (Request, ("updated_at", "created_at")),
+    "allocations": (Allocation, ("created_at", "completed_at")),
+    "audit_logs": (AuditLog, ("ts",))
+}
+
+CSV_COLUMNS = ["user_id", "full_name", "education_level", "availability", "capability_score", "tags", "lat", "lon", "status"]
+
+
+class ChunkWriter:
+    """
+    Text buffer that is drained into (optionally gzip-compressed) byte chunks.
+
+    The same StringIO is reused for every chunk, so memory stays bounded by the
+    chunk size whatever the export size.
+    """
+
+    def __init__(self, gzip: bool = False):
+        self.buffer = io.StringIO()
+        # wbits=31 writes a gzip container rather than a raw zlib stream
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+
+    def drain(self) -> bytes:
+        data = self.buffer.getvalue().encode("utf-8")
+        self.buffer.seek(0)
+        self.buffer.truncate(0)
+        return self._compressor.compress(data) if self._compressor else data
+
+    def finish(self) -> bytes:
+        data = self.drain()
+        return data + self._compressor.flush() if self._compressor else data
+
+
+def stream_profiles_csv(db: Session, gzip: bool = False, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[bytes]:
+    """Yield the profile CSV export in chunks of about batch_size rows"""
+    out = ChunkWriter(gzip)
+    writer = csv.writer(out.buffer, lineterminator="\n")
+    writer.writerow(CSV_COLUMNS)
+
+    query = db.query(
+        User.id, User.full_name, Profile.education_level, Profile.availability,
+        Profile.capability_score, Profile.tags_json, User.lat, User.lon, Profile.status
+    ).join(Profile, User.id == Profile.user_id).order_by(User.id).yield_per(batch_size)
+
+    pending = 0
+    for user_id, full_name, education_level, availability, score, tags, lat, lon, status in query:
+        writer.writerow([user_id, full_name, education_level, availability, score, ",".join(tags or []), lat, lon, status])
+        pending += 1
+        if pending >= batch_size:
+            chunk = out.drain()
+            if chunk:
+                yield chunk
+            pending = 0
+
+    chunk = out.finish()
+    if chunk:
+        yield chunk
+
+
+def _json_default(value: Any):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialise {type(value).__name__}")
+
+
+def _stream_table(
+    db: Session,
+    out: ChunkWriter,
+    name: str,
+    model,
+    timestamp_columns: tuple,
+    resume_table: Optional[str],
+    after_id: int,
+    since: Optional[datetime],
+    batch_size: int
+) -> Generator[bytes, None, int]:
+    """Write one table's NDJSON lines to out, yielding full chunks; returns the row count"""
+    columns = list(model.__table__.columns)
+    query = db.query(*columns)
+    if name == resume_table and after_id:
+        query = query.filter(model.id > after_id)
+    if since is not None:
+        query = query.filter(or_(*(getattr(model, column) >= since for column in timestamp_columns)))
+
+    count = 0
+    for row in query.order_by(model.id).yield_per(batch_size):
+        record = dict(zip((column.name for column in columns), row))
+        out.buffer.write(json.dumps({"table": name, "record": record}, default=_json_default, ensure_ascii=False))
+        out.buffer.write("\n")
+        count += 1
+        if count % batch_size == 0:
+            chunk = out.drain()
+            if chunk:
+                yield chunk
+    return count
+
+
+def stream_ndjson(
+    db: Session,
+    resume_table: Optional[str] = None,
+    after_id: int = 0,
+    since: Optional[datetime] = None,
+    gzip: bool = False,
+    batch_size: int = EXPORT_BATCH_SIZE,
+    audit_db: Optional[Session] = None
+) -> Iterator[bytes]:
+    """
+    Yield every table as newline-delimited JSON, one {"table", "record"} line per row.
+
+    Tables are exported in NDJSON_TABLES order and rows in id order, so a client
+    that lost the connection resumes with the table and id of the last line it
+    received. With since, only rows created or changed at or after that time
+    are exported. A final {"table": "_meta"} line carries the per-table counts
+    so a truncated download can be detected. Audit events are read from
+    audit_db, or from a new audit database session when it is not given.
+    """
+    out = ChunkWriter(gzip)
+    tables = list(NDJSON_TABLES)
+    if resume_table is not None:
+        tables = tables[tables.index(resume_table):]
+
+    counts: Dict[str, int] = {}
+    for name in tables:
+        model, timestamp_columns = NDJSON_TABLES[name]
+        # Audit events live in their own database
+        if model is not AuditLog:
+            session_context = nullcontext(db)
+        else:
+            session_context = nullcontext(audit_db) if audit_db is not None else get_audit_session()
+        with session_context as session:
+            counts[name] = yield from _stream_table(
+                session, out, name, model, timestamp_columns, resume_table, after_id, since, batch_size
+            )
+        chunk = out.drain()
+        if chunk:
+            yield chunk
+
+    out.buffer.write(json.dumps({
+        "table": "_meta",
+        "exported_at": datetime.utcnow().isoformat(),
+        "since": since.isoformat() if since else None,
+        "counts": counts
+    }))
+    out.buffer.write("\n")
+    yield out.finish()
+
+
+def _coarse_coordinate(value: float) -> float:
+    # About 100 m, enough for coverage studies without pinpointing homes
+    return round(value, 3)
+
+
+def _parquet_tables() -> Dict[str, tuple]:
+    """
+    Parquet snapshot layout: table -> (model, [(column, output name, arrow type, converter)]).
+    Names, birth dates, addresses, national id hashes and free text are left out.
+    """
+    text = pa.string()
+    timestamp = pa.timestamp("us")
+    json_text = lambda value: json.dumps(value, ensure_ascii=False)
+    return {
+        "users": (User, [
+            ("id", "id", pa.int64(), None),
+            ("lat", "lat", pa.float64(), _coarse_coordinate),
+            ("lon", "lon", pa.float64(), _coarse_coordinate),
+            ("created_at", "created_at", timestamp, None)
+        ]),
+        "profiles": (Profile, [
+            ("id", "id", pa.int64(), None),
+            ("user_id", "user_id", pa.int64(), None),
+            ("education_level", "education_level", text, None),
+            ("industry", "industry", text, None),
+            ("skills", "skills", pa.list_(text), None),
+            ("availability", "availability", text, None),
+            ("capability_score", "capability_score", pa.float64(), None),
+            ("tags_json", "tags", pa.list_(text), None),
+            ("skill_levels", "skill_levels", text, json_text),
+            ("status", "status", text, None),
+            ("last_updated", "last_updated", timestamp, None)
+        ]),
+        "resources": (Resource, [
+            ("id", "id", pa.int64(), None),
+            ("user_id", "user_id", pa.int64(), None),
+            ("category", "category", text, None),
+            ("subtype", "subtype", text, None),
+            ("quantity", "quantity", pa.int64(), None),
+            ("specs_json", "specs", text, json_text),
+            ("available", "available", pa.bool_(), None),
+            ("last_updated", "last_updated", timestamp, None)
+        ]),
+        "allocations": (Allocation, [
+            ("id", "id", pa.int64(), None),
+            ("user_id", "user_id", pa.int64(), None),
+            ("resource_id", "resource_id", pa.int64(), None),
+            ("mission_code", "mission_code", text, None),
+            ("status", "status", text, None),
+            ("created_at", "created_at", timestamp, None),
+            ("completed_at", "completed_at", timestamp, None)
+        ])
+    }
+
+
+def write_parquet_table(db: Session, name: str, path: str, batch_size: int = EXPORT_BATCH_SIZE) -> int:
+    """Write one table to a Parquet file, a record batch per cursor batch; returns the row count"""
+    model, fields = _parquet_tables()[name]
+    schema = pa.schema([(output, arrow_type) for _, output, arrow_type, _ in fields])
+    query = db.query(*(getattr(model, column) for column, _, _, _ in fields)).order_by(model.id).yield_per(batch_size)
+
+    def flush(columns):
+        arrays = [pa.array(values, type=field.type) for values, field in zip(columns, schema)]
+        writer.write_batch(pa.record_batch(arrays, schema=schema))
+
+    count = 0
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        columns = [[] for _ in fields]
+        for row in query:
+            for values, value, (_, _, _, convert) in zip(columns, row, fields):
+                values.append(convert(value) if convert and value is not None else value)
+            count += 1
+            if count % batch_size == 0:
+                flush(columns)
+                columns = [[] for _ in fields]
+        if columns[0]:
+            flush(columns)
+    return count
+
+
+def build_parquet_snapshot(db: Session, directory: str, batch_size: int = EXPORT_BATCH_SIZE) -> str:
+    """Write every snapshot table as Parquet and bundle them into a zip in directory"""
+    zip_path = os.path.join(directory, "snapshot.zip")
+    counts = {}
+    # Parquet is already compressed, so the zip only stores the files
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_STORED) as archive:
+        for name in _parquet_tables():
+            path = os.path.join(directory, f"{name}.parquet")
+            counts[name] = write_parquet_table(db, name, path, batch_size)
+            archive.write(path, f"{name}.parquet")
+            os.remove(path)
+        archive.writestr("manifest.json", json.dumps({
+            "exported_at": datetime.utcnow().isoformat(),
+            "counts": counts
+        }))
+    return zip_path
+
+
+def stream_file(path: str, cleanup_directory: Optional[str] = None, chunk_size: int = 1 << 20) -> Iterator[bytes]:
+    """Yield a file in chunks, removing its temporary directory afterwards"""
+    try:
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        if cleanup_directory:
+            shutil.rmtree(cleanup_directory, ignore_errors=True)
@@ -0,0 +1,70 @@
+"""
+Full-text search over profile free_text, skills and education (SQLite FTS5)
+"""
+import re
+import weakref
+import logging
+from typing import Dict, List
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"[\w-]+")
+
+# bm25 column weights: free_text, skills, education_level
+COLUMN_WEIGHTS = (1.0, 2.0, 0.5)
+
+# Engines known to have the index; a missing index is probed again on the next
+# search, so one created after the first lookup is picked up
+_available: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+def fulltext_available(db: Session) -> bool:
+    """Whether the profiles_fts table exists in the session's database"""
+    bind = db.get_bind()
+    if bind.dialect.name != "sqlite":
+        return False
+    if _available.get(bind):
+        return True
+    try:
+        found = db.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'profiles_fts'"
+        )).first() is not None
+    except Exception as e:
+        logger.debug(f"Full-text index not available: {e}")
+        return False
+    if found:
+        _available[bind] = True
+    return found
+
+def build_match_query(terms: List[str]) -> str:
+    """
+    FTS5 MATCH expression: any of the terms, each as a phrase whose last word
+    is a prefix, so "drone" also finds "drones" and "dronepilot"
+    """
+    phrases = []
+    for term in terms:
+        words = TOKEN_PATTERN.findall(term.lower())
+        if words:
+            phrases.append('"' + " ".join(words) + '" *')
+    return " OR ".join(phrases)
+
+def search_profiles(db: Session, terms: List[str]) -> Dict[int, float]:
+    """
+    Return {user_id: relevance} for profiles matching any term, where relevance
+    is the negated BM25 score (higher is more relevant)
+    """
+    match = build_match_query(terms)
+    if not match:
+        return {}
+    rows = db.execute(
+        text(f"""
+            SELECT profiles.user_id, bm25(profiles_fts, {', '.join(str(w) for w in COLUMN_WEIGHTS)})
+            FROM profiles_fts
+            JOIN profiles ON profiles.id = profiles_fts.rowid
+            WHERE profiles_fts MATCH :match
+        """),
+        {"match": match}
+    ).all()
+    return {user_id: -rank for user_id, rank in rows}
@@ -0,0 +1,92 @@
+"""
+Deterministic privacy offsets for the approximate locations shown in search results
+"""
+import os
+import hmac
+import hashlib
+import threading
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Offsets are uniform in +-JITTER_DEGREES / 2 on each axis (~1 km)
+JITTER_DEGREES = 0.02
+
+DEFAULT_SECRET = os.getenv("PRIVACY_JITTER_SECRET", "")
+
+
+def derive_offset(user_id: int, secret: bytes = b"") -> Tuple[float, float]:
+    """
+    (lat_offset, lon_offset) of a civilian.
+
+    Without a secret this is the original MD5-of-id scheme, so existing map
+    positions do not move; with a secret the offsets are HMAC-SHA256 derived
+    and cannot be recomputed from the public user id.
+    """
+    if secret:
+        user_hash = hmac.new(secret, str(user_id).encode(), hashlib.sha256).hexdigest()
+    else:
+        user_hash = hashlib.md5(str(user_id).encode()).hexdigest()
+    lat_offset = (int(user_hash[:4], 16) / 65535.0 - 0.5) * JITTER_DEGREES
+    lon_offset = (int(user_hash[4:8], 16) / 65535.0 - 0.5) * JITTER_DEGREES
+    return lat_offset, lon_offset
+
+
+class LocationJitter:
+    """
+    Per-civilian location offsets, derived once and cached by user id.
+
+    An offset depends only on the user id and the key, not on the location, so
+    it stays valid when a civilian moves. Rotating the key drops every cached
+    offset at once; they are re-derived with the new key on next use.
+    """
+
+    def __init__(self, secret: str = DEFAULT_SECRET):
+        self._secret = secret.encode()
+        self._lock = threading.Lock()
+        # user_id -> (lat_offset, lon_offset); memory follows the ids seen, not the largest id
+        self._offsets: Dict[int, Tuple[float, float]] = {}
+
+    def offsets(self, user_ids: Iterable[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """Latitude and longitude offsets for user_ids, deriving any not cached yet"""
+        ids = [int(user_id) for user_id in user_ids]
+        if not ids:
+            return np.empty(0), np.empty(0)
+        with self._lock:
+            cached = self._offsets
+            for user_id in ids:
+                if user_id not in cached:
+                    cached[user_id] = derive_offset(user_id, self._secret)
+            pairs = np.array([cached[user_id] for user_id in ids], dtype=np.float64)
+        return pairs[:, 0], pairs[:, 1]
+
+    def approximate(
+        self,
+        user_ids: List[int],
+        lats: List[float],
+        lons: List[float]
+    ) -> Tuple[List[float], List[float]]:
+        """Approximate coordinates for a page of results"""
+        lat_offsets, lon_offsets = self.offsets(user_ids)
+        return (
+            (np.asarray(lats, dtype=np.float64) + lat_offsets).tolist(),
+            (np.asarray(lons, dtype=np.float64) + lon_offsets).tolist()
+        )
+
+    def rotate_key(self, secret: Optional[str]):
+        """Switch to a new key (empty for the MD5 scheme), moving every approximate location"""
+        with self._lock:
+            self._secret = (secret or "").encode()
+            self._offsets = {}
+        logger.info("Location jitter key rotated")
+
+    def clear(self):
+        """Drop cached offsets without changing the key"""
+        with self._lock:
+            self._offsets = {}
+
+# Global instance
+location_jitter = LocationJitter()
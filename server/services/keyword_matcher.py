@@ -0,0 +1,73 @@
+"""
+Aho-Corasick multi-pattern matcher used to find rule keywords in a single pass
+"""
+from collections import deque
+from typing import Dict, Iterable, List, Set
+
+
+class KeywordMatcher:
+    """
+    Finds every keyword occurring as a substring of a text in one scan.
+
+    Matching is case-sensitive; callers lowercase keywords and text. The cost
+    of a scan depends on the text length and number of hits, not on how many
+    keywords were compiled into the automaton.
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        # Trie stored as parallel lists indexed by state number
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[str]] = [[]]
+        self.keywords: Set[str] = set()
+
+        for keyword in keywords:
+            if keyword and keyword not in self.keywords:
+                self.keywords.add(keyword)
+                self._add(keyword)
+        self._build_failure_links()
+
+    def _add(self, keyword: str):
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append(keyword)
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                # Inherit matches that end at the failure state
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def find(self, text: str) -> Set[str]:
+        """Return the set of keywords that occur anywhere in text"""
+        found: Set[str] = set()
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found.update(output[state])
+        return found
+
+    def __len__(self) -> int:
+        return len(self.keywords)
@@ -0,0 +1,172 @@
+"""
+Persistent content-addressed cache of LLM tag extraction results
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import logging
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "./llm_cache.db")
+DEFAULT_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "50000"))
+# Hits refresh last_used at most this often per entry, so reads rarely write
+DEFAULT_TOUCH_INTERVAL = float(os.getenv("LLM_CACHE_TOUCH_INTERVAL", "300"))
+# Keys per IN (...) lookup, below SQLite's bound-parameter limit
+LOOKUP_CHUNK = 500
+
+
+def normalise_text(free_text: str) -> str:
+    """Case and whitespace differences do not change the extracted tags"""
+    return " ".join(free_text.lower().split())
+
+
+def cache_key(free_text: str, context: str, model: str, prompt_version: str) -> str:
+    """SHA-256 over everything that determines the model's answer"""
+    payload = json.dumps([normalise_text(free_text), context, model, prompt_version], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResultCache:
+    """
+    SQLite-file cache of extracted tags keyed by cache_key.
+
+    The file survives restarts and is shared by every worker process. When it
+    grows past max_entries the least recently used entries are evicted; use is
+    recorded with touch_interval resolution. The connection is opened on first
+    use so importing the module creates no file.
+
+    Every call does blocking file I/O; async callers run it in the threadpool.
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_CACHE_PATH,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        touch_interval: float = DEFAULT_TOUCH_INTERVAL
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.touch_interval = touch_interval
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._writes_since_trim = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        # Called with the lock held
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_tags (
+                    key TEXT PRIMARY KEY,
+                    tags TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_tags_last_used ON llm_tags(last_used)")
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key: str) -> Optional[List[str]]:
+        """Cached tags for a key, or None"""
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[str]]:
+        """Cached tags for every key that has them, in one lookup and at most one write"""
+        if not keys:
+            return {}
+        now = time.time()
+        found: Dict[str, List[str]] = {}
+        stale: List[str] = []
+        try:
+            with self._lock:
+                conn = self._connection()
+                unique = list(dict.fromkeys(keys))
+                for start in range(0, len(unique), LOOKUP_CHUNK):
+                    chunk = unique[start:start + LOOKUP_CHUNK]
+                    rows = conn.execute(
+                        f"SELECT key, tags, last_used FROM llm_tags WHERE key IN ({', '.join('?' * len(chunk))})",
+                        chunk
+                    ).fetchall()
+                    for key, tags, last_used in rows:
+                        found[key] = json.loads(tags)
+                        if now - last_used >= self.touch_interval:
+                            stale.append(key)
+                if stale:
+                    conn.executemany("UPDATE llm_tags SET last_used = ? WHERE key = ?", [(now, key) for key in stale])
+                    conn.commit()
+                hits = sum(1 for key in keys if key in found)
+                self.hits += hits
+                self.misses += len(keys) - hits
+        except sqlite3.Error as e:
+            logger.warning(f"LLM cache read failed: {e}")
+            return {}
+        return found
+
+    def set(self, key: str, tags: List[str], model: str):
+        """Store tags for a key, evicting least recently used entries past max_entries"""
+        self.set_many({key: tags}, model)
+
+    def set_many(self, entries: Dict[str, List[str]], model: str):
+        """Store tags for several keys in one transaction"""
+        if not entries:
+            return
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connection()
+                conn.executemany(
+                    "INSERT OR REPLACE INTO llm_tags (key, tags, model, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                    [(key, json.dumps(tags), model, now, now) for key, tags in entries.items()]
+                )
+                self._writes_since_trim += len(entries)
+                # Counting rows on every write is wasteful; trim in small batches
+                if self._writes_since_trim >= max(1, self.max_entries // 100):
+                    self._trim(conn)
+                conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"LLM cache write failed: {e}")
+
+    def _trim(self, conn: sqlite3.Connection):
+        self._writes_since_trim = 0
+        excess = conn.execute("SELECT COUNT(*) FROM llm_tags").fetchone()[0] - self.max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM llm_tags WHERE key IN (SELECT key FROM llm_tags ORDER BY last_used LIMIT ?)",
+                (excess,)
+            )
+            self.evictions += excess
+
+    def clear(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM llm_tags")
+            conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit rate and size counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            try:
+                entries = self._connection().execute("SELECT COUNT(*) FROM llm_tags").fetchone()[0]
+            except sqlite3.Error:
+                entries = None
+            return {
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions
+            }
@@ -4,18 +4,117 @@ Provides fallback to regex-based extraction when LLM is unavailable.
 """
 
 import json
+import asyncio
 import requests
+import httpx
 import re
+import time
+import threading
 import logging
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 from functools import lru_cache
+from starlette.concurrency import run_in_threadpool
+
+from .llm_cache import LLMResultCache, cache_key
 
 logger = logging.getLogger(__name__)
 
+# Bump when the prompts change so cached results from older prompts are not reused
+PROMPT_VERSION = "1"
+
+TAG_GUIDANCE = """PRIORITIZE these critical defense and infrastructure skills:
+- Drones & UAVs (drone pilot, FPV, autonomous systems, surveillance)
+- Automation & Robotics (PLC, SCADA, industrial automation, robotics)
+- Electrical & Power Systems (electrical work, power grid, generators, solar)
+- Mechanical Engineering (engines, hydraulics, machinery, repair)
+- Cybersecurity (network security, encryption, penetration testing)
+- Communications (radio, satellite, encryption, coordination)
+- Defense & Military (veteran, tactical, strategic, combat experience)
+- Surveillance & Intelligence (monitoring, reconnaissance, detection)
+
+ALSO include traditional emergency skills:
+- Medical (doctor, nurse, paramedic, first aid)
+- Technical (software, hardware, programming, engineering)
+- Logistics (supply chain, transport, coordination)
+- Construction (welding, building, infrastructure)
+- Leadership (management, coordination, command)
+- Experience level (senior, expert, certified, veteran)"""
+
+class CircuitBreaker:
+    """
+    Circuit breaker in front of the Ollama host.
+    
+    Closed: calls go through and the last health probe is trusted for health_ttl
+    seconds. Open: calls are refused until the backoff expires; the backoff doubles
+    each time the circuit opens again without an intervening success, up to
+    max_backoff (failures of calls already in flight while it is open do not count). Half-open: a single caller is
+    let through to probe the host, everyone else keeps getting refused until the
+    probe closes or re-opens the circuit.
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(self, health_ttl: float = 30.0, base_backoff: float = 5.0, max_backoff: float = 300.0):
+        self.health_ttl = health_ttl
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.checked_at: Optional[float] = None
+        self._lock = threading.Lock()
+    
+    def before_call(self) -> Optional[str]:
+        """
+        Decide how a caller may proceed: None to refuse, "probe" if the caller
+        must check health first, "call" if the cached health can be trusted.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self.state == self.OPEN:
+                if now < self.open_until:
+                    return None
+                self.state = self.HALF_OPEN
+                return "probe"
+            if self.state == self.HALF_OPEN:
+                # Another caller is already probing
+                return None
+            if self.checked_at is None or now - self.checked_at > self.health_ttl:
+                self.checked_at = now
+                return "probe"
+            return "call"
+    
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self.checked_at = time.monotonic()
+    
+    def record_failure(self):
+        with self._lock:
+            if self.state == self.OPEN:
+                # A call that was in flight when the circuit opened: same outage, no extra backoff step
+                return
+            self.consecutive_failures += 1
+            backoff = min(self.base_backoff * 2 ** (self.consecutive_failures - 1), self.max_backoff)
+            self.state = self.OPEN
+            self.open_until = time.monotonic() + backoff
+            logger.info(f"Ollama circuit open for {backoff:.0f}s after {self.consecutive_failures} failure(s)")
+    
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "retry_in_seconds": round(max(0.0, self.open_until - time.monotonic()), 1) if self.state == self.OPEN else 0.0
+            }
+
 class LLMTaggerService:
     """Service for intelligent tag extraction using local LLM (Ollama) with fallbacks."""
     
-    def __init__(self, ollama_url: str = None, model: str = "phi3:mini"):
+    def __init__(self, ollama_url: str = None, model: str = "phi3:mini", cache: Optional[LLMResultCache] = None):
         # Auto-detect if running in Docker and use appropriate URL
         if ollama_url is None:
             # Try to detect if we're in Docker by checking for common Docker environment indicators
@@ -41,6 +140,13 @@ class LLMTaggerService:
         self.model = model
         self.timeout = 10  # seconds
         
+        # Health of the model host, shared by all extraction calls
+        self.breaker = CircuitBreaker()
+        self.model_present = False
+        
+        # Extracted tags survive restarts so unchanged text never reaches the model twice
+        self.cache = cache if cache is not None else LLMResultCache()
+        
         # Defense, national security, and emergency coordination focused keywords
         self.emergency_keywords = {
             # Critical Infrastructure & Defense
@@ -69,27 +175,67 @@ class LLMTaggerService:
             "surveillance": ["surveillance", "monitoring", "observation", "intelligence", "reconnaissance", "tracking", "detection", "tarkkailu", "valvonta", "tiedustelu"]
         }
     
-    def is_ollama_available(self) -> bool:
-        """Check if Ollama service is available."""
+    def _probe(self) -> bool:
+        """
+        Single /api/tags round trip answering both "is Ollama up" and "is the model
+        pulled"; the result updates the circuit breaker.
+        """
         try:
-            response = requests.get(f"{self.ollama_url}/api/tags", timeout=2)
-            return response.status_code == 200
+            return self._record_probe(requests.get(f"{self.ollama_url}/api/tags", timeout=2))
         except Exception as e:
             logger.debug(f"Ollama not available: {e}")
+            self.breaker.record_failure()
             return False
     
-    def ensure_model_available(self) -> bool:
-        """Ensure the required model is available in Ollama."""
+    async def _aprobe(self, client: httpx.AsyncClient) -> bool:
+        """_probe on the pooled async client, without blocking the event loop"""
         try:
-            response = requests.get(f"{self.ollama_url}/api/tags", timeout=5)
-            if response.status_code == 200:
-                models = response.json().get("models", [])
-                model_names = [model.get("name", "") for model in models]
-                return any(self.model in name for name in model_names)
-            return False
+            return self._record_probe(await client.get("/api/tags", timeout=2))
         except Exception as e:
-            logger.debug(f"Could not check model availability: {e}")
+            logger.debug(f"Ollama not available: {e}")
+            self.breaker.record_failure()
+            return False
+    
+    def _record_probe(self, response) -> bool:
+        if response.status_code != 200:
+            self.breaker.record_failure()
+            return False
+        models = response.json().get("models", [])
+        model_names = [model.get("name", "") for model in models]
+        self.model_present = any(self.model in name for name in model_names)
+        self.breaker.record_success()
+        return True
+    
+    def is_ollama_available(self) -> bool:
+        """Check if Ollama service is available (probes at most once per health TTL)."""
+        decision = self.breaker.before_call()
+        if decision is None:
+            return False
+        if decision == "probe":
+            return self._probe()
+        return True
+    
+    async def ais_ollama_available(self, client: httpx.AsyncClient) -> bool:
+        """is_ollama_available for async callers, probing on their client"""
+        decision = self.breaker.before_call()
+        if decision is None:
             return False
+        if decision == "probe":
+            return await self._aprobe(client)
+        return True
+    
+    def ensure_model_available(self) -> bool:
+        """Ensure the required model is available in Ollama (from the last health probe)."""
+        return self.model_present
+    
+    def health_status(self) -> Dict[str, Any]:
+        """Circuit breaker state and model availability for monitoring"""
+        return {
+            **self.breaker.status(),
+            "model": self.model,
+            "model_present": self.model_present,
+            "cache": self.cache.stats()
+        }
     
     def pull_model(self) -> bool:
         """Pull the required model if not available."""
@@ -100,15 +246,18 @@ class LLMTaggerService:
                 json={"name": self.model},
                 timeout=300  # 5 minutes for model download
             )
-            return response.status_code == 200
+            if response.status_code == 200:
+                self.model_present = True
+                return True
+            return False
         except Exception as e:
             logger.error(f"Failed to pull model {self.model}: {e}")
+            self.breaker.record_failure()
             return False
     
-    def extract_tags_with_llm(self, free_text: str, context: Dict[str, Any] = None) -> List[str]:
-        """Extract meaningful tags using Ollama LLM."""
-        
-        # Build context for better tag extraction
+    @staticmethod
+    def _context_info(context: Optional[Dict[str, Any]]) -> str:
+        """Build context for better tag extraction"""
         context_info = ""
         if context:
             education = context.get("education_level", "")
@@ -117,47 +266,88 @@ class LLMTaggerService:
                 context_info += f"Education: {education}. "
             if skills:
                 context_info += f"Skills: {', '.join(skills[:5])}. "
-        
-        prompt = f"""Extract 3-5 meaningful tags from this civilian profile for defense and emergency coordination.
-
-{context_info}Profile text: "{free_text}"
+        return context_info
+    
+    def build_prompt(self, free_text: str, context: Dict[str, Any] = None) -> str:
+        """Prompt asking for the tags of a single profile"""
+        return f"""Extract 3-5 meaningful tags from this civilian profile for defense and emergency coordination.
 
-PRIORITIZE these critical defense and infrastructure skills:
-- Drones & UAVs (drone pilot, FPV, autonomous systems, surveillance)
-- Automation & Robotics (PLC, SCADA, industrial automation, robotics)
-- Electrical & Power Systems (electrical work, power grid, generators, solar)
-- Mechanical Engineering (engines, hydraulics, machinery, repair)
-- Cybersecurity (network security, encryption, penetration testing)
-- Communications (radio, satellite, encryption, coordination)
-- Defense & Military (veteran, tactical, strategic, combat experience)
-- Surveillance & Intelligence (monitoring, reconnaissance, detection)
+{self._context_info(context)}Profile text: "{free_text}"
 
-ALSO include traditional emergency skills:
-- Medical (doctor, nurse, paramedic, first aid)
-- Technical (software, hardware, programming, engineering)
-- Logistics (supply chain, transport, coordination)
-- Construction (welding, building, infrastructure)
-- Leadership (management, coordination, command)
-- Experience level (senior, expert, certified, veteran)
+{TAG_GUIDANCE}
 
 Return ONLY a JSON array of tags, no explanation.
 Example: ["drones", "automation", "electrical", "veteran", "leadership"]
 
 Tags:"""
+    
+    def build_batch_prompt(self, items: List[Tuple[str, Optional[Dict[str, Any]]]]) -> str:
+        """Prompt asking for the tags of several numbered profiles at once"""
+        profiles = "\n".join(
+            f'Profile {number}: {self._context_info(context)}Profile text: "{free_text}"'
+            for number, (free_text, context) in enumerate(items, start=1)
+        )
+        return f"""Extract 3-5 meaningful tags from each of these civilian profiles for defense and emergency coordination.
+
+{profiles}
+
+{TAG_GUIDANCE}
 
+Return ONLY a JSON object mapping each profile number to its JSON array of tags, no explanation.
+Example: {{"1": ["drones", "electrical", "veteran"], "2": ["medical", "leadership"]}}
+
+Tags:"""
+    
+    def _cache_key(self, free_text: str, context: Optional[Dict[str, Any]]) -> str:
+        # Only the context that reaches the prompt is part of the key
+        return cache_key(free_text, self._context_info(context), self.model, PROMPT_VERSION)
+    
+    def _generate_payload(self, prompt: str) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": False,
+            "options": {
+                "temperature": 0.1,  # Low temperature for consistent results
+                "top_p": 0.9,
+                "max_tokens": 150
+            }
+        }
+    
+    def _parse_tags(self, response_text: str) -> Optional[List[str]]:
+        """Validated tags from a JSON array in the response, or None if there is none"""
+        json_match = re.search(r'\[.*?\]', response_text, re.DOTALL)
+        if not json_match:
+            return None
+        try:
+            return self._validate_tags(json.loads(json_match.group()))
+        except ValueError:
+            return None
+    
+    def _parse_batch_tags(self, response_text: str, count: int) -> List[Optional[List[str]]]:
+        """Per-profile tags from a batch response; None for profiles the model left out"""
+        results: List[Optional[List[str]]] = [None] * count
+        json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
+        if not json_match:
+            return results
+        try:
+            parsed = json.loads(json_match.group())
+        except ValueError:
+            return results
+        if not isinstance(parsed, dict):
+            return results
+        for number in range(1, count + 1):
+            tags = parsed.get(str(number))
+            if isinstance(tags, list):
+                results[number - 1] = self._validate_tags(tags)
+        return results
+    
+    def extract_tags_with_llm(self, free_text: str, context: Dict[str, Any] = None) -> List[str]:
+        """Extract meaningful tags using Ollama LLM."""
         try:
             response = requests.post(
                 f"{self.ollama_url}/api/generate",
-                json={
-                    "model": self.model,
-                    "prompt": prompt,
-                    "stream": False,
-                    "options": {
-                        "temperature": 0.1,  # Low temperature for consistent results
-                        "top_p": 0.9,
-                        "max_tokens": 150
-                    }
-                },
+                json=self._generate_payload(self.build_prompt(free_text, context)),
                 timeout=self.timeout
             )
             
@@ -166,11 +356,8 @@ Tags:"""
                 response_text = result.get("response", "").strip()
                 
                 # Extract JSON from response
-                json_match = re.search(r'\[.*?\]', response_text, re.DOTALL)
-                if json_match:
-                    tags = json.loads(json_match.group())
-                    # Validate and clean tags
-                    validated_tags = self._validate_tags(tags)
+                validated_tags = self._parse_tags(response_text)
+                if validated_tags is not None:
                     logger.info(f"LLM extracted tags: {validated_tags}")
                     return validated_tags
                 else:
@@ -178,12 +365,100 @@ Tags:"""
                     return []
             else:
                 logger.error(f"Ollama API error: {response.status_code}")
+                self.breaker.record_failure()
                 return []
                 
         except Exception as e:
             logger.error(f"LLM tag extraction failed: {e}")
+            self.breaker.record_failure()
             return []
     
+    async def _agenerate(self, client: httpx.AsyncClient, prompt: str) -> Optional[str]:
+        """Run one generate call on the pooled client; None if the host failed"""
+        try:
+            response = await client.post("/api/generate", json=self._generate_payload(prompt))
+            if response.status_code == 200:
+                return response.json().get("response", "").strip()
+            logger.error(f"Ollama API error: {response.status_code}")
+        except Exception as e:
+            logger.error(f"LLM batch extraction failed: {e}")
+        self.breaker.record_failure()
+        return None
+    
+    async def extract_tags_batch(
+        self,
+        items: List[Tuple[str, Optional[Dict[str, Any]]]],
+        concurrency: int = 4,
+        batch_size: int = 4
+    ) -> List[List[str]]:
+        """
+        Extract tags for many (free_text, context) items.
+        
+        Up to batch_size profiles are packed into one prompt and at most
+        concurrency prompts are in flight on a pooled httpx.AsyncClient. Profiles
+        a packed answer leaves out get a prompt of their own; anything the model
+        could not tag (host down, circuit open, unparsable or empty output) falls back to
+        regex extraction. Results are in the order of items.
+        """
+        results: List[Optional[List[str]]] = [None] * len(items)
+        eligible = []
+        for index, (free_text, _) in enumerate(items):
+            if free_text and len(free_text.strip()) >= 10:
+                eligible.append(index)
+            else:
+                results[index] = []
+        long_enough = list(eligible)
+        
+        # Unchanged text is answered from the cache without a prompt, in one
+        # lookup that runs off the event loop
+        keys = {index: self._cache_key(*items[index]) for index in eligible}
+        cached = await run_in_threadpool(self.cache.get_many, list(keys.values()))
+        for index in eligible:
+            results[index] = cached.get(keys[index])
+        eligible = [index for index in eligible if results[index] is None]
+        
+        if eligible:
+            semaphore = asyncio.Semaphore(concurrency)
+            limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+            
+            async def run(chunk: List[int]):
+                async with semaphore:
+                    if self.breaker.state != CircuitBreaker.CLOSED:
+                        return
+                    if len(chunk) == 1:
+                        index = chunk[0]
+                        response_text = await self._agenerate(client, self.build_prompt(*items[index]))
+                        if response_text is not None:
+                            results[index] = self._parse_tags(response_text)
+                        return
+                    response_text = await self._agenerate(client, self.build_batch_prompt([items[index] for index in chunk]))
+                    if response_text is not None:
+                        for index, tags in zip(chunk, self._parse_batch_tags(response_text, len(chunk))):
+                            results[index] = tags
+            
+            async with httpx.AsyncClient(
+                base_url=self.ollama_url,
+                timeout=self.timeout * max(1, batch_size),
+                limits=limits
+            ) as client:
+                if await self.ais_ollama_available(client) and self.ensure_model_available():
+                    chunks = [eligible[start:start + batch_size] for start in range(0, len(eligible), batch_size)]
+                    await asyncio.gather(*(run(chunk) for chunk in chunks))
+                    
+                    if batch_size > 1:
+                        missing = [index for index in eligible if results[index] is None]
+                        await asyncio.gather(*(run([index]) for index in missing))
+        
+        answered = {keys[index]: results[index] for index in eligible if results[index]}
+        if answered:
+            await run_in_threadpool(self.cache.set_many, answered, self.model)
+        
+        # Like extract_tags, an empty answer falls back to regex as well
+        for index in long_enough:
+            if not results[index]:
+                results[index] = self.extract_tags_with_regex(items[index][0])
+        return results
+    
     def _validate_tags(self, tags: List[str]) -> List[str]:
         """Validate and clean extracted tags."""
         if not isinstance(tags, list):
@@ -267,6 +542,11 @@ Tags:"""
         if not free_text or len(free_text.strip()) < 10:
             return []
         
+        key = self._cache_key(free_text, context)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        
         # Try LLM extraction first
         if self.is_ollama_available():
             if not self.ensure_model_available():
@@ -279,6 +559,7 @@ Tags:"""
             
             llm_tags = self.extract_tags_with_llm(free_text, context)
             if llm_tags:
+                self.cache.set(key, llm_tags, self.model)
                 return llm_tags
         
         # Fallback to regex
@@ -0,0 +1,188 @@
+"""
+In-memory inverted index of profile tags, skills and free-text tokens
+"""
+import re
+import threading
+import logging
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional, Sequence, Set
+
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+FIELDS = ("tag", "skill", "text")
+
+
+def intersect_sorted(lists: Sequence[Sequence[int]]) -> List[int]:
+    """AND of sorted ID lists, probing the longer lists by binary search"""
+    if not lists:
+        return []
+    ordered = sorted(lists, key=len)
+    result = list(ordered[0])
+    for other in ordered[1:]:
+        if not result:
+            break
+        kept = []
+        low = 0
+        for value in result:
+            low = bisect_left(other, value, low)
+            if low == len(other):
+                break
+            if other[low] == value:
+                kept.append(value)
+        result = kept
+    return result
+
+
+def union_sorted(lists: Iterable[Sequence[int]]) -> List[int]:
+    """OR of sorted ID lists"""
+    merged: Set[int] = set()
+    for ids in lists:
+        merged.update(ids)
+    return sorted(merged)
+
+
+class PostingIndex:
+    """
+    Term -> sorted user ID posting lists for the tag, skill and text fields.
+
+    Like the spatial index it is built lazily from the database and kept up to
+    date by the submit path, so tag and skill filters resolve to ID lists
+    without scanning the JSON columns of every profile.
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[str, List[int]]] = {field: {} for field in FIELDS}
+        self._documents: Dict[int, Dict[str, Set[str]]] = {}
+        # Lower-cased free text, to check multi-word skill queries as phrases
+        self._texts: Dict[int, str] = {}
+        self._lock = threading.RLock()
+        self._loaded = False
+
+    @staticmethod
+    def _terms(tags: Optional[List[str]], skills: Optional[List[str]], free_text: Optional[str]) -> Dict[str, Set[str]]:
+        return {
+            "tag": {tag.lower() for tag in tags or []},
+            "skill": {skill.lower() for skill in skills or []},
+            "text": set(TOKEN_PATTERN.findall(free_text.lower())) if free_text else set()
+        }
+
+    def ensure_loaded(self, db: Session):
+        """Build the index from the database if it has not been built yet"""
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            from models import Profile
+
+            self._clear()
+            rows = db.query(Profile.user_id, Profile.tags_json, Profile.skills, Profile.free_text).order_by(
+                Profile.user_id
+            ).all()
+            for user_id, tags, skills, free_text in rows:
+                # Rows arrive in ID order, so appending keeps posting lists sorted
+                terms = self._terms(tags, skills, free_text)
+                self._documents[user_id] = terms
+                if free_text:
+                    self._texts[user_id] = free_text.lower()
+                for field, field_terms in terms.items():
+                    postings = self._postings[field]
+                    for term in field_terms:
+                        postings.setdefault(term, []).append(user_id)
+            self._loaded = True
+            logger.info(f"Posting index built with {len(self._documents)} profiles")
+
+    def _clear(self):
+        for field in FIELDS:
+            self._postings[field].clear()
+        self._documents.clear()
+        self._texts.clear()
+
+    def invalidate(self):
+        """Drop all postings; the index is rebuilt on next use"""
+        with self._lock:
+            self._clear()
+            self._loaded = False
+
+    def update(self, user_id: int, tags: Optional[List[str]], skills: Optional[List[str]], free_text: Optional[str]):
+        """Re-index a profile after submit"""
+        if not self._loaded:
+            # Changes are picked up when the index is built from the database
+            return
+        with self._lock:
+            self._remove(user_id)
+            terms = self._terms(tags, skills, free_text)
+            self._documents[user_id] = terms
+            if free_text:
+                self._texts[user_id] = free_text.lower()
+            for field, field_terms in terms.items():
+                postings = self._postings[field]
+                for term in field_terms:
+                    insort(postings.setdefault(term, []), user_id)
+
+    def remove(self, user_id: int):
+        """Remove a profile from the index"""
+        with self._lock:
+            self._remove(user_id)
+
+    def _remove(self, user_id: int):
+        self._texts.pop(user_id, None)
+        terms = self._documents.pop(user_id, None)
+        if not terms:
+            return
+        for field, field_terms in terms.items():
+            postings = self._postings[field]
+            for term in field_terms:
+                ids = postings.get(term)
+                if not ids:
+                    continue
+                position = bisect_left(ids, user_id)
+                if position < len(ids) and ids[position] == user_id:
+                    del ids[position]
+                if not ids:
+                    del postings[term]
+
+    def postings(self, field: str, term: str) -> List[int]:
+        """Sorted user IDs having the exact term in a field"""
+        return self._postings[field].get(term, [])
+
+    def all_of(self, field: str, terms: Iterable[str]) -> List[int]:
+        """User IDs having every term (AND); terms are matched case-insensitively"""
+        with self._lock:
+            return intersect_sorted([self.postings(field, term.lower()) for term in terms])
+
+    def any_of(self, field: str, terms: Iterable[str]) -> List[int]:
+        """User IDs having at least one term (OR); terms are matched case-insensitively"""
+        with self._lock:
+            return union_sorted(self.postings(field, term.lower()) for term in terms)
+
+    def containing(self, field: str, substring: str) -> List[int]:
+        """User IDs with any term in the field containing substring (scans the vocabulary, not profiles)"""
+        substring = substring.lower()
+        with self._lock:
+            terms = [term for term in self._postings[field] if substring in term]
+            return union_sorted(self._postings[field][term] for term in terms)
+
+    def matching_skill_query(self, skill: str) -> List[int]:
+        """
+        User IDs whose skills or free text contain a skill query as a substring,
+        case-insensitively (the semantics of the LIKE '%skill%' filter it replaces).
+
+        Free-text candidates are narrowed by the query's words through the
+        postings, then the whole query is checked against each candidate's text,
+        so "first aid" does not match "aid ... first".
+        """
+        phrase = skill.lower()
+        in_skills = self.containing("skill", phrase)
+        words = TOKEN_PATTERN.findall(phrase)
+        with self._lock:
+            candidates = intersect_sorted([self.containing("text", word) for word in words]) if words else sorted(self._texts)
+            in_text = [user_id for user_id in candidates if phrase in self._texts.get(user_id, "")]
+        return union_sorted([in_skills, in_text])
+
+# Global instance
+posting_index = PostingIndex()
@@ -0,0 +1,83 @@
+"""
+Global ranking of search candidates with top-k selection and stable cursors
+"""
+import base64
+import json
+from typing import Optional, Tuple
+
+import numpy as np
+
+from services.spatial_index import EARTH_RADIUS_KM
+
+# Weights for the "combined" sort: distance score (0-100km = 100-0) and capability
+DISTANCE_WEIGHT = 0.3
+CAPABILITY_WEIGHT = 0.7
+
+def haversine_km_array(center_lat: float, center_lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Vectorised great-circle distance from a center point in kilometers"""
+    phi1 = np.radians(center_lat)
+    phi2 = np.radians(lats)
+    dphi = phi2 - phi1
+    dlambda = np.radians(lons - center_lon)
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+def rank_keys(
+    sort_method: str,
+    scores: np.ndarray,
+    distances: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Compute the primary ranking key for each candidate (smaller ranks first).
+    Distance-based sorts fall back to capability when there is no search center.
+    """
+    if sort_method == "distance" and distances is not None:
+        return distances
+    if sort_method == "combined" and distances is not None:
+        distance_score = np.maximum(0.0, 100.0 - distances)
+        return -(distance_score * DISTANCE_WEIGHT + scores * CAPABILITY_WEIGHT)
+    return -scores
+
+def top_k(
+    keys: np.ndarray,
+    ids: np.ndarray,
+    k: int,
+    after: Optional[Tuple[float, int]] = None
+) -> np.ndarray:
+    """
+    Return indices of the k best candidates ordered by (key, id).
+
+    Only the candidates ranked after the cursor position are considered, and
+    a partial selection is used so a page never sorts the full candidate set.
+    """
+    if after is not None:
+        after_key, after_id = after
+        mask = (keys > after_key) | ((keys == after_key) & (ids > after_id))
+        candidates = np.flatnonzero(mask)
+    else:
+        candidates = np.arange(len(keys))
+
+    if k <= 0 or len(candidates) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    if len(candidates) > k:
+        # Threshold is the k-th smallest key; keep ties so the id tie-break stays exact
+        threshold = np.partition(keys[candidates], k - 1)[k - 1]
+        candidates = candidates[keys[candidates] <= threshold]
+
+    order = np.lexsort((ids[candidates], keys[candidates]))
+    return candidates[order[:k]]
+
+def encode_cursor(key: float, user_id: int) -> str:
+    """Encode the last returned ranking position as an opaque cursor"""
+    payload = json.dumps([float(key), int(user_id)]).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[float, int]:
+    """Decode a cursor produced by encode_cursor; raises ValueError if malformed"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        key, user_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return float(key), int(user_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
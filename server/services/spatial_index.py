@@ -0,0 +1,204 @@
+"""
+In-memory uniform grid index over civilian locations for radius and bbox search
+"""
+import math
+import threading
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 111.0
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance between two points in kilometers"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def radius_bbox(lat: float, lon: float, radius_km: float) -> Tuple[float, float, float, float]:
+    """Bounding box (min_lat, min_lon, max_lat, max_lon) enclosing a radius around a point"""
+    lat_degree = radius_km / KM_PER_DEGREE_LAT
+    min_lat = max(-90.0, lat - lat_degree)
+    max_lat = min(90.0, lat + lat_degree)
+    # Use the latitude closest to the pole so the box covers the whole circle
+    widest_lat = min(89.9, max(abs(min_lat), abs(max_lat)))
+    lon_degree = radius_km / (KM_PER_DEGREE_LAT * math.cos(math.radians(widest_lat)))
+    return min_lat, lon - lon_degree, max_lat, lon + lon_degree
+
+
+class SpatialIndex:
+    """
+    Uniform lat/lon grid mapping cells to the civilians located in them.
+
+    The index is built lazily from the database on first use and kept up to
+    date by the submit and allocate paths, so radius and bbox queries only
+    touch the cells that overlap the search area instead of every row.
+    """
+
+    def __init__(self, cell_size_deg: float = 0.05):
+        self.cell_size = cell_size_deg
+        self._cells: Dict[Tuple[int, int], Dict[int, Tuple[float, float]]] = {}
+        self._entries: Dict[int, Tuple[float, float, str]] = {}
+        self._lock = threading.RLock()
+        self._loaded = False
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return (math.floor(lat / self.cell_size), math.floor(lon / self.cell_size))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def ensure_loaded(self, db: Session):
+        """Build the index from the database if it has not been built yet"""
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            from models import User, Profile
+
+            rows = db.query(User.id, User.lat, User.lon, Profile.status).join(
+                Profile, User.id == Profile.user_id
+            ).all()
+            self._cells.clear()
+            self._entries.clear()
+            for user_id, lat, lon, status in rows:
+                self._insert(user_id, lat, lon, status or "available")
+            self._loaded = True
+            logger.info(f"Spatial index built with {len(self._entries)} civilians")
+
+    def invalidate(self):
+        """Drop all entries; the index is rebuilt on next use"""
+        with self._lock:
+            self._cells.clear()
+            self._entries.clear()
+            self._loaded = False
+
+    def _insert(self, user_id: int, lat: float, lon: float, status: str):
+        self._cells.setdefault(self._cell(lat, lon), {})[user_id] = (lat, lon)
+        self._entries[user_id] = (lat, lon, status)
+
+    def _remove(self, user_id: int):
+        entry = self._entries.pop(user_id, None)
+        if entry is None:
+            return
+        cell_key = self._cell(entry[0], entry[1])
+        cell = self._cells.get(cell_key)
+        if cell is not None:
+            cell.pop(user_id, None)
+            if not cell:
+                del self._cells[cell_key]
+
+    def upsert(self, user_id: int, lat: float, lon: float, status: str = "available"):
+        """Add a civilian or update their location/status"""
+        if not self._loaded:
+            # Changes are picked up when the index is built from the database
+            return
+        with self._lock:
+            self._remove(user_id)
+            self._insert(user_id, lat, lon, status)
+
+    def set_status(self, user_id: int, status: str):
+        """Update the status of an indexed civilian"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                self._entries[user_id] = (entry[0], entry[1], status)
+
+    def remove(self, user_id: int):
+        """Remove a civilian from the index"""
+        with self._lock:
+            self._remove(user_id)
+
+    def _cells_in_bbox(
+        self, min_lat: float, min_lon: float, max_lat: float, max_lon: float
+    ) -> Iterable[Dict[int, Tuple[float, float]]]:
+        lat0, lon0 = self._cell(min_lat, min_lon)
+        lat1, lon1 = self._cell(max_lat, max_lon)
+        span = (lat1 - lat0 + 1) * (lon1 - lon0 + 1)
+        if span > len(self._cells):
+            # Sparse population: cheaper to walk the occupied cells
+            for (cell_lat, cell_lon), cell in self._cells.items():
+                if lat0 <= cell_lat <= lat1 and lon0 <= cell_lon <= lon1:
+                    yield cell
+            return
+        for cell_lat in range(lat0, lat1 + 1):
+            for cell_lon in range(lon0, lon1 + 1):
+                cell = self._cells.get((cell_lat, cell_lon))
+                if cell:
+                    yield cell
+
+    def _status_ok(self, user_id: int, statuses: Optional[set]) -> bool:
+        return statuses is None or self._entries[user_id][2] in statuses
+
+    def query_bbox(
+        self,
+        min_lat: float,
+        min_lon: float,
+        max_lat: float,
+        max_lon: float,
+        statuses: Optional[Iterable[str]] = None
+    ) -> List[int]:
+        """Return user IDs located inside the bounding box"""
+        status_set = set(statuses) if statuses else None
+        with self._lock:
+            matches = []
+            for cell in self._cells_in_bbox(min_lat, min_lon, max_lat, max_lon):
+                for user_id, (lat, lon) in cell.items():
+                    if (min_lat <= lat <= max_lat and min_lon <= lon <= max_lon
+                            and self._status_ok(user_id, status_set)):
+                        matches.append(user_id)
+            return matches
+
+    def query_radius(
+        self,
+        center_lat: float,
+        center_lon: float,
+        radius_km: float,
+        statuses: Optional[Iterable[str]] = None
+    ) -> Dict[int, float]:
+        """Return {user_id: distance_km} for civilians within the haversine radius"""
+        status_set = set(statuses) if statuses else None
+        min_lat, min_lon, max_lat, max_lon = radius_bbox(center_lat, center_lon, radius_km)
+        with self._lock:
+            matches = {}
+            for cell in self._cells_in_bbox(min_lat, min_lon, max_lat, max_lon):
+                for user_id, (lat, lon) in cell.items():
+                    if not (min_lat <= lat <= max_lat and min_lon <= lon <= max_lon):
+                        continue
+                    distance = haversine_km(center_lat, center_lon, lat, lon)
+                    if distance <= radius_km and self._status_ok(user_id, status_set):
+                        matches[user_id] = distance
+            return matches
+
+
+def circle_polygon(center_lat: float, center_lon: float, radius_km: float, segments: int = 64) -> Dict:
+    """GeoJSON polygon approximating a circle on the sphere"""
+    lat_rad = math.radians(center_lat)
+    lon_rad = math.radians(center_lon)
+    angular = radius_km / EARTH_RADIUS_KM
+    ring = []
+    for i in range(segments + 1):
+        bearing = 2 * math.pi * (i % segments) / segments
+        point_lat = math.asin(
+            math.sin(lat_rad) * math.cos(angular)
+            + math.cos(lat_rad) * math.sin(angular) * math.cos(bearing)
+        )
+        point_lon = lon_rad + math.atan2(
+            math.sin(bearing) * math.sin(angular) * math.cos(lat_rad),
+            math.cos(angular) - math.sin(lat_rad) * math.sin(point_lat)
+        )
+        ring.append([math.degrees(point_lon), math.degrees(point_lat)])
+    return {"type": "Polygon", "coordinates": [ring]}
+
+# Global instance
+spatial_index = SpatialIndex()
@@ -3,10 +3,16 @@ Deterministic tagging and scoring service with LLM enhancement
 """
 import yaml
 import re
+import json
+import hashlib
 import logging
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Sequence, Optional
 from pathlib import Path
 
+import numpy as np
+
+from .keyword_matcher import KeywordMatcher
+
 # Import LLM tagger service
 try:
     from .llm_tagger import LLMTaggerService
@@ -17,12 +23,16 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+# Maximum score bonus from full-text (BM25) relevance
+TEXT_RANK_WEIGHT = 10.0
+
 class TaggerService:
     """Service for generating deterministic tags and capability scores"""
     
     def __init__(self, rules_path: str = "rules.yml"):
         self.rules_path = Path(__file__).parent.parent / rules_path
         self.rules = self._load_rules()
+        self._compile_rules()
         
         # Initialize LLM tagger service
         if LLM_AVAILABLE:
@@ -55,48 +65,76 @@ class TaggerService:
                 "max_score": 100
             }
     
-    def generate_tags_and_score(
+    def reload_rules(self) -> bool:
+        """Re-read rules.yml; returns True if the rules changed (stored features become stale)"""
+        previous_version = self.rules_version
+        self.rules = self._load_rules()
+        self._compile_rules()
+        return self.rules_version != previous_version
+    
+    def _compile_rules(self):
+        """Compile category keywords into a single multi-pattern matcher"""
+        # Fingerprint of the rules; stored features built with other rules are stale
+        self.rules_version = hashlib.sha1(
+            json.dumps(self.rules, sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()[:16]
+        
+        # keyword -> categories it scores for, once per occurrence in the rules
+        self._keyword_categories: Dict[str, List[str]] = {}
+        # (category, language) -> (keywords joined for substring lookups, keyword set)
+        self._keyword_groups: Dict[Tuple[str, str], Tuple[str, frozenset]] = {}
+        
+        for category, config in self.rules["categories"].items():
+            for language in ("en", "fi"):
+                keywords = [keyword.lower() for keyword in config["keywords"].get(language, [])]
+                for keyword in keywords:
+                    self._keyword_categories.setdefault(keyword, []).append(category)
+                if keywords:
+                    self._keyword_groups[(category, language)] = ("\x00".join(keywords), frozenset(keywords))
+        
+        self._keyword_matcher = KeywordMatcher(self._keyword_categories.keys())
+        self._term_hits_cache: Dict[str, Dict[str, int]] = {}
+    
+    def _term_category_hits(self, search_term: str) -> Dict[str, int]:
+        """
+        Count, per category, the keyword languages matching a query term, where a
+        keyword matches if it contains the term or the term contains it
+        """
+        hits = self._term_hits_cache.get(search_term)
+        if hits is not None:
+            return hits
+        
+        hits = {}
+        contained = self._keyword_matcher.find(search_term)
+        for (category, language), (blob, keywords) in self._keyword_groups.items():
+            if search_term in blob or not keywords.isdisjoint(contained):
+                hits[category] = hits.get(category, 0) + 1
+        
+        if len(self._term_hits_cache) < 10000:
+            self._term_hits_cache[search_term] = hits
+        return hits
+    
+    def build_features(
         self,
         education_level: str,
         skills: List[str],
         free_text: str = "",
-        availability: str = "immediate",
-        resources: List[Dict[str, Any]] = None,
-        industry: str = None
-    ) -> Tuple[List[str], float]:
-        """Generate tags and capability score from profile data"""
+        resources: List[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Derive the rule-dependent features of a profile once, at submit time.
         
+        The result is stored on the profile and reused by tagging and search-time
+        scoring until rules.yml changes (see features_current).
+        """
         # Combine all text for keyword matching
-        text_to_analyze = " ".join([
-            education_level.lower(),
-            " ".join(skills).lower(),
-            free_text.lower() if free_text else ""
-        ])
+        text = self._profile_text(education_level, skills, free_text)
         
-        # Find matching categories from skills and text
-        matching_categories = []
+        # Single pass over the text finds every keyword present
         category_scores = {}
-        
-        for category, config in self.rules["categories"].items():
-            score = 0
-            matches = 0
-            
-            # Check English keywords
-            for keyword in config["keywords"].get("en", []):
-                if keyword.lower() in text_to_analyze:
-                    score += config["weight"] * 10
-                    matches += 1
-            
-            # Check Finnish keywords
-            for keyword in config["keywords"].get("fi", []):
-                if keyword.lower() in text_to_analyze:
-                    score += config["weight"] * 10
-                    matches += 1
-            
-            # Only include categories with matches
-            if matches > 0:
-                matching_categories.append(category)
-                category_scores[category] = score
+        for keyword in self._keyword_matcher.find(text):
+            for category in self._keyword_categories[keyword]:
+                category_scores[category] = category_scores.get(category, 0) + self.rules["categories"][category]["weight"] * 10
         
         # Add resource-based tags and scores
         resource_tags = []
@@ -129,6 +167,45 @@ class TaggerService:
                     
                     resource_score += item_score
         
+        return {
+            "rules_version": self.rules_version,
+            "text": text,
+            "category_scores": category_scores,
+            "resource_tags": resource_tags,
+            "resource_score": resource_score
+        }
+    
+    def features_current(self, features: Optional[Dict[str, Any]]) -> bool:
+        """Whether stored features were built with the currently loaded rules"""
+        return bool(features) and features.get("rules_version") == self.rules_version
+    
+    def generate_tags_and_score(
+        self,
+        education_level: str,
+        skills: List[str],
+        free_text: str = "",
+        availability: str = "immediate",
+        resources: List[Dict[str, Any]] = None,
+        industry: str = None,
+        features: Optional[Dict[str, Any]] = None,
+        use_llm: bool = True,
+        llm_tags: Optional[List[str]] = None
+    ) -> Tuple[List[str], float]:
+        """
+        Generate tags and capability score from profile data (or its precomputed features).
+        With use_llm=False only the regex fallback extractor runs, so the call never waits
+        on the model host; llm_tags passes in tags from an earlier (background) extraction.
+        """
+        
+        if not self.features_current(features):
+            features = self.build_features(education_level, skills, free_text, resources)
+        category_scores = features["category_scores"]
+        resource_tags = features["resource_tags"]
+        resource_score = features["resource_score"]
+        
+        # Keep rules.yml category order for tags
+        matching_categories = [category for category in self.rules["categories"] if category in category_scores]
+        
         # Add industry-based tag and score
         industry_tags = []
         industry_score = 0
@@ -152,20 +229,24 @@ class TaggerService:
             availability_bonus += bonus
         
         # Extract LLM tags from free_text (if available and substantial)
-        llm_tags = []
-        if self.llm_tagger and free_text and len(free_text.strip()) > 10:
-            try:
-                # Build context for LLM
-                context = {
-                    "education_level": education_level,
-                    "skills": skills,
-                    "availability": availability,
-                    "industry": industry
-                }
-                llm_tags = self.llm_tagger.extract_tags(free_text, context)
-                logger.info(f"LLM extracted {len(llm_tags)} tags: {llm_tags}")
-            except Exception as e:
-                logger.warning(f"LLM tag extraction failed: {e}")
+        if llm_tags is None:
+            llm_tags = []
+            if self.llm_tagger and free_text and len(free_text.strip()) > 10:
+                try:
+                    if use_llm:
+                        # Build context for LLM
+                        context = {
+                            "education_level": education_level,
+                            "skills": skills,
+                            "availability": availability,
+                            "industry": industry
+                        }
+                        llm_tags = self.llm_tagger.extract_tags(free_text, context)
+                        logger.info(f"LLM extracted {len(llm_tags)} tags: {llm_tags}")
+                    else:
+                        llm_tags = self.llm_tagger.extract_tags_with_regex(free_text)
+                except Exception as e:
+                    logger.warning(f"LLM tag extraction failed: {e}")
         
         # Combine all tags (rule-based + resource + industry + LLM)
         all_tags = matching_categories + resource_tags + industry_tags + llm_tags
@@ -197,26 +278,19 @@ class TaggerService:
         civilian_data: Dict[str, Any],
         search_query: str = "",
         skills_query: List[str] = None,
-        include_tags: List[str] = None
+        include_tags: List[str] = None,
+        text_rank: Optional[float] = None
     ) -> float:
         """
         Calculate capability score based on relevance to search query
-        instead of static profile scoring.
+        instead of static profile scoring. text_rank is an optional full-text
+        relevance (negated BM25) of the profile for the query.
         """
-        if skills_query is None:
-            skills_query = []
-        if include_tags is None:
-            include_tags = []
-        
-        # Extract civilian data
-        education_level = civilian_data.get("education_level", "")
-        skills = civilian_data.get("skills", [])
-        free_text = civilian_data.get("free_text", "")
-        availability = civilian_data.get("availability", "immediate")
-        industry = civilian_data.get("industry", "")
-        existing_tags = civilian_data.get("tags", [])
-        
-        # Combine search terms for matching
+        text_ranks = None if text_rank is None else [text_rank]
+        return float(self.score_batch([civilian_data], search_query, skills_query, include_tags, text_ranks)[0])
+    
+    def _query_terms(self, search_query: str, skills_query: List[str], include_tags: List[str]) -> List[str]:
+        """Combine search terms for matching"""
         search_terms = []
         if search_query:
             search_terms.extend(search_query.lower().split())
@@ -224,86 +298,140 @@ class TaggerService:
             search_terms.extend([skill.lower() for skill in skills_query])
         if include_tags:
             search_terms.extend([tag.lower() for tag in include_tags])
+        return search_terms
+    
+    @staticmethod
+    def _profile_text(education_level: str, skills: List[str], free_text: str) -> str:
+        """Lowercased text of a profile used for keyword and query matching"""
+        return " ".join([
+            (education_level or "").lower(),
+            " ".join(skills or []).lower(),
+            free_text.lower() if free_text else ""
+        ])
+    
+    def score_batch(
+        self,
+        profiles: Sequence[Dict[str, Any]],
+        search_query: str = "",
+        skills_query: List[str] = None,
+        include_tags: List[str] = None,
+        text_ranks: Optional[Sequence[float]] = None
+    ) -> np.ndarray:
+        """
+        Query-relevant capability scores for a whole candidate set.
         
+        Each profile is a dict with the same keys as calculate_query_relevant_score's
+        civilian_data; when it carries current "features" the precomputed text is
+        used instead of the raw skills and free_text. text_ranks optionally gives the
+        full-text relevance (negated BM25) of each profile. Query terms are matched
+        against rule keywords and against each distinct tag once, then spread over
+        profiles with sparse sums.
+        """
+        n = len(profiles)
+        base_score = self.rules.get("base_score", 10)
+        search_terms = self._query_terms(search_query, skills_query, include_tags)
         if not search_terms:
             # No search terms, return base score
-            return self.rules.get("base_score", 10)
+            return np.full(n, float(base_score))
         
-        # Calculate query relevance score
-        query_relevance_score = 0
-        match_count = 0
-        
-        # Match against category keywords
-        for category, config in self.rules["categories"].items():
-            category_matches = 0
-            
-            # Check if search terms match category keywords
-            for search_term in search_terms:
-                for keyword in config["keywords"].get("en", []):
-                    if search_term in keyword.lower() or keyword.lower() in search_term:
-                        category_matches += 1
-                        query_relevance_score += config["weight"] * 15  # Higher weight for query relevance
-                        break
-                
-                for keyword in config["keywords"].get("fi", []):
-                    if search_term in keyword.lower() or keyword.lower() in search_term:
-                        category_matches += 1
-                        query_relevance_score += config["weight"] * 15
-                        break
-            
-            # Check if civilian has this category in their existing tags
-            if category in existing_tags and category_matches > 0:
-                query_relevance_score += config["weight"] * 10  # Bonus for having the matched category
-                match_count += 1
-        
-        # Match against civilian's skills and free text
-        civilian_text = " ".join([
-            education_level.lower(),
-            " ".join(skills).lower(),
-            free_text.lower() if free_text else ""
-        ])
+        categories = self.rules["categories"]
+        education_rules = self.rules["education_scores"]
+        industry_config = self.rules.get("industries", {})
+        general_bonus = categories.get("general", {}).get("availability_bonus", {})
         
+        # Category keyword relevance depends only on the query
+        category_matches: Dict[str, int] = {}
         for search_term in search_terms:
-            if search_term in civilian_text:
-                query_relevance_score += 5  # Direct text match bonus
-                match_count += 1
+            for category, count in self._term_category_hits(search_term).items():
+                category_matches[category] = category_matches.get(category, 0) + count
         
-        # Match against existing tags
-        for search_term in search_terms:
-            for tag in existing_tags:
-                if search_term in tag.lower() or tag.lower() in search_term:
-                    query_relevance_score += 8  # Tag match bonus
-                    match_count += 1
+        # Gather per-profile static scores, text and tag postings in one pass
+        education_scores = np.zeros(n)
+        availability_bonuses = np.zeros(n)
+        industry_scores = np.zeros(n)
+        texts = []
+        tag_index: Dict[str, int] = {}
+        tag_rows: List[int] = []
+        tag_cols: List[int] = []
+        for row, profile in enumerate(profiles):
+            education_level = profile.get("education_level", "")
+            availability = profile.get("availability", "immediate")
+            industry = profile.get("industry", "")
+            
+            education_scores[row] = education_rules.get(education_level, 0)
+            if availability in ["immediate", "24h", "48h"]:
+                availability_bonuses[row] = general_bonus.get(availability, 0)
+            if industry:
+                industry_scores[row] = industry_config.get(industry, 0)
+            
+            features = profile.get("features")
+            if self.features_current(features):
+                texts.append(features["text"])
+            else:
+                texts.append(self._profile_text(education_level, profile.get("skills", []), profile.get("free_text", "")))
+            for tag in profile.get("tags") or []:
+                tag_rows.append(row)
+                tag_cols.append(tag_index.setdefault(tag, len(tag_index)))
+        rows = np.array(tag_rows, dtype=np.int64)
+        cols = np.array(tag_cols, dtype=np.int64)
         
-        # Add education score (same as before)
-        education_score = self.rules["education_scores"].get(education_level, 0)
+        # Scores are accumulated in the same order as a per-profile sum would add
+        # them, so the floating-point totals (and their rounding) are identical
+        query_relevance_score = np.zeros(n)
+        match_count = np.zeros(n)
+        for category, config in categories.items():
+            count = category_matches.get(category, 0)
+            if not count:
+                continue
+            for _ in range(count):
+                query_relevance_score += config["weight"] * 15  # Higher weight for query relevance
+            # Bonus for profiles that carry the matched category as a tag
+            has_category = np.zeros(n, dtype=bool)
+            if category in tag_index:
+                has_category[rows[cols == tag_index[category]]] = True
+            query_relevance_score += np.where(has_category, config["weight"] * 10, 0.0)
+            match_count += has_category
         
-        # Add availability bonus (same as before)
-        availability_bonus = 0
-        if availability in ["immediate", "24h", "48h"]:
-            # Use general category availability bonus if no specific matches
-            general_config = self.rules["categories"].get("general", {})
-            availability_bonus = general_config.get("availability_bonus", {}).get(availability, 0)
+        # Direct text matches: each term scores once per profile containing it
+        text_hits = self._count_text_hits(texts, search_terms)
         
-        # Add industry score (same as before)
-        industry_score = 0
-        if industry:
-            industry_config = self.rules.get("industries", {})
-            industry_score = industry_config.get(industry, 0)
+        # Tag matches: evaluate each distinct tag against the query once
+        tag_hits = np.zeros(n)
+        if tag_rows:
+            term_tag_hits = np.array([
+                sum(1 for term in search_terms if term in tag.lower() or tag.lower() in term)
+                for tag in tag_index
+            ], dtype=np.float64)
+            tag_hits = np.bincount(rows, weights=term_tag_hits[cols], minlength=n)
         
-        # Calculate final score
-        base_score = self.rules.get("base_score", 10)
+        for bonus, hits in ((5.0, text_hits), (8.0, tag_hits)):  # Text and tag match bonuses
+            for k in range(1, int(hits.max(initial=0)) + 1):
+                query_relevance_score += np.where(hits >= k, bonus, 0.0)
+        match_count += text_hits + tag_hits
         
-        # If no matches found, return very low score
-        if match_count == 0:
-            return min(base_score + education_score + availability_bonus + industry_score, 100)
+        # Full-text relevance bonus, saturating towards TEXT_RANK_WEIGHT
+        if text_ranks is not None:
+            ranks = np.maximum(np.asarray(text_ranks, dtype=np.float64), 0.0)
+            query_relevance_score = query_relevance_score + TEXT_RANK_WEIGHT * ranks / (1.0 + ranks)
+            match_count = match_count + (ranks > 0)
         
-        final_score = min(
-            base_score + query_relevance_score + education_score + availability_bonus + industry_score,
+        matched = np.minimum(
+            base_score + query_relevance_score + education_scores + availability_bonuses + industry_scores,
             self.rules.get("max_score", 100)
         )
-        
-        return round(final_score, 1)
+        matched = np.array([round(score, 1) for score in matched.tolist()])
+        # If no matches found, return very low score
+        unmatched = np.minimum(base_score + education_scores + availability_bonuses + industry_scores, 100)
+        return np.where(match_count > 0, matched, unmatched)
+    
+    @staticmethod
+    def _count_text_hits(texts: List[str], search_terms: List[str]) -> np.ndarray:
+        """Number of search terms contained in each text"""
+        hits = np.zeros(len(texts))
+        for term in set(search_terms):
+            occurrences = search_terms.count(term)
+            hits += occurrences * np.fromiter((term in text for text in texts), dtype=bool, count=len(texts))
+        return hits
     
     def get_available_tags(self) -> List[str]:
         """Get list of all available tags"""
@@ -0,0 +1,60 @@
+"""
+Web Mercator tile math and grid binning for heatmap tiles
+"""
+import math
+from typing import Tuple
+
+import numpy as np
+
+MAX_ZOOM = 22
+
+# Allowed cells per tile side
+TILE_GRIDS = (16, 32, 64, 128, 256)
+
+# Web Mercator is undefined at the poles; tiles stop at this latitude
+MAX_LATITUDE = 85.05112878
+
+
+def tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """(min_lat, min_lon, max_lat, max_lon) of a z/x/y slippy-map tile"""
+    n = 2 ** z
+    min_lon = x / n * 360.0 - 180.0
+    max_lon = (x + 1) / n * 360.0 - 180.0
+    max_lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    min_lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return min_lat, min_lon, max_lat, max_lon
+
+
+def tile_fractions(lats: np.ndarray, lons: np.ndarray, z: int, x: int, y: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Position of points inside a tile, as (row, column) fractions in [0, 1) from its north-west corner"""
+    n = 2 ** z
+    lat_rad = np.radians(np.clip(lats, -MAX_LATITUDE, MAX_LATITUDE))
+    columns = (lons + 180.0) / 360.0 * n - x
+    rows = (1.0 - np.arcsinh(np.tan(lat_rad)) / math.pi) / 2.0 * n - y
+    return rows, columns
+
+
+def bin_tile(
+    lats: np.ndarray,
+    lons: np.ndarray,
+    weights: np.ndarray,
+    z: int,
+    x: int,
+    y: int,
+    grid: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Aggregate points into a grid x grid raster over the tile.
+
+    Returns the non-empty cells as flat row-major indices with their point
+    counts and weight sums; points outside the tile are ignored.
+    """
+    rows, columns = tile_fractions(lats, lons, z, x, y)
+    # Half-open tile so points on a shared edge are counted in one tile only
+    inside = (rows >= 0) & (rows < 1) & (columns >= 0) & (columns < 1)
+    rows, columns, weights = rows[inside], columns[inside], weights[inside]
+    value_range = [[0.0, 1.0], [0.0, 1.0]]
+    counts, _, _ = np.histogram2d(rows, columns, bins=grid, range=value_range)
+    weight_sums, _, _ = np.histogram2d(rows, columns, bins=grid, range=value_range, weights=weights)
+    cells = np.flatnonzero(counts)
+    return cells, counts.ravel()[cells].astype(np.int64), weight_sums.ravel()[cells]
@@ -0,0 +1,70 @@
+"""
+Shared test setup.
+
+The application modules create their engines from the environment on import,
+so scratch databases are configured here, before any test module imports
+them. Without this the app lifespan would create tables in, migrate and seed
+the committed demo database.
+"""
+import os
+import tempfile
+
+SCRATCH_DIR = tempfile.mkdtemp(prefix="civitas-tests-")
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(SCRATCH_DIR, 'test.db')}"
+    os.environ["AUDIT_DATABASE_URL"] = f"sqlite:///{os.path.join(SCRATCH_DIR, 'test_audit.db')}"
+os.environ.setdefault("LLM_CACHE_PATH", os.path.join(SCRATCH_DIR, "llm_cache.db"))
+os.environ.setdefault("DEMO_MODE", "true")
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from main import app
+from db import get_db
+from models import Base
+from services.allocation_state import allocation_state
+from services.posting_index import posting_index
+
+
+@pytest.fixture(autouse=True)
+def reset_process_caches():
+    """The allocation cache and posting index are process-wide; no test sees another test's data"""
+    allocation_state.invalidate()
+    posting_index.invalidate()
+    yield
+    allocation_state.invalidate()
+    posting_index.invalidate()
+
+
+@pytest.fixture
+def memory_engine():
+    """An empty in-memory database with the application tables, shared by every connection"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db(memory_engine):
+    """A session on memory_engine"""
+    session = sessionmaker(bind=memory_engine)()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def client(db):
+    """A TestClient whose requests use the db session; the lifespan runs against the scratch databases"""
+    def override_get_db():
+        yield db
+
+    app.dependency_overrides[get_db] = override_get_db
+    try:
+        with TestClient(app) as test_client:
+            yield test_client
+    finally:
+        app.dependency_overrides.clear()
@@ -0,0 +1,116 @@
+"""
+Per-row query-relevant scorer as it was before TaggerService.score_batch, kept
+as the reference that tests/test_scoring.py checks score_batch against
+"""
+from typing import Any, Dict, List
+
+
+def legacy_query_relevant_score(
+    rules: Dict[str, Any],
+    civilian_data: Dict[str, Any],
+    search_query: str = "",
+    skills_query: List[str] = None,
+    include_tags: List[str] = None
+) -> float:
+    """TaggerService.calculate_query_relevant_score before it was vectorised"""
+    if skills_query is None:
+        skills_query = []
+    if include_tags is None:
+        include_tags = []
+    
+    # Extract civilian data
+    education_level = civilian_data.get("education_level", "")
+    skills = civilian_data.get("skills", [])
+    free_text = civilian_data.get("free_text", "")
+    availability = civilian_data.get("availability", "immediate")
+    industry = civilian_data.get("industry", "")
+    existing_tags = civilian_data.get("tags", [])
+    
+    # Combine search terms for matching
+    search_terms = []
+    if search_query:
+        search_terms.extend(search_query.lower().split())
+    if skills_query:
+        search_terms.extend([skill.lower() for skill in skills_query])
+    if include_tags:
+        search_terms.extend([tag.lower() for tag in include_tags])
+    
+    if not search_terms:
+        # No search terms, return base score
+        return rules.get("base_score", 10)
+    
+    # Calculate query relevance score
+    query_relevance_score = 0
+    match_count = 0
+    
+    # Match against category keywords
+    for category, config in rules["categories"].items():
+        category_matches = 0
+        
+        # Check if search terms match category keywords
+        for search_term in search_terms:
+            for keyword in config["keywords"].get("en", []):
+                if search_term in keyword.lower() or keyword.lower() in search_term:
+                    category_matches += 1
+                    query_relevance_score += config["weight"] * 15  # Higher weight for query relevance
+                    break
+            
+            for keyword in config["keywords"].get("fi", []):
+                if search_term in keyword.lower() or keyword.lower() in search_term:
+                    category_matches += 1
+                    query_relevance_score += config["weight"] * 15
+                    break
+        
+        # Check if civilian has this category in their existing tags
+        if category in existing_tags and category_matches > 0:
+            query_relevance_score += config["weight"] * 10  # Bonus for having the matched category
+            match_count += 1
+    
+    # Match against civilian's skills and free text
+    civilian_text = " ".join([
+        education_level.lower(),
+        " ".join(skills).lower(),
+        free_text.lower() if free_text else ""
+    ])
+    
+    for search_term in search_terms:
+        if search_term in civilian_text:
+            query_relevance_score += 5  # Direct text match bonus
+            match_count += 1
+    
+    # Match against existing tags
+    for search_term in search_terms:
+        for tag in existing_tags:
+            if search_term in tag.lower() or tag.lower() in search_term:
+                query_relevance_score += 8  # Tag match bonus
+                match_count += 1
+    
+    # Add education score (same as before)
+    education_score = rules["education_scores"].get(education_level, 0)
+    
+    # Add availability bonus (same as before)
+    availability_bonus = 0
+    if availability in ["immediate", "24h", "48h"]:
+        # Use general category availability bonus if no specific matches
+        general_config = rules["categories"].get("general", {})
+        availability_bonus = general_config.get("availability_bonus", {}).get(availability, 0)
+    
+    # Add industry score (same as before)
+    industry_score = 0
+    if industry:
+        industry_config = rules.get("industries", {})
+        industry_score = industry_config.get(industry, 0)
+    
+    # Calculate final score
+    base_score = rules.get("base_score", 10)
+    
+    # If no matches found, return very low score
+    if match_count == 0:
+        return min(base_score + education_score + availability_bonus + industry_score, 100)
+    
+    final_score = min(
+        base_score + query_relevance_score + education_score + availability_bonus + industry_score,
+        rules.get("max_score", 100)
+    )
+    
+    return round(final_score, 1)
@@ -0,0 +1,87 @@
+"""
+Tests for incrementally maintained stats aggregates
+"""
+import threading
+from datetime import datetime
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from models import Base, User, Profile, StatsAggregate
+from services.aggregates import AggregateStore, profile_snapshot
+
+def aggregate_rows(db):
+    return {
+        (row.dimension, row.key): (row.count, round(row.score_sum, 6), round(row.weight_sum, 6))
+        for row in db.query(StatsAggregate).all()
+    }
+
+def test_deltas_match_full_rebuild(db):
+    """Applying before/after deltas leaves the same aggregates as recomputing"""
+    for index, (status, tags) in enumerate([("available", ["medical"]), ("available", ["drones", "certified"]), ("allocated", [])], start=1):
+        db.add(User(id=index, national_id_hash=f"hash-{index}", full_name="Test", dob=datetime(1990, 1, 1),
+                    address="Testikatu 1", lat=60.17 + index / 10, lon=24.94))
+        db.add(Profile(user_id=index, education_level="bachelors", skills=[], availability="immediate",
+                       capability_score=40.0 + index, tags_json=tags, status=status))
+    db.commit()
+
+    store = AggregateStore()
+    store.rebuild(db)
+
+    # Re-tag, re-score and allocate civilian 2
+    user, profile = db.get(User, 2), db.query(Profile).filter(Profile.user_id == 2).one()
+    before = profile_snapshot(user, profile)
+    profile.tags_json = ["drones", "leadership"]
+    profile.capability_score = 75.0
+    profile.status = "allocated"
+    profile.education_level = "masters"
+    store.apply(db, before, profile_snapshot(user, profile))
+    db.commit()
+    incremental = aggregate_rows(db)
+
+    store.rebuild(db)
+    assert incremental == aggregate_rows(db)
+    assert ("tag", "certified") not in incremental
+    assert store.summary(db)["status_breakdown"]["allocated"] == 2
+    assert [cell[2] for cell in store.heatmap_cells(db)] == [1]
+
+def test_concurrent_writers_create_the_same_row(tmp_path):
+    """Writers adding the first civilian with a new tag at the same time all land in one row"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'aggregates.db'}", connect_args={"check_same_thread": False, "timeout": 30})
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    store = AggregateStore()
+    db = Session()
+    store.rebuild(db)
+    db.close()
+
+    snapshot = {"lat": 60.17, "lon": 24.94, "education_level": "bachelors", "availability": "immediate",
+                "status": "available", "tags": ["rope access"], "score": 50.0}
+    start = threading.Barrier(8)
+    errors = []
+
+    def writer():
+        session = Session()
+        try:
+            start.wait()
+            store.apply(session, None, snapshot)
+            session.commit()
+        except Exception as error:
+            errors.append(error)
+        finally:
+            session.close()
+
+    threads = [threading.Thread(target=writer) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    db = Session()
+    rows = aggregate_rows(db)
+    assert rows[("tag", "rope access")] == (8, 400.0, 0.0)
+    assert rows[("cell", "6017:2494")] == (8, 400.0, 4.0)
+    assert rows[("total", "all")] == (8, 400.0, 0.0)
+    db.close()
+    engine.dispose()
@@ -0,0 +1,60 @@
+"""
+Tests for bulk allocation
+"""
+from datetime import datetime
+
+from sqlalchemy import event
+
+from models import User, Profile, Resource, Allocation
+from auth import DEMO_USERS, reveal_map
+from services.allocation_state import allocation_state
+
+AUTHORITY = {"X-Demo-User": "authority1", "X-Role": "authority"}
+
+def test_bulk_allocate_applies_valid_items_in_one_transaction(memory_engine, db, client):
+    """Valid items are allocated together; the rest are reported per item and left untouched"""
+    for user_id in (1, 2, 3, 4):
+        db.add(User(id=user_id, national_id_hash=f"hash-{user_id}", full_name=f"Civilian {user_id}",
+                    dob=datetime(1990, 1, 1), address="Testikatu 1", lat=60.17, lon=24.94))
+        db.add(Profile(user_id=user_id, education_level="bachelors", skills=["welding"], availability="immediate",
+                       capability_score=50.0, tags_json=[], status="allocated" if user_id == 3 else "available"))
+    db.add(Resource(id=1, user_id=1, category="power", subtype="generator"))
+    db.add(Allocation(user_id=3, mission_code="M-0", status="active"))
+    db.commit()
+    allocation_state.ensure_loaded(db)
+
+    statements = []
+    event.listen(memory_engine, "before_cursor_execute", lambda conn, cursor, statement, *args: statements.append(statement))
+    response = client.post("/allocate/bulk", headers=AUTHORITY, json={
+        "mission_code": "M-1",
+        "items": [
+            {"user_id": 1, "resource_id": 1},
+            {"user_id": 2},
+            {"user_id": 3},
+            {"user_id": 9},
+            {"user_id": 4, "resource_id": 7},
+            {"user_id": 2}
+        ]
+    })
+
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["allocated"], body["failed"]) == (2, 4)
+    assert [(result["user_id"], result["status"], result["detail"]) for result in body["results"]] == [
+        (1, "allocated", None),
+        (2, "allocated", None),
+        (3, "failed", "Civilian is already allocated"),
+        (9, "failed", "Civilian not found"),
+        (4, "failed", "Resource not found"),
+        (2, "failed", "Civilian listed more than once")
+    ]
+    # Set-based validation and a single insert for all new allocations
+    assert sum(statement.startswith("INSERT INTO allocations") for statement in statements) == 1
+
+    allocations = {a.user_id: a for a in db.query(Allocation).filter(Allocation.mission_code == "M-1")}
+    assert sorted(allocations) == [1, 2] and allocations[1].resource_id == 1
+    assert [result["allocation_id"] for result in body["results"][:2]] == [allocations[1].id, allocations[2].id]
+    assert db.query(Profile.status).filter(Profile.user_id == 4).scalar() == "available"
+
+    authority = dict(DEMO_USERS["authority1"], role="authority")
+    assert reveal_map([1, 2, 3, 4], authority) == {1: True, 2: True, 3: True, 4: False}
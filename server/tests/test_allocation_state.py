@@ -0,0 +1,99 @@
+"""
+Tests for the cached allocation state behind PII visibility
+"""
+from datetime import datetime
+
+from sqlalchemy import event
+
+from models import User, Profile, Allocation
+from auth import DEMO_USERS, reveal_map
+from services import allocation_state as allocation_state_module
+from services.allocation_state import AllocationState, allocation_state
+
+AUTHORITY = {"X-Demo-User": "authority1", "X-Role": "authority"}
+
+def test_allocate_and_complete_update_reveal_map(memory_engine, db, client):
+    """reveal_map answers from memory and follows allocate/complete without reloading"""
+    for user_id in (1, 2, 3):
+        db.add(User(id=user_id, national_id_hash=f"hash-{user_id}", full_name=f"Civilian {user_id}",
+                    dob=datetime(1990, 1, 1), address="Testikatu 1", lat=60.17, lon=24.94))
+        db.add(Profile(user_id=user_id, education_level="bachelors", skills=["welding"], availability="immediate",
+                       capability_score=50.0, tags_json=[], status="available"))
+    db.add(Allocation(user_id=1, mission_code="M-1", status="active"))
+    db.commit()
+
+    authority = dict(DEMO_USERS["authority1"], role="authority")
+    assert reveal_map([1, 2, 3], authority, db=db) == {1: True, 2: False, 3: False}
+    # Civilians only ever see their own PII
+    assert reveal_map([1, 2], DEMO_USERS["civilian2"]) == {1: False, 2: True}
+
+    queries = []
+    event.listen(memory_engine, "before_cursor_execute", lambda conn, cursor, statement, *args: queries.append(statement))
+    assert reveal_map(range(1, 4), authority) == {1: True, 2: False, 3: False}
+    assert queries == []
+
+    allocated = client.post("/allocate/allocate", json={"user_id": 2, "mission_code": "M-2"}, headers=AUTHORITY)
+    assert allocated.status_code == 200
+    assert reveal_map([1, 2, 3], authority) == {1: True, 2: True, 3: False}
+
+    completed = client.post(f"/allocate/allocations/{allocated.json()['id']}/complete", headers=AUTHORITY)
+    assert completed.status_code == 200
+    assert completed.json()["status"] == "completed" and completed.json()["completed_at"] is not None
+    assert reveal_map([1, 2, 3], authority) == {1: True, 2: False, 3: False}
+    assert client.get("/search/detail/2", headers=AUTHORITY).json()["pii_revealed"] is False
+
+    again = client.post(f"/allocate/allocations/{allocated.json()['id']}/complete", headers=AUTHORITY)
+    assert again.status_code == 400
+
+    profile = db.query(Profile).filter(Profile.user_id == 2).one()
+    assert (profile.status, profile.availability) == ("available", "available")
+
+def test_complete_keeps_civilian_with_another_active_allocation(db, client):
+    """Completing one of two active allocations leaves the civilian allocated and their PII visible"""
+    db.add(User(id=1, national_id_hash="hash-1", full_name="Civilian 1", dob=datetime(1990, 1, 1),
+                address="Testikatu 1", lat=60.17, lon=24.94))
+    db.add(Profile(user_id=1, education_level="bachelors", skills=["welding"], availability="allocated",
+                   capability_score=50.0, tags_json=[], status="allocated"))
+    first, second = Allocation(user_id=1, mission_code="M-1", status="active"), Allocation(user_id=1, mission_code="M-2", status="active")
+    db.add_all([first, second])
+    db.commit()
+    authority = dict(DEMO_USERS["authority1"], role="authority")
+
+    assert reveal_map([1], authority, db=db) == {1: True}
+    assert client.post(f"/allocate/allocations/{first.id}/complete", headers=AUTHORITY).status_code == 200
+    assert reveal_map([1], authority) == {1: True}
+    profile = db.query(Profile).filter(Profile.user_id == 1).one()
+    assert (profile.status, profile.availability) == ("allocated", "allocated")
+
+    assert client.post(f"/allocate/allocations/{second.id}/complete", headers=AUTHORITY).status_code == 200
+    assert reveal_map([1], authority) == {1: False}
+    db.refresh(profile)
+    assert (profile.status, profile.availability) == ("available", "available")
+
+    # A reload, as after seed or clear, reads the same state back from the database
+    allocation_state.invalidate()
+    assert reveal_map([1], authority, db=db) == {1: False}
+
+def test_changes_from_other_workers_are_seen_after_ttl(db, monkeypatch):
+    """Allocations written behind the cache's back show up once the set expires"""
+    now = [1000.0]
+    monkeypatch.setattr(allocation_state_module.time, "monotonic", lambda: now[0])
+    db.add(User(id=1, national_id_hash="hash-1", full_name="Civilian 1", dob=datetime(1990, 1, 1),
+                address="Testikatu 1", lat=60.17, lon=24.94))
+    db.commit()
+    state = AllocationState(ttl=10)
+    assert state.allocated_among([1], db) == set()
+
+    # Another worker allocates; this process is not told
+    db.add(Allocation(user_id=1, mission_code="M-1", status="active"))
+    db.commit()
+    now[0] += 9
+    assert state.allocated_among([1], db) == set()
+    now[0] += 1
+    assert state.allocated_among([1], db) == {1}
+
+    # ...and completes it
+    db.query(Allocation).update({"status": "completed"})
+    db.commit()
+    now[0] += 10
+    assert not state.is_allocated(1, db)
@@ -0,0 +1,118 @@
+"""
+Tests for the write-behind audit sink
+"""
+import time
+import asyncio
+from contextlib import contextmanager
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from db import AuditBase
+from models import AuditLog
+from services.audit import AuditSink, AuditService, AuditWriteError
+
+def make_session_factory():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    AuditBase.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+
+    @contextmanager
+    def session_factory():
+        db = Session()
+        try:
+            yield db
+            db.commit()
+        finally:
+            db.close()
+    return session_factory, Session
+
+def row(index):
+    return {"actor": "authority1", "action": "read", "entity": "user_pii", "entity_id": index,
+            "ts": datetime.utcnow(), "details_json": {"index": index}}
+
+def test_buffered_events_are_written_in_batches():
+    """Non-durable events wait in the queue and are written with multi-row inserts"""
+    session_factory, Session = make_session_factory()
+    sink = AuditSink(session_factory, batch_size=150, flush_interval=60)
+    for index in range(300):
+        sink.submit(row(index))
+    sink.flush()
+
+    db = Session()
+    assert db.query(AuditLog).count() == 300
+    assert db.query(AuditLog).filter(AuditLog.entity_id == 299).one().details_json == {"index": 299}
+    db.close()
+    assert sink.stats()["written"] == 300 and sink.stats()["batches"] == 2
+
+def test_pii_access_is_durable():
+    """In pii mode a PII read is committed before log_pii_access returns; other events are buffered"""
+    session_factory, Session = make_session_factory()
+    service = AuditService(AuditSink(session_factory, flush_interval=60), durability="pii")
+    asyncio.run(service.log_action(actor="authority1", action="advanced_search", entity="search", entity_id=0))
+    asyncio.run(service.log_pii_access(actor="authority1", user_id=7, access_type="read"))
+
+    db = Session()
+    assert db.query(AuditLog.entity_id).filter(AuditLog.entity == "user_pii").all() == [(7,)]
+    db.close()
+
+def test_durable_event_raises_when_write_fails():
+    """A durable event that cannot be stored is reported to the caller"""
+    @contextmanager
+    def failing_session_factory():
+        raise RuntimeError("database unavailable")
+        yield
+
+    sink = AuditSink(failing_session_factory, flush_interval=60)
+    with pytest.raises(AuditWriteError):
+        sink.submit(row(1), durable=True)
+    assert sink.stats()["failed"] == 1
+
+def test_full_queue_is_written_by_caller_without_waiting():
+    """Events that do not fit in the queue are written at once instead of waiting for space"""
+    session_factory, Session = make_session_factory()
+    sink = AuditSink(session_factory, maxsize=2, flush_interval=60)
+    started = time.monotonic()
+    sink.submit_many([row(index) for index in range(5)])
+    assert time.monotonic() - started < 1.0
+    assert sink.stats()["overflow"] == 3
+
+    db = Session()
+    assert db.query(AuditLog).count() == 3
+    db.close()
+    sink.flush()
+    assert sink.stats()["written"] == 5
+
+def test_durable_wait_does_not_block_event_loop():
+    """An async handler awaiting a durable event lets other coroutines run while the batch commits"""
+    session_factory, Session = make_session_factory()
+
+    @contextmanager
+    def slow_session_factory():
+        time.sleep(0.3)
+        with session_factory() as db:
+            yield db
+
+    service = AuditService(AuditSink(slow_session_factory, flush_interval=60), durability="pii")
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        await service.log_pii_access(actor="authority1", user_id=7, access_type="read")
+        task.cancel()
+        return ticks
+
+    assert asyncio.run(scenario()) >= 10
+    db = Session()
+    assert db.query(AuditLog.entity_id).all() == [(7,)]
+    db.close()
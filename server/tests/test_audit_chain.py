@@ -0,0 +1,122 @@
+"""
+Tests for the tamper-evident audit hash chain
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.exc import DatabaseError
+from sqlalchemy.orm import sessionmaker
+
+from db import AuditBase, create_audit_triggers, migrate_audit_logs
+from models import AuditLog, AuditCheckpoint
+from services.audit_chain import AuditChain, verify_merkle_proof
+
+def make_chain(events: int, checkpoint_size: int = 8):
+    engine = create_engine("sqlite://")
+    AuditBase.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    chain = AuditChain(checkpoint_size=checkpoint_size)
+    start = datetime(2025, 1, 1)
+    rows = [
+        {"actor": f"authority{index % 3}", "action": "read", "entity": "user_pii", "entity_id": index,
+         "ts": start + timedelta(hours=index), "details_json": {"pii_revealed": index % 2 == 0}}
+        for index in range(events)
+    ]
+    for offset in range(0, events, 5):
+        chain.append(db, rows[offset:offset + 5])
+        db.commit()
+    return db, chain
+
+def test_chain_verifies_and_checkpoints_complete_blocks():
+    """Appended records chain from the genesis hash and every full block is checkpointed"""
+    db, chain = make_chain(20)
+    assert db.query(AuditCheckpoint).count() == 2
+
+    result = chain.verify(db)
+    assert result["ok"] and result["records"] == 20 and result["checkpoints"] == 2
+
+    ranged = chain.verify_time_range(db, since=datetime(2025, 1, 1, 10), until=datetime(2025, 1, 1, 11))
+    assert ranged["ok"] and (ranged["first_id"], ranged["last_id"]) == (9, 16)
+    db.close()
+
+def test_edited_record_is_detected():
+    """Changing a stored record breaks verification at that record"""
+    db, chain = make_chain(20)
+    db.execute(text("UPDATE audit_logs SET actor = 'someone else' WHERE id = 12"))
+    db.commit()
+
+    result = chain.verify(db)
+    assert not result["ok"] and result["failed_id"] == 12
+    assert chain.verify(db, first_id=1, last_id=8)["ok"]
+    db.close()
+
+def test_inclusion_proof_checks_against_checkpoint_root():
+    """A Merkle path ties a record hash to its checkpoint root"""
+    db, chain = make_chain(20)
+    proof = chain.inclusion_proof(db, 11)
+    assert verify_merkle_proof(proof["record_hash"], proof["proof"], proof["merkle_root"])
+    assert not verify_merkle_proof("0" * 64, proof["proof"], proof["merkle_root"])
+    assert chain.inclusion_proof(db, 19) is None  # Last block not complete yet
+    db.close()
+
+def test_backfill_chains_records_written_before_hashing():
+    """Records without hashes are chained in id order and then verify"""
+    db, chain = make_chain(0)
+    for index in range(1, 4):
+        db.add(AuditLog(id=index, actor="legacy", action="read", entity="user_pii", entity_id=index,
+                        ts=datetime(2024, 1, index), details_json={}))
+    db.commit()
+    assert chain.backfill(db) == 3
+    db.commit()
+    chain.append(db, [{"actor": "new", "action": "read", "entity": "user_pii", "entity_id": 9,
+                       "ts": datetime(2025, 1, 1), "details_json": {}}])
+    db.commit()
+    assert chain.verify(db)["records"] == 4 and chain.verify(db)["ok"]
+    db.close()
+
+def test_unchained_rows_may_only_gain_hashes():
+    """Before it is hashed a record may have its hashes set, but no other column changed"""
+    engine = create_engine("sqlite://")
+    AuditBase.metadata.create_all(bind=engine)
+    create_audit_triggers(engine)
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO audit_logs (id, actor, action, entity, entity_id, ts, details_json) "
+            "VALUES (1, 'legacy', 'read', 'user_pii', 5, '2024-01-01 00:00:00', '{}')"
+        ))
+    for change in ("actor = 'someone else'", "entity_id = 6", "details_json = '{\"x\": 1}'", "id = 2"):
+        with pytest.raises(DatabaseError, match="append-only"), engine.begin() as conn:
+            conn.execute(text(f"UPDATE audit_logs SET {change} WHERE id = 1"))
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE audit_logs SET prev_hash = 'a', hash = 'b' WHERE id = 1"))
+    with pytest.raises(DatabaseError, match="append-only"), engine.begin() as conn:
+        conn.execute(text("UPDATE audit_logs SET hash = 'c' WHERE id = 1"))
+
+def test_migration_skips_only_identical_copies():
+    """A row already copied is skipped; a different event with the same id, actor and ts is kept"""
+    source, target = create_engine("sqlite://"), create_engine("sqlite://")
+    for bind in (source, target):
+        AuditBase.metadata.create_all(bind=bind)
+    ts = datetime(2024, 1, 1)
+    event = {"actor": "authority1", "entity": "user_pii", "entity_id": 5, "ts": ts}
+    with source.begin() as conn:
+        conn.execute(AuditLog.__table__.insert(), [
+            {"id": 1, "action": "read", "details_json": {"n": 1}, **event},
+            {"id": 2, "action": "reveal", "details_json": {"n": 2}, **event},
+            {"id": 3, "action": "read", "details_json": {"n": 3}, **event}
+        ])
+    with target.begin() as conn:
+        conn.execute(AuditLog.__table__.insert(), [
+            {"id": 1, "action": "read", "details_json": {"n": 1}, **event},
+            {"id": 2, "action": "read", "details_json": {"n": 2}, **event}
+        ])
+
+    migrate_audit_logs(source_bind=source, target_bind=target)
+
+    assert not inspect(source).has_table("audit_logs")
+    with target.connect() as conn:
+        rows = conn.execute(text("SELECT id, action, details_json FROM audit_logs ORDER BY id")).all()
+    assert [(row.id, row.action, row.details_json) for row in rows] == [
+        (1, "read", '{"n": 1}'), (2, "read", '{"n": 2}'), (3, "read", '{"n": 3}'), (4, "reveal", '{"n": 2}')
+    ]
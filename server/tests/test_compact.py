@@ -0,0 +1,19 @@
+"""
+Tests for the compact search result format
+"""
+from services.compact import build_compact_results
+
+def test_compact_results_round_trip():
+    """Dictionary-encoded columns decode back to the original rows"""
+    rows = [
+        (1, 60.1234567, 24.9876543, 71.26, "available", "immediate", "bachelor"),
+        (2, 61.5, 23.75, None, "allocated", "immediate", "bachelor")
+    ]
+    compact = build_compact_results(rows)
+
+    assert compact.user_ids == [1, 2]
+    assert compact.lats == [60.12346, 61.5] and compact.lons == [24.98765, 23.75]
+    assert compact.scores == [71.3, 0.0]
+    assert compact.availability_values == ["immediate"] and compact.availabilities == [0, 0]
+    assert [compact.status_values[code] for code in compact.statuses] == ["available", "allocated"]
+    assert compact.education_values == ["bachelor"] and compact.education_levels == [0, 0]
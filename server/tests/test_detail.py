@@ -0,0 +1,47 @@
+"""
+Tests for the civilian detail endpoint
+"""
+from datetime import datetime
+
+from sqlalchemy import event
+
+from db import get_audit_session
+from models import User, Profile, Resource, Allocation, AuditLog
+
+AUTHORITY = {"X-Demo-User": "authority1", "X-Role": "authority"}
+
+def pii_reads(user_id):
+    with get_audit_session() as audit_db:
+        return audit_db.query(AuditLog).filter(AuditLog.entity == "user_pii", AuditLog.entity_id == user_id).count()
+
+def test_detail_reveals_pii_only_for_active_allocation(memory_engine, db, client):
+    """Detail returns resources and reveals PII once an allocation is active, in one query"""
+    for user_id in (1, 2):
+        db.add(User(id=user_id, national_id_hash=f"hash-{user_id}", full_name=f"Civilian {user_id}",
+                    dob=datetime(1990, 1, 1), address="Testikatu 1", lat=60.17, lon=24.94))
+        db.add(Profile(user_id=user_id, education_level="bachelors", skills=["welding"], availability="immediate",
+                       capability_score=50.0, tags_json=[], status="available"))
+    db.add(Resource(id=1, user_id=1, category="power", subtype="generator", quantity=1, specs_json={"kw": 5}))
+    db.add(Allocation(user_id=1, resource_id=1, mission_code="M-1", status="active"))
+    db.add(Allocation(user_id=2, mission_code="M-2", status="completed"))
+    db.commit()
+
+    selects = []
+    event.listen(memory_engine, "before_cursor_execute",
+                 lambda conn, cursor, statement, *args: selects.append(statement) if statement.startswith("SELECT") else None)
+
+    # The audit sink writes to the scratch audit database, created on startup
+    reads_before = pii_reads(1)
+    allocated = client.get("/search/detail/1", headers=AUTHORITY).json()
+    assert len(selects) == 1
+    # PII reads are audited durably: the event is committed before the response
+    assert pii_reads(1) == reads_before + 1
+    not_allocated = client.get("/search/detail/2", headers=AUTHORITY).json()
+    missing = client.get("/search/detail/3", headers=AUTHORITY)
+
+    assert allocated["pii_revealed"] is True and allocated["user"]["full_name"] == "Civilian 1"
+    assert allocated["resources"] == [{"id": 1, "category": "power", "subtype": "generator", "quantity": 1,
+                                       "specs": {"kw": 5}, "available": True}]
+    assert not_allocated["pii_revealed"] is False and not_allocated["user"]["full_name"] is None
+    assert not_allocated["resources"] == []
+    assert missing.status_code == 404
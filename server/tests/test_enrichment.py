@@ -0,0 +1,81 @@
+"""
+Tests for background LLM enrichment of submitted profiles
+"""
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy.orm import sessionmaker
+
+from models import User, Profile, Resource
+from services.tagger import tagger
+from services.enrichment import EnrichmentQueue
+
+def committing_session_factory(engine):
+    SessionLocal = sessionmaker(bind=engine)
+
+    @contextmanager
+    def session_factory():
+        db = SessionLocal()
+        try:
+            yield db
+            db.commit()
+        finally:
+            db.close()
+    return session_factory
+
+def test_enrichment_patches_tags_and_score(monkeypatch, memory_engine):
+    """A queued profile gets the extracted tags and LLM bonus written back"""
+    session_factory = committing_session_factory(memory_engine)
+
+    free_text = "Volunteer radio operator with long range antennas"
+    tags, score = tagger.generate_tags_and_score("bachelors", ["Radio"], free_text, "available", use_llm=False)
+    with session_factory() as db:
+        user = User(national_id_hash="enrichment-test", full_name="Test", dob=datetime(1990, 1, 1),
+                    address="Testikatu 1", lat=60.17, lon=24.94)
+        db.add(user)
+        db.flush()
+        db.add(Profile(user_id=user.id, education_level="bachelors", skills=["Radio"], free_text=free_text,
+                       availability="available", capability_score=score, tags_json=tags, status="available"))
+        user_id = user.id
+
+    monkeypatch.setattr(tagger.llm_tagger, "extract_tags", lambda text, context: ["ham_radio", "antennas"])
+    enrichment = EnrichmentQueue(workers=1, session_factory=session_factory)
+    assert enrichment.enqueue(user_id)
+    enrichment.join()
+
+    with session_factory() as db:
+        profile = db.query(Profile).filter(Profile.user_id == user_id).one()
+        assert {"ham_radio", "antennas"} <= set(profile.tags_json)
+        assert profile.capability_score >= score
+
+    stats = enrichment.stats()
+    assert stats["queue_depth"] == 0
+    assert stats["processed"] == 1 and stats["updated"] == 1 and stats["failed"] == 0
+
+def test_enrichment_with_stale_features_keeps_resources(monkeypatch, memory_engine):
+    """Features rebuilt during enrichment include the civilian's resources"""
+    session_factory = committing_session_factory(memory_engine)
+    free_text = "Volunteer radio operator"
+    resources = [{"category": "power", "subtype": "generator", "quantity": 1, "specs": {}}]
+    tags, score = tagger.generate_tags_and_score("bachelors", ["Radio"], free_text, "available",
+                                                 resources=resources, use_llm=False)
+    with session_factory() as db:
+        db.add(User(id=1, national_id_hash="enrichment-stale", full_name="Test", dob=datetime(1990, 1, 1),
+                    address="Testikatu 1", lat=60.17, lon=24.94))
+        # Submitted before features were stored
+        db.add(Profile(user_id=1, education_level="bachelors", skills=["Radio"], free_text=free_text,
+                       availability="available", capability_score=score, tags_json=tags, features_json=None,
+                       status="available"))
+        db.add(Resource(user_id=1, category="power", subtype="generator", quantity=1))
+
+    monkeypatch.setattr(tagger.llm_tagger, "extract_tags", lambda text, context: ["antennas"])
+    enrichment = EnrichmentQueue(workers=1, session_factory=session_factory)
+    assert enrichment.enqueue(1)
+    enrichment.join()
+
+    with session_factory() as db:
+        profile = db.query(Profile).filter(Profile.user_id == 1).one()
+        assert "power.generator" in profile.tags_json and "antennas" in profile.tags_json
+        assert profile.capability_score >= score
+        assert tagger.features_current(profile.features_json)
+        assert profile.features_json["resource_tags"] == ["power.generator"]
@@ -0,0 +1,52 @@
+"""
+Tests for profile features persisted at submit and used by search scoring
+"""
+from datetime import datetime
+
+from models import User, Profile
+from schemas import AdvancedSearchRequest
+from services.tagger import tagger
+from routers.search import _rank_candidates
+
+def test_submit_stores_current_features(db, client):
+    """Submitting a profile stores the features built with the loaded rules"""
+    response = client.post("/civilian/submit", headers={"X-Demo-User": "civilian1", "X-Role": "civilian"}, json={
+        "submission_id": "features-1",
+        "education_level": "bachelors",
+        "skills": ["Drone Piloting", "First Aid"],
+        "availability": "available",
+        "consent": True
+    })
+
+    assert response.status_code == 200
+    profile = db.query(Profile).one()
+    assert tagger.features_current(profile.features_json)
+    assert profile.features_json == tagger.build_features("bachelors", profile.skills, "")
+
+def test_stale_features_fall_back_to_raw_text(db):
+    """Profiles featurised under other rules are scored from their raw skills and free text"""
+    current = tagger.build_features("bachelors", ["Welding"], "")
+    stale = {**current, "rules_version": "outdated"}
+    for user_id, skills, features in (
+        (1, ["Welding"], current),
+        (2, ["Welding"], stale),
+        # Stored text mentions welding, the raw profile does not
+        (3, ["Cooking"], {**stale, "text": "bachelors welding"})
+    ):
+        db.add(User(id=user_id, national_id_hash=f"hash-{user_id}", full_name=f"Civilian {user_id}",
+                    dob=datetime(1990, 1, 1), address="Testikatu 1", lat=60.17, lon=24.94))
+        db.add(Profile(user_id=user_id, education_level="bachelors", skills=skills, availability="available",
+                       capability_score=0.0, tags_json=[], features_json=features, status="available"))
+    db.commit()
+
+    request = AdvancedSearchRequest(skills=["welding"])
+    query = db.query(User, Profile).join(Profile, User.id == Profile.user_id)
+    ids, _, scores = _rank_candidates(query, request, None, "capability", True)
+    by_id = dict(zip(ids.tolist(), scores.tolist()))
+
+    expected = tagger.score_batch([
+        {"education_level": "bachelors", "availability": "available", "tags": [], "skills": skills}
+        for skills in (["Welding"], ["Welding"], ["Cooking"])
+    ], search_query="welding", skills_query=["welding"])
+    assert [by_id[1], by_id[2], by_id[3]] == expected.tolist()
+    assert by_id[1] == by_id[2] > by_id[3]
@@ -0,0 +1,71 @@
+"""
+Tests for the FTS5 profile full-text index
+"""
+from datetime import datetime
+
+from db import create_fulltext_index
+from models import User, Profile
+from services.fulltext import build_match_query, fulltext_available, search_profiles
+
+def test_match_query_uses_prefix_phrases():
+    """Each term becomes a prefix phrase; Finnish letters and hyphens are kept"""
+    assert build_match_query(["Drone", "first aid", "ensiapu-kurssi", "Sähkö!"]) == (
+        '"drone" * OR "first aid" * OR "ensiapu-kurssi" * OR "sähkö" *'
+    )
+    assert build_match_query(["  ", "!!"]) == ""
+
+def test_search_profiles_ranks_prefix_matches(memory_engine, db):
+    """The shipped index finds prefix matches, ranks skills higher and follows profile writes"""
+    # Profiles written before the index exists are picked up by its rebuild
+    db.add(User(id=1, national_id_hash="hash-1", full_name="Civilian 1", dob=datetime(1990, 1, 1),
+                address="Testikatu 1", lat=60.17, lon=24.94))
+    db.add(Profile(user_id=1, education_level="bachelor", skills=[], free_text="Flies drones on weekends",
+                   availability="available"))
+    db.commit()
+    create_fulltext_index(bind=memory_engine)
+
+    # Later writes reach the index through the triggers
+    for user_id, skills, free_text in ((2, ["drone pilot"], "Nurse"), (3, [], "Sähköasentaja"),
+                                       (4, [], "Kävi ensiapu-kurssin"), (5, [], "Drone builder")):
+        db.add(User(id=user_id, national_id_hash=f"hash-{user_id}", full_name=f"Civilian {user_id}",
+                    dob=datetime(1990, 1, 1), address="Testikatu 1", lat=60.17, lon=24.94))
+        db.add(Profile(user_id=user_id, education_level="vocational", skills=skills, free_text=free_text,
+                       availability="available"))
+    db.commit()
+    db.query(Profile).filter(Profile.user_id == 5).delete()
+    db.query(Profile).filter(Profile.user_id == 3).update({Profile.free_text: "Sähkömies"})
+    db.commit()
+
+    ranks = search_profiles(db, ["drone"])
+    assert set(ranks) == {1, 2}
+    assert ranks[2] > ranks[1] > 0
+    assert set(search_profiles(db, ["sähkömi"])) == {3}
+    assert search_profiles(db, ["sähköasentaja"]) == {}
+    # Hyphens are token characters: the compound is one token, not "ensiapu" + "kurssin"
+    assert set(search_profiles(db, ["ensiapu-kurssi"])) == {4}
+    assert search_profiles(db, ["kurssin"]) == {}
+
+def test_lost_triggers_are_recreated_and_index_rebuilt(memory_engine, db):
+    """Recreating profiles drops its triggers; the next startup restores them and reindexes"""
+    assert not fulltext_available(db)
+    create_fulltext_index(bind=memory_engine)
+    assert fulltext_available(db)
+
+    # As a drop_all/create_all of the tables does: profiles_fts survives, its triggers do not
+    Profile.__table__.drop(bind=memory_engine)
+    Profile.__table__.create(bind=memory_engine)
+    db.add(User(id=1, national_id_hash="hash-1", full_name="Civilian 1", dob=datetime(1990, 1, 1),
+                address="Testikatu 1", lat=60.17, lon=24.94))
+    db.add(Profile(user_id=1, education_level="vocational", skills=["welding"], free_text="Drone builder",
+                   availability="available"))
+    db.commit()
+    assert search_profiles(db, ["drone"]) == {}
+
+    create_fulltext_index(bind=memory_engine)
+    assert set(search_profiles(db, ["drone"])) == {1}
+    db.add(User(id=2, national_id_hash="hash-2", full_name="Civilian 2", dob=datetime(1990, 1, 1),
+                address="Testikatu 1", lat=60.17, lon=24.94))
+    db.add(Profile(user_id=2, education_level="vocational", skills=[], free_text="Drone pilot",
+                   availability="available"))
+    db.commit()
+    assert set(search_profiles(db, ["drone"])) == {1, 2}
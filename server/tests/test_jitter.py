@@ -0,0 +1,38 @@
+"""
+Tests for privacy location offsets
+"""
+import hashlib
+
+from services.jitter import LocationJitter
+
+def test_default_offsets_match_md5_scheme():
+    """Without a secret, approximate locations stay where the MD5-of-id scheme put them"""
+    jitter = LocationJitter(secret="")
+    user_ids = [3, 7, 3, 2050]
+    lats, lons = jitter.approximate(user_ids, [60.0, 61.0, 60.0, 62.0], [24.0, 25.0, 24.0, 26.0])
+
+    for user_id, lat, base in zip(user_ids, lats, [60.0, 61.0, 60.0, 62.0]):
+        user_hash = hashlib.md5(str(user_id).encode()).hexdigest()
+        assert lat == base + (int(user_hash[:4], 16) / 65535.0 - 0.5) * 0.02
+    assert all(abs(lon - base) <= 0.01 for lon, base in zip(lons, [24.0, 25.0, 24.0, 26.0]))
+
+def test_rotate_key_moves_offsets():
+    """A keyed offset differs from the MD5 one and changes again when the key rotates"""
+    jitter = LocationJitter(secret="")
+    plain = jitter.approximate([42], [60.0], [24.0])
+    jitter.rotate_key("first-secret")
+    keyed = jitter.approximate([42], [60.0], [24.0])
+    assert keyed != plain and keyed == jitter.approximate([42], [60.0], [24.0])
+    jitter.rotate_key("second-secret")
+    assert jitter.approximate([42], [60.0], [24.0]) != keyed
+    jitter.rotate_key(None)
+    assert jitter.approximate([42], [60.0], [24.0]) == plain
+
+def test_cache_holds_only_ids_seen():
+    """Large or sparse ids cost one cache entry each, however far apart they are"""
+    jitter = LocationJitter(secret="")
+    lats, _ = jitter.approximate([5, 2_000_000_000, 5], [60.0, 61.0, 60.0], [24.0, 25.0, 24.0])
+    assert sorted(jitter._offsets) == [5, 2_000_000_000]
+    assert lats[0] == lats[2] and abs(lats[1] - 61.0) <= 0.01
+    jitter.clear()
+    assert jitter._offsets == {}
@@ -0,0 +1,27 @@
+"""
+Tests for the compiled keyword matcher used by the tagger
+"""
+from services.keyword_matcher import KeywordMatcher
+from services.tagger import tagger
+
+def test_matcher_finds_overlapping_keywords():
+    """Keywords nested inside or overlapping other keywords are all reported"""
+    matcher = KeywordMatcher(["tele", "television", "vision", "radio", "ion"])
+
+    assert matcher.find("local television and radio") == {"tele", "television", "vision", "ion", "radio"}
+    assert matcher.find("telegraph") == {"tele"}
+    assert matcher.find("nothing here") == set()
+
+def test_tagging_matches_substring_semantics():
+    """Compiled rules tag the same categories as per-keyword substring checks"""
+    text = "Paramedic and drone pilot, sähkötyö and generaattori maintenance"
+    tags, _ = tagger.generate_tags_and_score("bachelors", ["First Aid"], text, "available")
+
+    lowered = " ".join(["bachelors", "first aid", text.lower()])
+    expected = [
+        category for category, config in tagger.rules["categories"].items()
+        if any(keyword.lower() in lowered
+               for language in ("en", "fi")
+               for keyword in config["keywords"].get(language, []))
+    ]
+    assert tags[:len(expected)] == expected
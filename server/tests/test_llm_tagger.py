@@ -0,0 +1,157 @@
+"""
+Tests for the LLM tagger circuit breaker and batch extraction
+"""
+import asyncio
+
+import requests
+
+from services.llm_tagger import LLMTaggerService, CircuitBreaker
+from services.llm_cache import LLMResultCache
+
+class FakeResponse:
+    status_code = 200
+
+    def json(self):
+        return {"models": [{"name": "phi3:mini"}]}
+
+def test_down_host_is_probed_once_then_skipped(monkeypatch, tmp_path):
+    """A failed probe opens the circuit so later extractions go straight to regex"""
+    calls = []
+
+    def refuse(url, timeout):
+        calls.append(url)
+        raise requests.ConnectionError("refused")
+
+    monkeypatch.setattr(requests, "get", refuse)
+    llm = LLMTaggerService(ollama_url="http://ollama.invalid", cache=LLMResultCache(str(tmp_path / "llm_cache.db")))
+
+    for _ in range(5):
+        assert "medical" in llm.extract_tags("Experienced nurse trained in first aid")
+    assert len(calls) == 1
+    assert llm.breaker.state == CircuitBreaker.OPEN
+
+    # After the backoff a single half-open probe closes the circuit again
+    monkeypatch.setattr(requests, "get", lambda url, timeout: calls.append(url) or FakeResponse())
+    llm.breaker.open_until = 0.0
+    assert llm.is_ollama_available()
+    assert llm.ensure_model_available()
+    assert llm.breaker.state == CircuitBreaker.CLOSED
+    assert llm.is_ollama_available()
+    assert len(calls) == 2
+
+def test_backoff_grows_exponentially():
+    """Each failed re-probe doubles the open interval up to the cap"""
+    breaker = CircuitBreaker(base_backoff=1.0, max_backoff=4.0)
+    intervals = []
+    for _ in range(4):
+        breaker.record_failure()
+        intervals.append(round(breaker.status()["retry_in_seconds"]))
+        # The backoff expires and a half-open probe fails again
+        breaker.open_until = 0.0
+        assert breaker.before_call() == "probe"
+    assert intervals == [1, 2, 4, 4]
+    assert breaker.before_call() is None
+
+def test_concurrent_failures_count_as_one_outage():
+    """Calls already in flight when the circuit opens do not escalate the backoff"""
+    breaker = CircuitBreaker(base_backoff=1.0, max_backoff=60.0)
+    for _ in range(10):
+        breaker.record_failure()
+    status = breaker.status()
+    assert status["consecutive_failures"] == 1
+    assert round(status["retry_in_seconds"]) == 1
+
+def test_batch_extraction_packs_profiles_and_refills_gaps(monkeypatch, tmp_path):
+    """Packed prompts are parsed per profile; omitted profiles get their own prompt"""
+    llm = LLMTaggerService(ollama_url="http://ollama.invalid", cache=LLMResultCache(str(tmp_path / "llm_cache.db")))
+    prompts = []
+
+    async def probe(client):
+        prompts.append("probe")
+        llm.model_present = True
+        llm.breaker.record_success()
+        return True
+
+    def blocking_probe():
+        raise AssertionError("blocking health probe on the event loop")
+
+    monkeypatch.setattr(llm, "_aprobe", probe)
+    monkeypatch.setattr(llm, "_probe", blocking_probe)
+
+    async def generate(client, prompt):
+        prompts.append(prompt)
+        if "Profile 1:" in prompt:
+            return '{"1": ["Drone Pilot"], "3": ["medical"]}'  # Profile 2 left out
+        return '["electrical"]'
+
+    monkeypatch.setattr(llm, "_agenerate", generate)
+    items = [
+        ("Flies FPV drones for the volunteer fire brigade", None),
+        ("Licensed electrician maintaining backup generators", {"skills": ["Electrical"]}),
+        ("Nurse at the regional hospital emergency ward", None),
+        ("short", None)
+    ]
+    results = asyncio.run(llm.extract_tags_batch(items, concurrency=2, batch_size=3))
+
+    assert results == [["drone_pilot"], ["electrical"], ["medical"], []]
+    # One async health probe on the pooled client, then the packed and the refill prompt
+    assert prompts[0] == "probe" and len(prompts) == 3
+
+    # Re-tagging unchanged text (modulo case and whitespace) skips the model
+    items[0] = ("flies FPV drones for the  volunteer fire brigade ", None)
+    assert asyncio.run(llm.extract_tags_batch(items, concurrency=2, batch_size=3)) == results
+    assert len(prompts) == 3
+    assert llm.cache.stats()["hits"] == 3
+
+def test_batch_extraction_falls_back_on_empty_answer(monkeypatch, tmp_path):
+    """A model answer with no valid tags gets regex tags, as in single-profile extraction"""
+    llm = LLMTaggerService(ollama_url="http://ollama.invalid", cache=LLMResultCache(str(tmp_path / "llm_cache.db")))
+
+    async def probe(client):
+        llm.model_present = True
+        llm.breaker.record_success()
+        return True
+
+    async def generate(client, prompt):
+        return '["!!!"]'  # Nothing survives validation
+
+    monkeypatch.setattr(llm, "_aprobe", probe)
+    monkeypatch.setattr(llm, "_agenerate", generate)
+    text = "Licensed electrician maintaining backup generators"
+    results = asyncio.run(llm.extract_tags_batch([(text, None), ("Exactly 10", None)], batch_size=1))
+
+    assert results[0] == llm.extract_tags_with_regex(text) and results[0]
+    assert results[1] == llm.extract_tags_with_regex("Exactly 10")
+    assert llm.cache.stats()["entries"] == 0
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    """Entries past max_entries are evicted oldest-use first and survive reopening"""
+    path = str(tmp_path / "llm_cache.db")
+    cache = LLMResultCache(path, max_entries=2, touch_interval=0)
+    cache.set("a", ["x"], "phi3:mini")
+    cache.set("b", ["y"], "phi3:mini")
+    assert cache.get("a") == ["x"]  # "b" is now least recently used
+    cache.set("c", ["z"], "phi3:mini")
+
+    reopened = LLMResultCache(path, max_entries=2)
+    assert reopened.get("b") is None
+    assert reopened.get("a") == ["x"] and reopened.get("c") == ["z"]
+    stats = reopened.stats()
+    assert stats["entries"] == 2 and stats["hit_rate"] == round(2 / 3, 3)
+
+def test_cache_batch_lookup_reads_once_and_touches_rarely(tmp_path):
+    """get_many answers many keys with one SELECT and skips last_used writes for recently used entries"""
+    cache = LLMResultCache(str(tmp_path / "llm_cache.db"), touch_interval=300)
+    cache.set_many({"a": ["x"], "b": ["y"], "c": ["z"]}, "phi3:mini")
+    statements = []
+    cache._conn.set_trace_callback(statements.append)
+
+    assert cache.get_many(["a", "b", "missing", "a"]) == {"a": ["x"], "b": ["y"]}
+    assert [statement.split()[0] for statement in statements] == ["SELECT"]
+    assert cache.stats()["hits"] == 3 and cache.stats()["misses"] == 1
+
+    cache.touch_interval = 0
+    statements.clear()
+    cache.get_many(["a", "b"])
+    assert sum(statement.startswith("UPDATE") for statement in statements) == 2
+    assert sum(statement == "COMMIT" for statement in statements) == 1
@@ -0,0 +1,46 @@
+"""
+Tests for the tag/skill posting-list index
+"""
+from services.posting_index import PostingIndex, intersect_sorted
+
+def make_index():
+    """Create an index that accepts updates without a database"""
+    index = PostingIndex()
+    index._loaded = True
+    return index
+
+def test_intersect_sorted():
+    """AND of posting lists keeps only IDs present in every list"""
+    assert intersect_sorted([[1, 3, 5, 7, 9], [3, 4, 5, 9], [0, 3, 9, 12]]) == [3, 9]
+    assert intersect_sorted([[1, 2], []]) == []
+
+def test_tag_and_skill_lookups_follow_updates():
+    """Postings reflect resubmitted profiles and match like the old LIKE filters"""
+    index = make_index()
+    index.update(3, ["medical", "technical"], ["First Aid", "Welding"], "Paramedic on call")
+    index.update(1, ["medical"], ["Drone Piloting"], "FPV pilot trained in first aid")
+    index.update(2, ["technical"], ["Programming"], None)
+
+    assert index.all_of("tag", ["medical"]) == [1, 3]
+    assert index.all_of("tag", ["Medical", "technical"]) == [3]
+    assert index.any_of("tag", ["medical", "technical"]) == [1, 2, 3]
+    assert index.matching_skill_query("drone") == [1]
+    assert index.matching_skill_query("program") == [2]
+    assert index.matching_skill_query("first aid") == [1, 3]
+
+    index.update(3, ["logistics"], ["Truck Driving"], None)
+    assert index.all_of("tag", ["medical"]) == [1]
+    assert index.matching_skill_query("first aid") == [1]
+
+def test_multi_word_skill_query_matches_as_phrase():
+    """Free text must contain the query as written, not just its words in any order"""
+    index = make_index()
+    index.update(1, [], [], "Knows first aid basics")
+    index.update(2, [], [], "Provides aid at first light")
+    index.update(3, [], [], "Completed FIRST AIDER course")
+    index.update(4, [], [], "First  aid (spacing differs)")
+
+    assert index.matching_skill_query("first aid") == [1, 3]
+    assert index.matching_skill_query("aid at") == [2]
+    index.remove(1)
+    assert index.matching_skill_query("first aid") == [3]
@@ -0,0 +1,34 @@
+"""
+Tests for global search ranking and cursor pagination
+"""
+import numpy as np
+
+from services.ranking import top_k, rank_keys, encode_cursor, decode_cursor
+
+def test_top_k_matches_full_sort_with_ties():
+    """Top-k selection returns the same order as a full (key, id) sort"""
+    rng = np.random.default_rng(42)
+    ids = rng.permutation(1000).astype(np.int64) + 1
+    keys = -rng.integers(0, 20, size=1000).astype(np.float64)  # Many ties
+
+    expected = np.lexsort((ids, keys))
+    assert list(top_k(keys, ids, 50)) == list(expected[:50])
+
+def test_cursor_pages_cover_ranking_exactly_once():
+    """Walking with cursors yields every candidate once, in rank order"""
+    rng = np.random.default_rng(7)
+    ids = np.arange(1, 238, dtype=np.int64)
+    scores = rng.integers(0, 100, size=len(ids)).astype(np.float64)
+    distances = rng.uniform(0, 150, size=len(ids))
+    keys = rank_keys("combined", scores, distances)
+
+    walked = []
+    after = None
+    while True:
+        page = top_k(keys, ids, 25, after=after)
+        if len(page) == 0:
+            break
+        walked.extend(page)
+        after = decode_cursor(encode_cursor(keys[page[-1]], ids[page[-1]]))
+
+    assert walked == list(np.lexsort((ids, keys)))
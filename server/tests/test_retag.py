@@ -0,0 +1,52 @@
+"""
+Tests for re-tagging every profile through /admin/retag
+"""
+from datetime import datetime
+
+from sqlalchemy import event
+
+from models import User, Profile, StatsAggregate
+from routers import admin
+from services.tagger import tagger
+from services.aggregates import aggregates
+from services.posting_index import posting_index
+
+AUTHORITY = {"X-Demo-User": "authority1", "X-Role": "authority"}
+
+def test_retag_commits_in_batches(monkeypatch, memory_engine, db, client):
+    """Every profile is re-tagged, reading and committing RETAG_BATCH_SIZE profiles at a time"""
+    for user_id in range(1, 6):
+        db.add(User(id=user_id, national_id_hash=f"hash-{user_id}", full_name=f"Civilian {user_id}",
+                    dob=datetime(1990, 1, 1), address="Testikatu 1", lat=60.17, lon=24.94))
+        db.add(Profile(user_id=user_id, education_level="bachelors", skills=["First Aid"],
+                       free_text="Paramedic with drone experience", availability="available",
+                       capability_score=0.0, tags_json=[], status="available"))
+    db.commit()
+
+    aggregates.rebuild(db)
+    posting_index.ensure_loaded(db)
+    commits = []
+    event.listen(memory_engine, "commit", lambda conn: commits.append(1))
+    monkeypatch.setattr(admin, "RETAG_BATCH_SIZE", 2)
+    response = client.post("/admin/retag?use_llm=false", headers=AUTHORITY)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["profiles"] == 5 and body["updated"] == 5
+    assert len(commits) == 3
+
+    expected_tags, expected_score = tagger.generate_tags_and_score(
+        "bachelors", ["First Aid"], "Paramedic with drone experience", "available", use_llm=False
+    )
+    for profile in db.query(Profile):
+        assert profile.tags_json == expected_tags and profile.capability_score == expected_score
+        assert tagger.features_current(profile.features_json)
+
+    # Aggregates and postings were updated in place, batch by batch, and match a rebuild
+    incremental = {(row.dimension, row.key): (row.count, round(row.score_sum, 6))
+                   for row in db.query(StatsAggregate)}
+    aggregates.rebuild(db)
+    assert incremental == {(row.dimension, row.key): (row.count, round(row.score_sum, 6))
+                           for row in db.query(StatsAggregate)}
+    assert ("tag", expected_tags[0]) in incremental
+    assert posting_index.all_of("tag", expected_tags) == [1, 2, 3, 4, 5]
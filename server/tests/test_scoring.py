@@ -0,0 +1,48 @@
+"""
+Tests for vectorised query-relevant scoring
+"""
+import random
+
+from services.tagger import tagger
+from legacy_scoring import legacy_query_relevant_score
+
+def random_case(rng: random.Random):
+    """A candidate set and query drawn from the rule vocabulary, so most terms hit something"""
+    categories = [category for category in tagger.rules["categories"] if category != "general"]
+    keywords = [
+        keyword.lower()
+        for config in tagger.rules["categories"].values()
+        for language in ("en", "fi")
+        for keyword in config["keywords"].get(language, [])
+    ]
+    words = keywords + ["experienced", "certified", "volunteer", "med", "drone", "first aid"]
+    profiles = [
+        {
+            "education_level": rng.choice(list(tagger.rules["education_scores"]) + ["unknown"]),
+            "skills": rng.sample(words, rng.randint(0, 4)),
+            "free_text": " ".join(rng.choices(words, k=rng.randint(0, 12))),
+            "availability": rng.choice(["immediate", "24h", "48h", "unavailable"]),
+            "industry": rng.choice(list(tagger.rules.get("industries", {})) + [""]),
+            # Duplicate tags count once for the category bonus but per copy for tag matches
+            "tags": rng.choices(categories, k=rng.randint(0, 4)),
+        }
+        for _ in range(rng.randint(1, 30))
+    ]
+    query = {
+        "search_query": " ".join(rng.choices(words, k=rng.randint(0, 3))),
+        "skills_query": rng.sample(words, rng.randint(0, 2)),
+        "include_tags": rng.sample(categories, rng.randint(0, 2)),
+    }
+    return profiles, query
+
+def test_score_batch_matches_per_row_scorer():
+    """score_batch returns exactly the scores of the pre-batch per-row scorer, rounding included"""
+    rng = random.Random(2024)
+    compared = 0
+    for _ in range(300):
+        profiles, query = random_case(rng)
+        batch = tagger.score_batch(profiles, **query).tolist()
+        expected = [legacy_query_relevant_score(tagger.rules, profile, **query) for profile in profiles]
+        assert batch == expected, query
+        compared += len(profiles)
+    assert compared >= 3000
@@ -0,0 +1,42 @@
+"""
+Tests for the in-memory spatial grid index
+"""
+from services.spatial_index import SpatialIndex, haversine_km
+
+def make_index():
+    """Create an index that accepts upserts without a database"""
+    index = SpatialIndex()
+    index._loaded = True
+    return index
+
+def test_radius_query_uses_haversine_cutoff():
+    """Points in the corners of the bounding box must not be returned"""
+    index = make_index()
+    center_lat, center_lon = 60.1699, 24.9384
+    index.upsert(1, center_lat, center_lon)
+    index.upsert(2, center_lat + 0.05, center_lon)  # ~5.6 km north
+    # Corner of the 10 km bounding box, ~14 km away
+    index.upsert(3, center_lat + 0.09, center_lon + 0.18)
+
+    results = index.query_radius(center_lat, center_lon, 10)
+
+    assert set(results) == {1, 2}
+    assert results[1] == 0
+    assert abs(results[2] - haversine_km(center_lat, center_lon, center_lat + 0.05, center_lon)) < 1e-9
+
+def test_upsert_moves_and_status_filter():
+    """Moving a civilian re-files them in the new cell and statuses can be filtered"""
+    index = make_index()
+    index.upsert(1, 60.17, 24.94)
+    index.upsert(2, 60.18, 24.95, status="allocated")
+    index.upsert(1, 65.01, 25.47)  # Moved to Oulu
+
+    assert index.query_bbox(60.0, 24.0, 61.0, 26.0) == [2]
+    assert index.query_bbox(60.0, 24.0, 61.0, 26.0, statuses=["available"]) == []
+    assert index.query_radius(65.01, 25.47, 1) == {1: 0.0}
+
+    index.set_status(2, "available")
+    assert index.query_bbox(60.0, 24.0, 61.0, 26.0, statuses=["available"]) == [2]
+
+    index.remove(2)
+    assert len(index) == 1
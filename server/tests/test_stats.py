@@ -0,0 +1,68 @@
+"""
+Tests for the dashboard summary statistics
+"""
+import random
+from datetime import datetime
+
+from sqlalchemy import func
+
+from models import User, Profile
+from routers.stats import _live_summary, _summary_cache
+
+AUTHORITY = {"X-Demo-User": "authority1", "X-Role": "authority"}
+
+def per_status_summary(db):
+    """/stats/summary as it was computed before the grouped query: one count per value"""
+    return {
+        "total_civilians": db.query(Profile).count(),
+        "availability_breakdown": {
+            availability: db.query(Profile).filter(Profile.availability == availability).count()
+            for availability in ["immediate", "24h", "48h", "unavailable"]
+        },
+        "status_breakdown": {
+            status: db.query(Profile).filter(Profile.status == status).count()
+            for status in ["available", "requested", "allocated", "unavailable"]
+        },
+        "average_capability_score": round(db.query(func.avg(Profile.capability_score)).scalar() or 0, 1),
+        "education_breakdown": {
+            level: db.query(Profile).filter(Profile.education_level == level).count()
+            for level, in db.query(Profile.education_level).distinct()
+        }
+    }
+
+def test_summary_matches_per_status_counts_and_follows_writes(db, client):
+    """The grouped summary equals the per-value counts, and the cached answer changes with the data"""
+    rng = random.Random(15)
+    for user_id in range(1, 61):
+        db.add(User(id=user_id, national_id_hash=f"hash-{user_id}", full_name=f"Civilian {user_id}",
+                    dob=datetime(1990, 1, 1), address="Testikatu 1", lat=60.17, lon=24.94))
+        db.add(Profile(
+            user_id=user_id,
+            education_level=rng.choice(["basic", "vocational", "bachelors", "masters"]),
+            skills=[],
+            availability=rng.choice(["immediate", "24h", "48h", "unavailable", "available", "allocated"]),
+            # Unscored profiles are left out of the average, as AVG does
+            capability_score=rng.choice([None, rng.uniform(0, 100)]),
+            tags_json=[],
+            status=rng.choice(["available", "requested", "allocated", "unavailable"])
+        ))
+    db.commit()
+
+    assert _live_summary(db) == per_status_summary(db)
+
+    _summary_cache.clear()
+    try:
+        first = client.get("/stats/summary?live=true", headers=AUTHORITY).json()
+        assert first == per_status_summary(db)
+
+        available = db.query(Profile.user_id).filter(Profile.status == "available").first()[0]
+        allocated = client.post("/allocate/allocate", json={"user_id": available, "mission_code": "M-1"}, headers=AUTHORITY)
+        assert allocated.status_code == 200
+
+        # The allocation bumps the data version, so the cached summary is not served
+        second = client.get("/stats/summary?live=true", headers=AUTHORITY).json()
+        assert second == per_status_summary(db)
+        assert second["status_breakdown"]["allocated"] == first["status_breakdown"]["allocated"] + 1
+        assert client.get("/stats/summary", headers=AUTHORITY).json() == second
+    finally:
+        _summary_cache.clear()
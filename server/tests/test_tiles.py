@@ -0,0 +1,58 @@
+"""
+Tests for heatmap tile binning and the tile endpoint
+"""
+from datetime import datetime
+
+import numpy as np
+
+from models import User, Profile
+from routers.stats import _tile_cache
+from services.tiles import tile_bounds, bin_tile
+
+AUTHORITY = {"X-Demo-User": "authority1", "X-Role": "authority"}
+
+def test_tile_bounds_of_world_and_helsinki_tile():
+    """Tile bounds follow the slippy-map scheme"""
+    min_lat, min_lon, max_lat, max_lon = tile_bounds(0, 0, 0)
+    assert (min_lon, max_lon) == (-180.0, 180.0)
+    assert round(max_lat, 4) == 85.0511 and round(min_lat, 4) == -85.0511
+
+    min_lat, min_lon, max_lat, max_lon = tile_bounds(10, 582, 296)
+    assert min_lat < 60.17 < max_lat and min_lon < 24.94 < max_lon
+
+def test_bin_tile_counts_each_point_once():
+    """Points in a tile land in one cell; points outside or on the far edge are ignored"""
+    z, x, y = 10, 582, 296
+    min_lat, min_lon, max_lat, max_lon = tile_bounds(z, x, y)
+    lats = np.array([max_lat - 1e-6, max_lat - 1e-6, min_lat + 1e-6, 61.5, min_lat])
+    lons = np.array([min_lon + 1e-6, min_lon + 1e-6, max_lon - 1e-6, 24.9, min_lon])
+    weights = np.array([0.5, 0.25, 1.0, 1.0, 1.0])
+
+    cells, counts, weight_sums = bin_tile(lats, lons, weights, z, x, y, grid=16)
+    assert cells.tolist() == [0, 16 * 16 - 1]
+    assert counts.tolist() == [2, 1]
+    assert weight_sums.tolist() == [0.75, 1.0]
+
+def test_tile_endpoint_validates_and_follows_writes(db, client):
+    """Invalid tiles and grids are rejected; a cached tile is not served after an allocation"""
+    for user_id in (1, 2):
+        db.add(User(id=user_id, national_id_hash=f"hash-{user_id}", full_name=f"Civilian {user_id}",
+                    dob=datetime(1990, 1, 1), address="Testikatu 1", lat=60.17, lon=24.94))
+        db.add(Profile(user_id=user_id, education_level="bachelors", skills=[], availability="immediate",
+                       capability_score=50.0, tags_json=[], status="available"))
+    db.commit()
+    _tile_cache.clear()
+
+    for path in ("/stats/heatmap/23/0/0", "/stats/heatmap/-1/0/0", "/stats/heatmap/2/4/0",
+                 "/stats/heatmap/2/0/4", "/stats/heatmap/10/582/296?grid=10"):
+        assert client.get(path, headers=AUTHORITY).status_code == 400, path
+    assert client.get("/stats/heatmap/10/582/296?availability=soon", headers=AUTHORITY).status_code == 422
+
+    tile = client.get("/stats/heatmap/10/582/296?grid=16", headers=AUTHORITY).json()
+    assert tile["total"] == 2 and tile["counts"] == [2] and tile["weights"] == [1.0]
+    assert client.get("/stats/heatmap/10/582/297?grid=16", headers=AUTHORITY).json()["total"] == 0
+
+    allocated = client.post("/allocate/allocate", json={"user_id": 1, "mission_code": "M-1"}, headers=AUTHORITY)
+    assert allocated.status_code == 200
+    assert client.get("/stats/heatmap/10/582/296?grid=16", headers=AUTHORITY).json()["total"] == 1
+    _tile_cache.clear()